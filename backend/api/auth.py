@@ -0,0 +1,75 @@
+import json
+from utils import decode_token, display_name, issue_tokens, revoke_tokens, error_response, success_response
+
+REFRESH_USER_SQL = '''
+    SELECT u.is_admin, u.profile_created, EXTRACT(EPOCH FROM r.refresh_revoked_before),
+           u.profile_name, u.first_name
+    FROM users u
+    LEFT JOIN token_revocations r ON r.user_id = u.id
+    WHERE u.id = %(user_id)s
+'''
+
+# Отметка об обмене; пустой результат — токен с этим jti уже обменивался
+USE_REFRESH_TOKEN_SQL = '''
+    WITH expired AS (
+        DELETE FROM used_refresh_tokens WHERE user_id = %(user_id)s AND expires_at < NOW()
+    )
+    INSERT INTO used_refresh_tokens (jti, user_id, expires_at)
+    VALUES (%(jti)s, %(user_id)s, to_timestamp(%(exp)s))
+    ON CONFLICT (jti) DO NOTHING
+    RETURNING jti
+'''
+
+def handle_auth(event, cur, conn):
+    '''Обновление и отзыв токенов'''
+    method = event.get('httpMethod', 'GET')
+    action = event.get('queryStringParameters', {}).get('action', '')
+    
+    if method != 'POST':
+        return error_response(405, json.dumps({'error': 'Method not allowed'}))
+    
+    # refresh - обмен refresh-токена на новую пару с актуальными ролями
+    if action == 'refresh':
+        body = json.loads(event.get('body', '{}'))
+        payload = decode_token(body.get('refresh_token', ''), 'refresh')
+        if not payload:
+            return error_response(401, json.dumps({'error': 'Invalid refresh token'}))
+        
+        user_id = payload.get('user_id')
+        cur.execute(REFRESH_USER_SQL, {'user_id': user_id})
+        
+        user = cur.fetchone()
+        if not user:
+            return error_response(401, json.dumps({'error': 'User not found'}))
+        
+        if user[2] is not None and payload.get('iat', 0) < int(user[2]):
+            return error_response(401, json.dumps({'error': 'Token revoked'}))
+        
+        # Refresh-токен одноразовый: повторный обмен значит, что его копия у кого-то ещё,
+        # поэтому отзываются все токены пользователя и нужен новый вход
+        if not payload.get('jti'):
+            return error_response(401, json.dumps({'error': 'Invalid refresh token'}))
+        cur.execute(USE_REFRESH_TOKEN_SQL, {'jti': payload['jti'], 'user_id': user_id, 'exp': payload['exp']})
+        if cur.fetchone() is None:
+            revoke_tokens(cur, user_id, refresh=True)
+            conn.commit()
+            return error_response(401, json.dumps({'error': 'Refresh token already used'}))
+        
+        tokens = issue_tokens(user_id, user[0], user[1], display_name(user[3], user[4]))
+        conn.commit()
+        return success_response(tokens)
+    
+    # logout - отзыв всех токенов пользователя
+    elif action == 'logout':
+        headers = event.get('headers', {})
+        token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+        payload = decode_token(token or '')
+        if not payload:
+            return error_response(401, json.dumps({'error': 'Invalid token'}))
+        
+        revoke_tokens(cur, payload.get('user_id'), refresh=True)
+        conn.commit()
+        
+        return success_response({'success': True})
+    
+    return error_response(400, json.dumps({'error': 'Unknown action'}))
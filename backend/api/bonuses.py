@@ -1,5 +1,55 @@
 import json
-from utils import verify_token, check_admin, error_response, success_response
+from psycopg2.extras import execute_values
+from utils import decode_token, check_admin, error_response, success_response
+from session_bonuses import record_activation
+from profile_cache import invalidate_profile, invalidate_profiles
+
+BONUS_TYPES = ['documents', 'shield', 'privilege']
+MAX_BULK_GRANTS = 5000
+
+BONUSES_SQL = '''
+    SELECT bonus_documents, bonus_shield, bonus_privilege
+    FROM users WHERE id = %(user_id)s
+'''
+
+# {column} — одна из колонок bonus_<тип> из BONUS_TYPES, подставляется до выполнения
+GRANT_BONUS_SQL = '''
+    UPDATE users
+    SET {column} = {column} + %(amount)s
+    WHERE id = %(user_id)s
+    RETURNING bonus_documents, bonus_shield, bonus_privilege
+'''
+
+# Списание и активация одним запросом: условие > 0 исключает уход в минус при параллельных нажатиях
+ACTIVATE_BONUS_SQL = '''
+    WITH spent AS (
+        UPDATE users
+        SET {column} = {column} - 1
+        WHERE id = %(user_id)s AND {column} > 0
+        RETURNING id
+    )
+    INSERT INTO game_active_bonuses (session_id, user_id, bonus_type)
+    SELECT %(session_id)s, id, %(bonus_type)s FROM spent
+    ON CONFLICT (session_id, user_id)
+    DO UPDATE SET bonus_type = EXCLUDED.bonus_type
+    RETURNING id
+'''
+
+# Выдача списком: одна строка VALUES на пользователя с суммами по типам
+BULK_GRANT_SQL = '''
+    UPDATE users u
+    SET bonus_documents = u.bonus_documents + g.documents,
+        bonus_shield = u.bonus_shield + g.shield,
+        bonus_privilege = u.bonus_privilege + g.privilege
+    FROM (VALUES %s) AS g(user_id, documents, shield, privilege)
+    WHERE u.id = g.user_id
+    RETURNING u.id, u.bonus_documents, u.bonus_shield, u.bonus_privilege
+'''
+BULK_GRANT_TEMPLATE = '(%s::int, %s::int, %s::int, %s::int)'
+
+def is_positive_int(value):
+    '''bool — подкласс int в Python, поэтому True/False отсекаются отдельно'''
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
 
 def handle_bonuses(event, cur, conn):
     '''Обработка запросов к бонусам'''
@@ -10,7 +60,8 @@ def handle_bonuses(event, cur, conn):
     if not token:
         return error_response(401, json.dumps({'error': 'Missing auth token'}))
     
-    user_id = verify_token(token)
+    claims = decode_token(token)
+    user_id = claims.get('user_id') if claims else None
     if not user_id:
         return error_response(401, json.dumps({'error': 'Invalid token'}))
     
@@ -18,10 +69,7 @@ def handle_bonuses(event, cur, conn):
     if method == 'GET':
         target_id = event.get('queryStringParameters', {}).get('user_id', user_id)
         
-        cur.execute('''
-            SELECT bonus_documents, bonus_shield, bonus_privilege
-            FROM users WHERE id = %s
-        ''', (target_id,))
+        cur.execute(BONUSES_SQL, {'user_id': target_id})
         
         bonuses = cur.fetchone()
         if not bonuses:
@@ -35,9 +83,17 @@ def handle_bonuses(event, cur, conn):
             }
         })
     
+    # POST action=bulk - админ выдаёт бонусы списком (турнирные выплаты)
+    elif method == 'POST' and event.get('queryStringParameters', {}).get('action') == 'bulk':
+        if not check_admin(user_id, cur, claims):
+            return error_response(403, json.dumps({'error': 'Admin access required'}))
+        
+        body = json.loads(event.get('body', '{}'))
+        return grant_bonuses_bulk(body.get('grants'), cur, conn)
+    
     # POST - админ выдаёт бонусы
     elif method == 'POST':
-        if not check_admin(user_id, cur):
+        if not check_admin(user_id, cur, claims):
             return error_response(403, json.dumps({'error': 'Admin access required'}))
         
         body = json.loads(event.get('body', '{}'))
@@ -48,22 +104,21 @@ def handle_bonuses(event, cur, conn):
         if not target_user_id or not bonus_type:
             return error_response(400, json.dumps({'error': 'Missing user_id or bonus_type'}))
         
-        if bonus_type not in ['documents', 'shield', 'privilege']:
+        if bonus_type not in BONUS_TYPES:
             return error_response(400, json.dumps({'error': 'Invalid bonus_type'}))
         
+        if not is_positive_int(amount):
+            return error_response(400, json.dumps({'error': 'amount must be a positive integer'}))
+        
         column_name = f'bonus_{bonus_type}'
-        cur.execute(f'''
-            UPDATE users 
-            SET {column_name} = {column_name} + %s
-            WHERE id = %s
-            RETURNING bonus_documents, bonus_shield, bonus_privilege
-        ''', (amount, target_user_id))
+        cur.execute(GRANT_BONUS_SQL.format(column=column_name), {'amount': amount, 'user_id': target_user_id})
         
         bonuses = cur.fetchone()
         if not bonuses:
             return error_response(404, json.dumps({'error': 'User not found'}))
         
         conn.commit()
+        invalidate_profile(target_user_id)
         
         return success_response({
             'bonuses': {
@@ -82,32 +137,73 @@ def handle_bonuses(event, cur, conn):
         if not session_id or not bonus_type:
             return error_response(400, json.dumps({'error': 'Missing session_id or bonus_type'}))
         
-        if bonus_type not in ['documents', 'shield', 'privilege']:
+        if bonus_type not in BONUS_TYPES:
             return error_response(400, json.dumps({'error': 'Invalid bonus_type'}))
         
         column_name = f'bonus_{bonus_type}'
         
-        cur.execute(f'SELECT {column_name} FROM users WHERE id = %s', (user_id,))
-        current_bonus = cur.fetchone()
+        cur.execute(ACTIVATE_BONUS_SQL.format(column=column_name),
+                    {'user_id': user_id, 'session_id': session_id, 'bonus_type': bonus_type})
         
-        if not current_bonus or current_bonus[0] <= 0:
+        if not cur.fetchone():
+            conn.rollback()
             return error_response(400, json.dumps({'error': 'No bonuses available'}))
         
-        cur.execute(f'''
-            UPDATE users 
-            SET {column_name} = {column_name} - 1
-            WHERE id = %s
-        ''', (user_id,))
-        
-        cur.execute('''
-            INSERT INTO game_active_bonuses (session_id, user_id, bonus_type)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (session_id, user_id) 
-            DO UPDATE SET bonus_type = EXCLUDED.bonus_type
-        ''', (session_id, user_id, bonus_type))
-        
         conn.commit()
+        record_activation(session_id, user_id, bonus_type)
+        invalidate_profile(user_id)
         
         return success_response({'success': True, 'activated': bonus_type})
     
     return error_response(405, json.dumps({'error': 'Method not allowed'}))
+
+def grant_bonuses_bulk(grants, cur, conn):
+    '''Выдача списка бонусов одним UPDATE ... FROM (VALUES ...) в одной транзакции'''
+    if not isinstance(grants, list) or not grants:
+        return error_response(400, json.dumps({'error': 'grants must be a non-empty list'}))
+    
+    if len(grants) > MAX_BULK_GRANTS:
+        return error_response(400, json.dumps({'error': f'Too many grants, max {MAX_BULK_GRANTS}'}))
+    
+    # Несколько выдач одному пользователю суммируются: UPDATE ... FROM применяет к строке только одну пару
+    totals = {}
+    for index, grant in enumerate(grants):
+        if not isinstance(grant, dict):
+            return error_response(400, json.dumps({'error': 'Invalid grant', 'index': index}))
+        
+        target_user_id = grant.get('user_id')
+        bonus_type = grant.get('bonus_type')
+        amount = grant.get('amount', 1)
+        
+        if not is_positive_int(target_user_id) or bonus_type not in BONUS_TYPES or not is_positive_int(amount):
+            return error_response(400, json.dumps({'error': 'Invalid grant', 'index': index}))
+        
+        totals.setdefault(target_user_id, [0, 0, 0])[BONUS_TYPES.index(bonus_type)] += amount
+    
+    rows = [(uid, amounts[0], amounts[1], amounts[2]) for uid, amounts in totals.items()]
+    updated = execute_values(cur, BULK_GRANT_SQL, rows, template=BULK_GRANT_TEMPLATE, page_size=len(rows), fetch=True)
+    
+    conn.commit()
+    invalidate_profiles(totals)
+    
+    balances = {row[0]: row[1:] for row in updated}
+    results = []
+    for uid in totals:
+        if uid in balances:
+            results.append({
+                'user_id': uid,
+                'status': 'granted',
+                'bonuses': {
+                    'documents': balances[uid][0],
+                    'shield': balances[uid][1],
+                    'privilege': balances[uid][2]
+                }
+            })
+        else:
+            results.append({'user_id': uid, 'status': 'not_found'})
+    
+    return success_response({
+        'granted': len(balances),
+        'not_found': len(totals) - len(balances),
+        'results': results
+    })
@@ -1,4 +1,37 @@
 import json
+from session_bonuses import get_session_bonuses, drop_session_bonuses
+from profile_cache import invalidate_profiles
+
+SESSION_SQL = '''
+    SELECT phase, day_number, status
+    FROM game_sessions
+    WHERE id = %(session_id)s
+'''
+
+SESSION_PLAYERS_SQL = '''
+    SELECT sp.user_id, sp.role, sp.is_alive, u.profile_name, u.first_name
+    FROM session_players sp
+    JOIN users u ON sp.user_id = u.id
+    WHERE sp.session_id = %(session_id)s
+'''
+
+PLAYER_VOTED_SQL = '''
+    SELECT COUNT(*) FROM votes
+    WHERE session_id = %(session_id)s AND voter_id = %(voter_id)s AND day_number = %(day_number)s AND phase = %(phase)s
+'''
+
+FINISH_SESSION_SQL = '''
+    UPDATE game_sessions SET status = 'finished' WHERE id = %(session_id)s
+'''
+
+SESSION_CHAT_SQL = '''
+    SELECT rc.user_name, rc.message, rc.created_at
+    FROM room_chat rc
+    JOIN game_sessions gs ON rc.room_id = gs.room_id
+    WHERE gs.id = %(session_id)s
+    ORDER BY rc.created_at DESC
+    LIMIT 50
+'''
 
 def handle_game_state(event, cur, conn):
     '''Получение состояния игры'''
@@ -34,11 +67,7 @@ def handle_game_state(event, cur, conn):
             'isBase64Encoded': False
         }
     
-    cur.execute('''
-        SELECT phase, day_number, status
-        FROM game_sessions
-        WHERE id = %s
-    ''', (session_id,))
+    cur.execute(SESSION_SQL, {'session_id': session_id})
     
     game = cur.fetchone()
     
@@ -52,12 +81,7 @@ def handle_game_state(event, cur, conn):
     
     phase, day_number, status = game
     
-    cur.execute('''
-        SELECT sp.user_id, sp.role, sp.is_alive, u.profile_name, u.first_name
-        FROM session_players sp
-        JOIN users u ON sp.user_id = u.id
-        WHERE sp.session_id = %s
-    ''', (session_id,))
+    cur.execute(SESSION_PLAYERS_SQL, {'session_id': session_id})
     
     all_players = []
     my_role = ''
@@ -71,10 +95,9 @@ def handle_game_state(event, cur, conn):
         if player_id == user_id:
             my_role = role
         
-        cur.execute('''
-            SELECT COUNT(*) FROM votes
-            WHERE session_id = %s AND voter_id = %s AND day_number = %s AND phase = %s
-        ''', (session_id, player_id, day_number, phase))
+        cur.execute(PLAYER_VOTED_SQL, {
+            'session_id': session_id, 'voter_id': player_id, 'day_number': day_number, 'phase': phase
+        })
         
         voted = cur.fetchone()[0] > 0
         
@@ -86,6 +109,8 @@ def handle_game_state(event, cur, conn):
             'voted': voted
         })
     
+    bonuses = get_session_bonuses(cur, session_id)
+    
     game_ended = status == 'finished'
     winner = None
     
@@ -97,26 +122,19 @@ def handle_game_state(event, cur, conn):
         if mafia_alive == 0:
             game_ended = True
             winner = 'civilian'
-            cur.execute('''
-                UPDATE game_sessions SET status = 'finished' WHERE id = %s
-            ''', (session_id,))
+            cur.execute(FINISH_SESSION_SQL, {'session_id': session_id})
             conn.commit()
+            drop_session_bonuses(session_id)
+            invalidate_profiles(p['id'] for p in all_players)
         elif mafia_alive >= civilian_alive:
             game_ended = True
             winner = 'mafia'
-            cur.execute('''
-                UPDATE game_sessions SET status = 'finished' WHERE id = %s
-            ''', (session_id,))
+            cur.execute(FINISH_SESSION_SQL, {'session_id': session_id})
             conn.commit()
+            drop_session_bonuses(session_id)
+            invalidate_profiles(p['id'] for p in all_players)
     
-    cur.execute('''
-        SELECT rc.user_name, rc.message, rc.created_at
-        FROM room_chat rc
-        JOIN game_sessions gs ON rc.room_id = gs.room_id
-        WHERE gs.id = %s
-        ORDER BY rc.created_at DESC
-        LIMIT 50
-    ''', (session_id,))
+    cur.execute(SESSION_CHAT_SQL, {'session_id': session_id})
     
     chat = []
     for c in cur.fetchall():
@@ -136,6 +154,7 @@ def handle_game_state(event, cur, conn):
             'phase': phase,
             'day_number': day_number,
             'my_role': my_role,
+            'my_bonus': bonuses.get(user_id),
             'players': all_players,
             'game_ended': game_ended,
             'winner': winner,
@@ -1,25 +1,60 @@
 import json
 import os
+import time
 import psycopg2
-import jwt
+from psycopg2 import errors as pg_errors
+import metrics
+from utils import verify_token, decode_token, check_admin, display_name, issue_tokens, refresh_revocations, revoke_tokens
+from shop_catalog import cached_catalog, load_catalog, bump_catalog_version, catalog_response
+from profile_cache import load_profile, full_view, compact_view, invalidate_profile, is_name_taken, remember_name_taken
 
-def verify_token(token):
-    '''Проверка JWT токена'''
-    try:
-        jwt_secret = os.environ.get('JWT_SECRET')
-        payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
-        return payload.get('user_id')
-    except:
-        return None
+CLAIM_PROFILE_SQL = '''
+    UPDATE users SET profile_name = %(profile_name)s, profile_created = TRUE
+    WHERE id = %(user_id)s
+    RETURNING id, telegram_id, username, first_name, last_name, photo_url,
+              reputation, level, total_games, wins, losses, profile_name,
+              is_admin, profile_created
+'''
+
+ADMIN_COUNT_SQL = '''
+    SELECT COUNT(*) FROM users WHERE is_admin = TRUE
+'''
+
+ADMIN_BOOTSTRAP_SQL = '''
+    UPDATE users SET is_admin = TRUE WHERE id = %(user_id)s
+'''
+
+ADMIN_USERS_SQL = '''
+    SELECT id, profile_name, username, first_name, reputation, level, is_admin, profile_created
+    FROM users WHERE profile_created = TRUE
+    ORDER BY created_at DESC
+'''
+
+ADMIN_SET_SQL = '''
+    UPDATE users SET is_admin = %(is_admin)s WHERE id = %(user_id)s
+'''
+
+SHOP_CREATE_SQL = '''
+    INSERT INTO shop_items (name, description, price, image_url, created_by)
+    VALUES (%(name)s, %(description)s, %(price)s, %(image_url)s, %(user_id)s)
+    RETURNING id, name, description, price, image_url, is_available
+'''
 
-def check_admin(user_id, cur):
-    '''Проверка прав администратора'''
-    cur.execute('SELECT is_admin FROM users WHERE id = %s', (user_id,))
-    result = cur.fetchone()
-    return result and result[0]
+SHOP_DELETE_SQL = '''
+    UPDATE shop_items SET is_available = FALSE WHERE id = %(item_id)s
+'''
 
 def handler(event: dict, context) -> dict:
     '''Общий API для профилей, админки, магазина и игры'''
+    route = metrics.route_name(event)
+    started = time.perf_counter()
+    metrics.begin_request(route)
+    response = route_request(event, context)
+    metrics.end_request(route, event.get('httpMethod', 'GET'), response['statusCode'], time.perf_counter() - started)
+    return response
+
+def route_request(event: dict, context) -> dict:
+    '''Маршрутизация запроса по path'''
     method = event.get('httpMethod', 'GET')
     path = event.get('queryStringParameters', {}).get('path', '')
     
@@ -29,17 +64,28 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
+    # МЕТРИКИ (без обращения к базе)
+    if path == 'metrics':
+        return metrics.metrics_response(event)
+    
+    # КАТАЛОГ МАГАЗИНА из кэша, без подключения к базе
+    if path == 'shop' and method == 'GET' and not event.get('queryStringParameters', {}).get('action'):
+        cached = cached_catalog()
+        if cached:
+            return catalog_response(event, *cached)
+    
     try:
         db_url = os.environ.get('DATABASE_URL')
         conn = psycopg2.connect(db_url)
-        cur = conn.cursor()
+        cur = conn.cursor(cursor_factory=metrics.CountingCursor)
+        refresh_revocations(cur)
         
         # ПРОФИЛЬ
         if path == 'profile':
@@ -67,16 +113,25 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
-            if method == 'GET':
-                cur.execute('''
-                    SELECT id, telegram_id, username, first_name, last_name, photo_url, 
-                           reputation, level, total_games, wins, losses, profile_name, 
-                           is_admin, profile_created, bonus_documents, bonus_shield, bonus_privilege
-                    FROM users WHERE id = %s
-                ''', (user_id,))
+            action = event.get('queryStringParameters', {}).get('action')
+            
+            if method == 'GET' and action == 'check_name':
+                name = (event.get('queryStringParameters', {}).get('name') or '').strip()
+                valid = 3 <= len(name) <= 50
+                available = valid and not is_name_taken(cur, name)
                 
-                user = cur.fetchone()
-                if not user:
+                cur.close()
+                conn.close()
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'name': name, 'valid': valid, 'available': available}),
+                    'isBase64Encoded': False
+                }
+            
+            elif method == 'GET':
+                profile = load_profile(cur, user_id)
+                if not profile:
                     cur.close()
                     conn.close()
                     return {
@@ -86,13 +141,8 @@ def handler(event: dict, context) -> dict:
                         'isBase64Encoded': False
                     }
                 
-                user_data = {
-                    'id': user[0], 'telegram_id': user[1], 'username': user[2],
-                    'first_name': user[3], 'last_name': user[4], 'photo_url': user[5],
-                    'reputation': user[6], 'level': user[7], 'total_games': user[8],
-                    'wins': user[9], 'losses': user[10], 'profile_name': user[11],
-                    'is_admin': user[12], 'profile_created': user[13]
-                }
+                fields = event.get('queryStringParameters', {}).get('fields')
+                user_data = compact_view(profile) if fields == 'compact' else full_view(profile)
                 
                 cur.close()
                 conn.close()
@@ -117,8 +167,12 @@ def handler(event: dict, context) -> dict:
                         'isBase64Encoded': False
                     }
                 
-                cur.execute('SELECT id FROM users WHERE profile_name = %s', (profile_name,))
-                if cur.fetchone():
+                # Занятость имени проверяет уникальный индекс (без учёта регистра) в том же UPDATE
+                try:
+                    cur.execute(CLAIM_PROFILE_SQL, {'profile_name': profile_name, 'user_id': user_id})
+                except pg_errors.UniqueViolation:
+                    conn.rollback()
+                    remember_name_taken(profile_name)
                     cur.close()
                     conn.close()
                     return {
@@ -128,16 +182,10 @@ def handler(event: dict, context) -> dict:
                         'isBase64Encoded': False
                     }
                 
-                cur.execute('''
-                    UPDATE users SET profile_name = %s, profile_created = TRUE
-                    WHERE id = %s
-                    RETURNING id, telegram_id, username, first_name, last_name, photo_url, 
-                              reputation, level, total_games, wins, losses, profile_name, 
-                              is_admin, profile_created
-                ''', (profile_name, user_id))
-                
                 user = cur.fetchone()
                 conn.commit()
+                invalidate_profile(user_id)
+                remember_name_taken(profile_name)
                 
                 user_data = {
                     'id': user[0], 'telegram_id': user[1], 'username': user[2],
@@ -146,13 +194,15 @@ def handler(event: dict, context) -> dict:
                     'wins': user[9], 'losses': user[10], 'profile_name': user[11],
                     'is_admin': user[12], 'profile_created': user[13]
                 }
+                # Новая пара токенов несёт имя профиля: под ним игрок виден в комнатах
+                tokens = issue_tokens(user_id, user[12], user[13], display_name(user[11], user[3]))
                 
                 cur.close()
                 conn.close()
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'user': user_data}),
+                    'body': json.dumps({'user': user_data, **tokens}),
                     'isBase64Encoded': False
                 }
         
@@ -171,7 +221,8 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
-            user_id = verify_token(token)
+            claims = decode_token(token)
+            user_id = claims.get('user_id') if claims else None
             if not user_id:
                 cur.close()
                 conn.close()
@@ -186,11 +237,11 @@ def handler(event: dict, context) -> dict:
             
             if method == 'GET' and action == 'check':
                 is_admin = check_admin(user_id, cur)
-                cur.execute('SELECT COUNT(*) FROM users WHERE is_admin = TRUE')
+                cur.execute(ADMIN_COUNT_SQL)
                 admin_count = cur.fetchone()[0]
                 
                 if admin_count == 0:
-                    cur.execute('UPDATE users SET is_admin = TRUE WHERE id = %s', (user_id,))
+                    cur.execute(ADMIN_BOOTSTRAP_SQL, {'user_id': user_id})
                     conn.commit()
                     is_admin = True
                 
@@ -204,7 +255,7 @@ def handler(event: dict, context) -> dict:
                 }
             
             elif method == 'GET' and action == 'users':
-                if not check_admin(user_id, cur):
+                if not check_admin(user_id, cur, claims):
                     cur.close()
                     conn.close()
                     return {
@@ -214,11 +265,7 @@ def handler(event: dict, context) -> dict:
                         'isBase64Encoded': False
                     }
                 
-                cur.execute('''
-                    SELECT id, profile_name, username, first_name, reputation, level, is_admin, profile_created
-                    FROM users WHERE profile_created = TRUE
-                    ORDER BY created_at DESC
-                ''')
+                cur.execute(ADMIN_USERS_SQL)
                 users = cur.fetchall()
                 user_list = [{
                     'id': u[0], 'profile_name': u[1], 'username': u[2],
@@ -236,7 +283,7 @@ def handler(event: dict, context) -> dict:
                 }
             
             elif method == 'PUT':
-                if not check_admin(user_id, cur):
+                if not check_admin(user_id, cur, claims):
                     cur.close()
                     conn.close()
                     return {
@@ -260,8 +307,12 @@ def handler(event: dict, context) -> dict:
                         'isBase64Encoded': False
                     }
                 
-                cur.execute('UPDATE users SET is_admin = %s WHERE id = %s', (make_admin, target_user_id))
+                cur.execute(ADMIN_SET_SQL, {'is_admin': make_admin, 'user_id': target_user_id})
+                # Роль зашита в access-токен: при снятии прав отзываем его, новую роль клиент получит через refresh
+                if not make_admin:
+                    revoke_tokens(cur, target_user_id)
                 conn.commit()
+                invalidate_profile(target_user_id)
                 
                 cur.close()
                 conn.close()
@@ -274,26 +325,13 @@ def handler(event: dict, context) -> dict:
         
         # МАГАЗИН
         elif path == 'shop':
-            if method == 'GET':
-                cur.execute('''
-                    SELECT id, name, description, price, image_url, is_available
-                    FROM shop_items WHERE is_available = TRUE
-                    ORDER BY created_at DESC
-                ''')
-                items = cur.fetchall()
-                item_list = [{
-                    'id': i[0], 'name': i[1], 'description': i[2],
-                    'price': i[3], 'image_url': i[4], 'is_available': i[5]
-                } for i in items]
-                
+            action = event.get('queryStringParameters', {}).get('action')
+            
+            if method == 'GET' and not action:
+                body, etag = load_catalog(cur)
                 cur.close()
                 conn.close()
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'items': item_list}),
-                    'isBase64Encoded': False
-                }
+                return catalog_response(event, body, etag)
             
             headers = event.get('headers', {})
             token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
@@ -308,7 +346,8 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
-            user_id = verify_token(token)
+            claims = decode_token(token)
+            user_id = claims.get('user_id') if claims else None
             if not user_id:
                 cur.close()
                 conn.close()
@@ -319,8 +358,22 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
+            if method == 'GET' and action == 'purchases':
+                from purchases import list_purchases
+                response = list_purchases(user_id, cur)
+                cur.close()
+                conn.close()
+                return response
+            
+            if method == 'POST' and action == 'purchase':
+                from purchases import purchase_item
+                response = purchase_item(event, user_id, cur, conn)
+                cur.close()
+                conn.close()
+                return response
+            
             if method == 'POST':
-                if not check_admin(user_id, cur):
+                if not check_admin(user_id, cur, claims):
                     cur.close()
                     conn.close()
                     return {
@@ -346,14 +399,14 @@ def handler(event: dict, context) -> dict:
                         'isBase64Encoded': False
                     }
                 
-                cur.execute('''
-                    INSERT INTO shop_items (name, description, price, image_url, created_by)
-                    VALUES (%s, %s, %s, %s, %s)
-                    RETURNING id, name, description, price, image_url, is_available
-                ''', (name, description, price, image_url, user_id))
+                cur.execute(SHOP_CREATE_SQL, {
+                    'name': name, 'description': description, 'price': price, 'image_url': image_url,
+                    'user_id': user_id
+                })
                 
                 item = cur.fetchone()
                 conn.commit()
+                bump_catalog_version()
                 
                 item_data = {
                     'id': item[0], 'name': item[1], 'description': item[2],
@@ -370,7 +423,7 @@ def handler(event: dict, context) -> dict:
                 }
             
             elif method == 'DELETE':
-                if not check_admin(user_id, cur):
+                if not check_admin(user_id, cur, claims):
                     cur.close()
                     conn.close()
                     return {
@@ -391,8 +444,9 @@ def handler(event: dict, context) -> dict:
                         'isBase64Encoded': False
                     }
                 
-                cur.execute('UPDATE shop_items SET is_available = FALSE WHERE id = %s', (item_id,))
+                cur.execute(SHOP_DELETE_SQL, {'item_id': item_id})
                 conn.commit()
+                bump_catalog_version()
                 
                 cur.close()
                 conn.close()
@@ -403,6 +457,11 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
         
+        # ТОКЕНЫ
+        elif path == 'auth':
+            from auth import handle_auth
+            return handle_auth(event, cur, conn)
+        
         # БОНУСЫ
         elif path == 'bonuses':
             from bonuses import handle_bonuses
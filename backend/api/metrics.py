@@ -0,0 +1,201 @@
+import hmac
+import os
+import threading
+import time
+import psycopg2.extensions
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_lock = threading.Lock()
+_local = threading.local()
+_started_at = time.time()
+
+_counters = {}
+_gauges = {}
+_histograms = {}
+
+_help = {
+    'mafia_api_requests_total': ('counter', 'Запросы к API по маршруту и статусу ответа'),
+    'mafia_api_request_duration_seconds': ('histogram', 'Время обработки запроса по маршруту'),
+    'mafia_db_queries_total': ('counter', 'SQL-запросы к базе по маршруту'),
+    'mafia_chat_messages_total': ('counter', 'Отправленные сообщения чата комнат'),
+    'mafia_votes_total': ('counter', 'Принятые голоса в играх'),
+    'mafia_games_started_total': ('counter', 'Запущенные игровые сессии'),
+    'mafia_rooms': ('gauge', 'Комнаты по статусу (по последнему списку комнат)'),
+    'mafia_room_players': ('gauge', 'Игроки в открытых комнатах (по последнему списку комнат)'),
+    'mafia_active_sessions': ('gauge', 'Активные игровые сессии (комнаты в статусе in_game)'),
+    'mafia_process_start_time_seconds': ('gauge', 'Время запуска контейнера'),
+}
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+def inc(name, labels=None, value=1):
+    '''Увеличение счётчика'''
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def set_gauge(name, value, labels=None):
+    '''Установка значения gauge'''
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+def observe(name, value, labels=None):
+    '''Запись значения в гистограмму'''
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * len(LATENCY_BUCKETS), 0.0, 0]
+        buckets = hist[0]
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                buckets[i] += 1
+                break
+        hist[1] += value
+        hist[2] += 1
+
+# Известные маршруты API: path -> действия. Метки строятся только из них,
+# иначе произвольные path/action из запроса плодили бы неограниченно много серий
+KNOWN_ROUTES = {
+    'metrics': set(),
+    'profile': {'check_name'},
+    'admin': {'check', 'users'},
+    'shop': {'purchase', 'purchases'},
+    'auth': {'refresh', 'logout'},
+    'bonuses': {'bulk'},
+    'rooms': set(),
+    'room': {'join', 'state', 'chat', 'leave'},
+    'game': {'start', 'vote', 'state'},
+}
+KNOWN_METHODS = {'GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'}
+
+def route_name(event):
+    '''Имя маршрута для меток: path/action из KNOWN_ROUTES, остальное — other'''
+    params = event.get('queryStringParameters') or {}
+    path = params.get('path', '') or 'root'
+    action = params.get('action')
+    if path == 'root':
+        return path
+    actions = KNOWN_ROUTES.get(path)
+    if actions is None:
+        return 'other'
+    if not action:
+        return path
+    return f'{path}/{action}' if action in actions else f'{path}/other'
+
+def method_name(method):
+    return method if method in KNOWN_METHODS else 'other'
+
+def begin_request(route):
+    '''Привязка текущего маршрута к потоку для подсчёта SQL-запросов'''
+    _local.route = route
+
+def end_request(route, method, status, duration):
+    '''Учёт завершённого запроса'''
+    _local.route = None
+    inc('mafia_api_requests_total', {'route': route, 'method': method_name(method), 'status': str(status)})
+    observe('mafia_api_request_duration_seconds', duration, {'route': route})
+
+def record_db_query():
+    inc('mafia_db_queries_total', {'route': getattr(_local, 'route', None) or 'unknown'})
+
+class CountingCursor(psycopg2.extensions.cursor):
+    '''Курсор, считающий выполненные запросы без обращений к базе'''
+
+    def execute(self, query, vars=None):
+        record_db_query()
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        record_db_query()
+        return super().executemany(query, vars_list)
+
+def observe_rooms(rooms):
+    '''Обновление gauge комнат по уже полученному списку, без отдельных запросов'''
+    by_status = {'waiting': 0, 'in_game': 0}
+    players = 0
+    for room in rooms:
+        by_status[room['status']] = by_status.get(room['status'], 0) + 1
+        players += room.get('current_players') or 0
+    for status, count in by_status.items():
+        set_gauge('mafia_rooms', count, {'status': status})
+    set_gauge('mafia_room_players', players)
+    set_gauge('mafia_active_sessions', by_status.get('in_game', 0))
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + (list(extra) if extra else [])
+    if not pairs:
+        return ''
+    escaped = []
+    for k, v in pairs:
+        value = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{k}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+def render():
+    '''Метрики в текстовом формате Prometheus'''
+    set_gauge('mafia_process_start_time_seconds', _started_at)
+
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {k: (list(v[0]), v[1], v[2]) for k, v in _histograms.items()}
+
+    series = {}
+    for (name, labels), value in counters.items():
+        series.setdefault(name, []).append(f'{name}{_format_labels(labels)} {value}')
+    for (name, labels), value in gauges.items():
+        series.setdefault(name, []).append(f'{name}{_format_labels(labels)} {value}')
+    for (name, labels), (buckets, total, count) in histograms.items():
+        lines = series.setdefault(name, [])
+        cumulative = 0
+        for bound, hits in zip(LATENCY_BUCKETS, buckets):
+            cumulative += hits
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+        lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {count}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+        lines.append(f'{name}_count{_format_labels(labels)} {count}')
+
+    output = []
+    for name in sorted(series):
+        metric_type, description = _help.get(name, ('untyped', name))
+        output.append(f'# HELP {name} {description}')
+        output.append(f'# TYPE {name} {metric_type}')
+        output.extend(sorted(series[name]) if metric_type != 'histogram' else series[name])
+    return '\n'.join(output) + '\n'
+
+def snapshot():
+    '''Копия счётчиков для бенчмарков'''
+    with _lock:
+        return dict(_counters)
+
+def metrics_allowed(event):
+    '''Доступ к метрикам: при заданном METRICS_TOKEN нужен заголовок Authorization: Bearer <токен>'''
+    expected = os.environ.get('METRICS_TOKEN')
+    if not expected:
+        return True
+    headers = event.get('headers') or {}
+    supplied = headers.get('Authorization') or headers.get('authorization') or ''
+    return hmac.compare_digest(supplied.encode(), f'Bearer {expected}'.encode())
+
+def metrics_response(event):
+    '''HTTP-ответ с метриками'''
+    if not metrics_allowed(event):
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': '{"error": "Unauthorized"}',
+            'isBase64Encoded': False
+        }
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'text/plain; version=0.0.4; charset=utf-8',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': render(),
+        'isBase64Encoded': False
+    }
@@ -0,0 +1,84 @@
+from cache import TTLCache
+
+# Профили по user_id; TTL ограничивает устаревание при записи из другого контейнера
+_profiles = TTLCache(ttl=60)
+
+# Занятость имён профиля по LOWER(name): имена освобождаются редко, свободные перепроверяются чаще
+_taken_names = TTLCache(ttl=300)
+_free_names = TTLCache(ttl=10)
+
+PROFILE_SQL = '''
+    SELECT id, telegram_id, username, first_name, last_name, photo_url,
+           reputation, level, total_games, wins, losses, profile_name,
+           is_admin, profile_created, bonus_documents, bonus_shield, bonus_privilege
+    FROM users WHERE id = %(user_id)s
+'''
+
+NAME_TAKEN_SQL = '''
+    SELECT 1 FROM users WHERE LOWER(profile_name) = LOWER(%(profile_name)s)
+'''
+
+def load_profile(cur, user_id):
+    '''Профиль пользователя из кэша, при промахе — одним запросом из базы'''
+    user_id = int(user_id)
+    profile = _profiles.get(user_id)
+    if profile is not None:
+        return profile
+    
+    cur.execute(PROFILE_SQL, {'user_id': user_id})
+    
+    user = cur.fetchone()
+    if not user:
+        return None
+    
+    profile = {
+        'id': user[0], 'telegram_id': user[1], 'username': user[2],
+        'first_name': user[3], 'last_name': user[4], 'photo_url': user[5],
+        'reputation': user[6], 'level': user[7], 'total_games': user[8],
+        'wins': user[9], 'losses': user[10], 'profile_name': user[11],
+        'is_admin': user[12], 'profile_created': user[13],
+        'bonuses': {'documents': user[14], 'shield': user[15], 'privilege': user[16]}
+    }
+    _profiles.set(user_id, profile)
+    return profile
+
+def full_view(profile):
+    '''Полный профиль в прежнем формате ответа'''
+    return {k: v for k, v in profile.items() if k != 'bonuses'}
+
+def compact_view(profile):
+    '''Проекция для экранов, которым нужны только имя, уровень и бонусы'''
+    return {
+        'id': profile['id'],
+        'profile_name': profile['profile_name'],
+        'level': profile['level'],
+        'bonuses': profile['bonuses']
+    }
+
+def invalidate_profile(user_id):
+    _profiles.invalidate(int(user_id))
+
+def invalidate_profiles(user_ids):
+    for user_id in user_ids:
+        _profiles.invalidate(int(user_id))
+
+def is_name_taken(cur, name):
+    '''Проверка занятости имени без учёта регистра по индексу LOWER(profile_name)'''
+    key = name.lower()
+    if key in _taken_names:
+        return True
+    if key in _free_names:
+        return False
+    
+    cur.execute(NAME_TAKEN_SQL, {'profile_name': name})
+    taken = cur.fetchone() is not None
+    if taken:
+        _taken_names.set(key, True)
+    else:
+        _free_names.set(key, True)
+    return taken
+
+def remember_name_taken(name):
+    key = name.lower()
+    _free_names.invalidate(key)
+    _taken_names.set(key, True)
@@ -0,0 +1,116 @@
+import json
+from psycopg2 import errors as pg_errors
+from utils import error_response, success_response
+from profile_cache import invalidate_profile
+
+MAX_REQUEST_ID_LENGTH = 64
+
+# Списание репутации и запись покупки одним запросом: условие reputation >= price
+# исключает уход в минус, NOT EXISTS — повторное списание при ретрае того же request_id
+PURCHASE_SQL = '''
+    WITH item AS (
+        SELECT id, price FROM shop_items
+        WHERE id = %(item_id)s AND is_available = TRUE
+    ),
+    debit AS (
+        UPDATE users u
+        SET reputation = u.reputation - item.price
+        FROM item
+        WHERE u.id = %(user_id)s
+          AND u.reputation >= item.price
+          AND NOT EXISTS (
+              SELECT 1 FROM shop_purchases
+              WHERE user_id = %(user_id)s AND request_id = %(request_id)s
+          )
+        RETURNING u.reputation, item.id AS item_id, item.price
+    )
+    INSERT INTO shop_purchases (user_id, item_id, price, status, request_id)
+    SELECT %(user_id)s, item_id, price, 'completed', %(request_id)s FROM debit
+    RETURNING id, item_id, price, created_at, (SELECT reputation FROM debit)
+'''
+
+PURCHASE_REPLAY_SQL = '''
+    SELECT p.id, p.item_id, p.price, p.created_at, u.reputation
+    FROM shop_purchases p JOIN users u ON u.id = p.user_id
+    WHERE p.user_id = %(user_id)s AND p.request_id = %(request_id)s
+'''
+
+ITEM_AVAILABLE_SQL = '''
+    SELECT price FROM shop_items WHERE id = %(item_id)s AND is_available = TRUE
+'''
+
+PURCHASES_SQL = '''
+    SELECT p.id, p.item_id, p.price, p.created_at, i.name, i.image_url
+    FROM shop_purchases p JOIN shop_items i ON i.id = p.item_id
+    WHERE p.user_id = %(user_id)s AND p.status = 'completed'
+    ORDER BY p.created_at DESC
+'''
+
+def purchase_item(event, user_id, cur, conn):
+    '''Покупка товара магазина за репутацию, идемпотентная по request_id клиента'''
+    body = json.loads(event.get('body', '{}'))
+    item_id = body.get('item_id')
+    request_id = body.get('request_id')
+    
+    if not isinstance(item_id, int):
+        return error_response(400, json.dumps({'error': 'Missing item_id'}))
+    
+    if not isinstance(request_id, str) or not request_id or len(request_id) > MAX_REQUEST_ID_LENGTH:
+        return error_response(400, json.dumps({'error': 'Missing or invalid request_id'}))
+    
+    params = {'item_id': item_id, 'user_id': user_id, 'request_id': request_id}
+    try:
+        cur.execute(PURCHASE_SQL, params)
+        purchase = cur.fetchone()
+    except pg_errors.UniqueViolation:
+        # Параллельный запрос с тем же request_id успел записать покупку; наше списание откатывается
+        purchase = None
+    
+    if purchase:
+        conn.commit()
+        invalidate_profile(user_id)
+        return success_response({
+            'purchase': purchase_view(purchase),
+            'reputation': purchase[4],
+            'replayed': False
+        })
+    
+    conn.rollback()
+    
+    # Ниже — только путь отказа: повтор уже выполненной покупки или причина ошибки
+    cur.execute(PURCHASE_REPLAY_SQL, {'user_id': user_id, 'request_id': request_id})
+    existing = cur.fetchone()
+    if existing:
+        if existing[1] != item_id:
+            return error_response(409, json.dumps({'error': 'request_id already used for another item'}))
+        return success_response({
+            'purchase': purchase_view(existing),
+            'reputation': existing[4],
+            'replayed': True
+        })
+    
+    cur.execute(ITEM_AVAILABLE_SQL, {'item_id': item_id})
+    if not cur.fetchone():
+        return error_response(404, json.dumps({'error': 'Item not available'}))
+    
+    return error_response(400, json.dumps({'error': 'Not enough reputation'}))
+
+def list_purchases(user_id, cur):
+    '''Купленные пользователем товары'''
+    cur.execute(PURCHASES_SQL, {'user_id': user_id})
+    
+    return success_response({
+        'purchases': [{
+            **purchase_view(row),
+            'name': row[4],
+            'image_url': row[5]
+        } for row in cur.fetchall()]
+    })
+
+def purchase_view(row):
+    return {
+        'id': row[0],
+        'item_id': row[1],
+        'price': row[2],
+        'created_at': row[3].isoformat() if row[3] else None
+    }
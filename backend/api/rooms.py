@@ -1,6 +1,126 @@
 import json
 import random
 from datetime import datetime
+import metrics
+from session_bonuses import prime_session_bonuses
+
+# Игроки, не подававшие признаков жизни 30 секунд, убираются из всех комнат
+ROOMS_CLEANUP_SQL = '''
+    DELETE FROM room_players
+    WHERE last_seen < NOW() - INTERVAL '30 seconds'
+'''
+
+ROOMS_LIST_SQL = '''
+    SELECT r.id, r.name, r.password, r.max_players,
+           COUNT(DISTINCT rp.user_id) as current_players,
+           r.status, r.created_by, r.created_at
+    FROM rooms r
+    LEFT JOIN room_players rp ON r.id = rp.room_id
+    WHERE r.status IN ('waiting', 'in_game')
+    GROUP BY r.id, r.name, r.password, r.max_players, r.status, r.created_by, r.created_at
+    ORDER BY r.created_at DESC
+'''
+
+ROOM_CREATE_SQL = '''
+    INSERT INTO rooms (name, password, max_players, current_players, status, created_by)
+    VALUES (%(name)s, %(password)s, %(max_players)s, 0, 'waiting', %(user_id)s)
+    RETURNING id
+'''
+
+ROOM_CREATOR_SQL = '''
+    SELECT created_by FROM rooms WHERE id = %(room_id)s
+'''
+
+ROOM_JOIN_SQL = '''
+    INSERT INTO room_players (room_id, user_id, user_name, is_creator, last_seen)
+    VALUES (%(room_id)s, %(user_id)s, %(user_name)s, %(is_creator)s, NOW())
+    ON CONFLICT (room_id, user_id)
+    DO UPDATE SET last_seen = NOW()
+'''
+
+ROOM_TOUCH_SQL = '''
+    UPDATE room_players
+    SET last_seen = NOW()
+    WHERE room_id = %(room_id)s AND user_id = %(user_id)s
+'''
+
+ROOM_CLEANUP_SQL = '''
+    DELETE FROM room_players
+    WHERE room_id = %(room_id)s AND last_seen < NOW() - INTERVAL '10 seconds'
+'''
+
+ROOM_PLAYERS_SQL = '''
+    SELECT user_id, user_name, is_creator
+    FROM room_players
+    WHERE room_id = %(room_id)s
+    ORDER BY joined_at
+'''
+
+ROOM_CHAT_SQL = '''
+    SELECT user_name, message, created_at
+    FROM room_chat
+    WHERE room_id = %(room_id)s
+    ORDER BY created_at DESC
+    LIMIT 50
+'''
+
+ROOM_SESSION_SQL = '''
+    SELECT active_session_id, status
+    FROM rooms
+    WHERE id = %(room_id)s
+'''
+
+CHAT_MEMBER_SQL = '''
+    SELECT user_name FROM room_players
+    WHERE room_id = %(room_id)s AND user_id = %(user_id)s
+'''
+
+CHAT_INSERT_SQL = '''
+    INSERT INTO room_chat (room_id, user_id, user_name, message)
+    VALUES (%(room_id)s, %(user_id)s, %(user_name)s, %(message)s)
+'''
+
+ROOM_LEAVE_SQL = '''
+    DELETE FROM room_players
+    WHERE room_id = %(room_id)s AND user_id = %(user_id)s
+'''
+
+GAME_PLAYERS_SQL = '''
+    SELECT user_id, user_name
+    FROM room_players
+    WHERE room_id = %(room_id)s
+'''
+
+GAME_SESSION_SQL = '''
+    INSERT INTO game_sessions (room_id, status, phase, day_number)
+    VALUES (%(room_id)s, 'active', 'night', 1)
+    RETURNING id
+'''
+
+SESSION_PLAYER_SQL = '''
+    INSERT INTO session_players (session_id, user_id, role, is_alive)
+    VALUES (%(session_id)s, %(user_id)s, %(role)s, %(is_alive)s)
+'''
+
+GAME_ROOM_SQL = '''
+    UPDATE rooms
+    SET status = %(status)s, active_session_id = %(session_id)s
+    WHERE id = %(room_id)s
+'''
+
+VOTE_SESSION_SQL = '''
+    SELECT phase, day_number FROM game_sessions WHERE id = %(session_id)s
+'''
+
+VOTE_DELETE_SQL = '''
+    DELETE FROM votes
+    WHERE session_id = %(session_id)s AND voter_id = %(voter_id)s AND day_number = %(day_number)s AND phase = %(phase)s
+'''
+
+VOTE_INSERT_SQL = '''
+    INSERT INTO votes (session_id, voter_id, target_id, phase, day_number)
+    VALUES (%(session_id)s, %(voter_id)s, %(target_id)s, %(phase)s, %(day_number)s)
+'''
 
 def calculate_roles(player_count):
     '''Расчет распределения ролей по количеству игроков'''
@@ -67,21 +187,9 @@ def handle_rooms(event, cur, conn):
     method = event.get('httpMethod', 'GET')
     
     if method == 'GET':
-        cur.execute('''
-            DELETE FROM room_players 
-            WHERE last_seen < NOW() - INTERVAL '30 seconds'
-        ''')
-        
-        cur.execute('''
-            SELECT r.id, r.name, r.password, r.max_players, 
-                   COUNT(DISTINCT rp.user_id) as current_players, 
-                   r.status, r.created_by, r.created_at
-            FROM rooms r
-            LEFT JOIN room_players rp ON r.id = rp.room_id
-            WHERE r.status IN ('waiting', 'in_game')
-            GROUP BY r.id, r.name, r.password, r.max_players, r.status, r.created_by, r.created_at
-            ORDER BY r.created_at DESC
-        ''')
+        cur.execute(ROOMS_CLEANUP_SQL)
+        
+        cur.execute(ROOMS_LIST_SQL)
         
         rooms_data = cur.fetchall()
         rooms = []
@@ -99,6 +207,7 @@ def handle_rooms(event, cur, conn):
             })
         
         conn.commit()
+        metrics.observe_rooms(rooms)
         
         return {
             'statusCode': 200,
@@ -151,11 +260,9 @@ def handle_rooms(event, cur, conn):
                 'isBase64Encoded': False
             }
         
-        cur.execute('''
-            INSERT INTO rooms (name, password, max_players, current_players, status, created_by)
-            VALUES (%s, %s, %s, 0, 'waiting', %s)
-            RETURNING id
-        ''', (name, password, max_players, user_id))
+        cur.execute(ROOM_CREATE_SQL, {
+            'name': name, 'password': password, 'max_players': max_players, 'user_id': user_id
+        })
         
         room_id = cur.fetchone()[0]
         conn.commit()
@@ -207,7 +314,7 @@ def handle_room(event, cur, conn):
                 'isBase64Encoded': False
             }
         
-        cur.execute('SELECT created_by FROM rooms WHERE id = %s', (room_id,))
+        cur.execute(ROOM_CREATOR_SQL, {'room_id': room_id})
         room = cur.fetchone()
         
         if not room:
@@ -220,12 +327,9 @@ def handle_room(event, cur, conn):
         
         is_creator = room[0] == user_id
         
-        cur.execute('''
-            INSERT INTO room_players (room_id, user_id, user_name, is_creator, last_seen)
-            VALUES (%s, %s, %s, %s, NOW())
-            ON CONFLICT (room_id, user_id) 
-            DO UPDATE SET last_seen = NOW()
-        ''', (room_id, user_id, user_name, is_creator))
+        cur.execute(ROOM_JOIN_SQL, {
+            'room_id': room_id, 'user_id': user_id, 'user_name': user_name, 'is_creator': is_creator
+        })
         
         conn.commit()
         
@@ -247,23 +351,11 @@ def handle_room(event, cur, conn):
                 'isBase64Encoded': False
             }
         
-        cur.execute('''
-            UPDATE room_players 
-            SET last_seen = NOW() 
-            WHERE room_id = %s AND user_id = %s
-        ''', (room_id, user_id))
+        cur.execute(ROOM_TOUCH_SQL, {'room_id': room_id, 'user_id': user_id})
         
-        cur.execute('''
-            DELETE FROM room_players 
-            WHERE room_id = %s AND last_seen < NOW() - INTERVAL '10 seconds'
-        ''', (room_id,))
+        cur.execute(ROOM_CLEANUP_SQL, {'room_id': room_id})
         
-        cur.execute('''
-            SELECT user_id, user_name, is_creator
-            FROM room_players
-            WHERE room_id = %s
-            ORDER BY joined_at
-        ''', (room_id,))
+        cur.execute(ROOM_PLAYERS_SQL, {'room_id': room_id})
         
         players = []
         for p in cur.fetchall():
@@ -273,13 +365,7 @@ def handle_room(event, cur, conn):
                 'is_creator': p[2]
             })
         
-        cur.execute('''
-            SELECT user_name, message, created_at
-            FROM room_chat
-            WHERE room_id = %s
-            ORDER BY created_at DESC
-            LIMIT 50
-        ''', (room_id,))
+        cur.execute(ROOM_CHAT_SQL, {'room_id': room_id})
         
         chat = []
         for c in cur.fetchall():
@@ -291,11 +377,7 @@ def handle_room(event, cur, conn):
         
         chat.reverse()
         
-        cur.execute('''
-            SELECT active_session_id, status 
-            FROM rooms 
-            WHERE id = %s
-        ''', (room_id,))
+        cur.execute(ROOM_SESSION_SQL, {'room_id': room_id})
         
         room_data = cur.fetchone()
         game_started = False
@@ -333,10 +415,7 @@ def handle_room(event, cur, conn):
                 'isBase64Encoded': False
             }
         
-        cur.execute('''
-            SELECT user_name FROM room_players 
-            WHERE room_id = %s AND user_id = %s
-        ''', (room_id, user_id))
+        cur.execute(CHAT_MEMBER_SQL, {'room_id': room_id, 'user_id': user_id})
         
         player = cur.fetchone()
         
@@ -350,12 +429,12 @@ def handle_room(event, cur, conn):
         
         user_name = player[0]
         
-        cur.execute('''
-            INSERT INTO room_chat (room_id, user_id, user_name, message)
-            VALUES (%s, %s, %s, %s)
-        ''', (room_id, user_id, user_name, message))
+        cur.execute(CHAT_INSERT_SQL, {
+            'room_id': room_id, 'user_id': user_id, 'user_name': user_name, 'message': message
+        })
         
         conn.commit()
+        metrics.inc('mafia_chat_messages_total')
         
         return {
             'statusCode': 200,
@@ -376,10 +455,7 @@ def handle_room(event, cur, conn):
                 'isBase64Encoded': False
             }
         
-        cur.execute('''
-            DELETE FROM room_players 
-            WHERE room_id = %s AND user_id = %s
-        ''', (room_id, user_id))
+        cur.execute(ROOM_LEAVE_SQL, {'room_id': room_id, 'user_id': user_id})
         
         conn.commit()
         
@@ -436,11 +512,7 @@ def handle_game(event, cur, conn):
                 'isBase64Encoded': False
             }
         
-        cur.execute('''
-            SELECT user_id, user_name 
-            FROM room_players 
-            WHERE room_id = %s
-        ''', (room_id,))
+        cur.execute(GAME_PLAYERS_SQL, {'room_id': room_id})
         
         players = []
         for p in cur.fetchall():
@@ -454,29 +526,23 @@ def handle_game(event, cur, conn):
                 'isBase64Encoded': False
             }
         
-        cur.execute('''
-            INSERT INTO game_sessions (room_id, status, phase, day_number)
-            VALUES (%s, 'active', 'night', 1)
-            RETURNING id
-        ''', (room_id,))
+        cur.execute(GAME_SESSION_SQL, {'room_id': room_id})
         
         session_id = cur.fetchone()[0]
         
         player_roles = distribute_roles(players)
         
         for pr in player_roles:
-            cur.execute('''
-                INSERT INTO session_players (session_id, user_id, role, is_alive)
-                VALUES (%s, %s, %s, %s)
-            ''', (session_id, pr['user_id'], pr['role'], pr['is_alive']))
+            cur.execute(SESSION_PLAYER_SQL, {
+                'session_id': session_id, 'user_id': pr['user_id'], 'role': pr['role'],
+                'is_alive': pr['is_alive']
+            })
         
-        cur.execute('''
-            UPDATE rooms 
-            SET status = %s, active_session_id = %s 
-            WHERE id = %s
-        ''', ('in_game', session_id, room_id))
+        cur.execute(GAME_ROOM_SQL, {'status': 'in_game', 'session_id': session_id, 'room_id': room_id})
         
         conn.commit()
+        prime_session_bonuses(session_id)
+        metrics.inc('mafia_games_started_total')
         
         return {
             'statusCode': 200,
@@ -498,9 +564,7 @@ def handle_game(event, cur, conn):
                 'isBase64Encoded': False
             }
         
-        cur.execute('''
-            SELECT phase, day_number FROM game_sessions WHERE id = %s
-        ''', (session_id,))
+        cur.execute(VOTE_SESSION_SQL, {'session_id': session_id})
         
         game = cur.fetchone()
         if not game:
@@ -513,17 +577,17 @@ def handle_game(event, cur, conn):
         
         phase, day_number = game
         
-        cur.execute('''
-            DELETE FROM votes 
-            WHERE session_id = %s AND voter_id = %s AND day_number = %s AND phase = %s
-        ''', (session_id, user_id, day_number, phase))
+        cur.execute(VOTE_DELETE_SQL, {
+            'session_id': session_id, 'voter_id': user_id, 'day_number': day_number, 'phase': phase
+        })
         
-        cur.execute('''
-            INSERT INTO votes (session_id, voter_id, target_id, phase, day_number)
-            VALUES (%s, %s, %s, %s, %s)
-        ''', (session_id, user_id, target_id, phase, day_number))
+        cur.execute(VOTE_INSERT_SQL, {
+            'session_id': session_id, 'voter_id': user_id, 'target_id': target_id, 'phase': phase,
+            'day_number': day_number
+        })
         
         conn.commit()
+        metrics.inc('mafia_votes_total', {'phase': phase})
         
         return {
             'statusCode': 200,
@@ -0,0 +1,41 @@
+from cache import TTLCache
+
+# Карта активных бонусов сессии {user_id: bonus_type}; TTL страхует от активаций в других контейнерах
+_effects = TTLCache(ttl=30)
+
+SESSION_BONUSES_SQL = '''
+    SELECT user_id, bonus_type
+    FROM game_active_bonuses
+    WHERE session_id = %(session_id)s
+'''
+
+def load_session_bonuses(cur, session_id):
+    '''Загрузка активных бонусов сессии одним запросом'''
+    cur.execute(SESSION_BONUSES_SQL, {'session_id': session_id})
+    effects = {row[0]: row[1] for row in cur.fetchall()}
+    _effects.set(int(session_id), effects)
+    return effects
+
+def get_session_bonuses(cur, session_id):
+    '''Карта бонусов сессии из кэша, при промахе — из базы'''
+    effects = _effects.get(int(session_id))
+    if effects is None:
+        effects = load_session_bonuses(cur, session_id)
+    return effects
+
+def prime_session_bonuses(session_id):
+    '''Пустая карта для только что созданной сессии, без запроса к базе'''
+    _effects.set(int(session_id), {})
+
+def record_activation(session_id, user_id, bonus_type):
+    '''Обновление карты при активации бонуса посреди игры'''
+    effects = _effects.get(int(session_id))
+    if effects is not None:
+        effects[user_id] = bonus_type
+
+def drop_session_bonuses(session_id):
+    _effects.invalidate(int(session_id))
+
+def has_bonus(effects, user_id, bonus_type):
+    '''Проверка эффекта за O(1) при разрешении голосования и ночи'''
+    return effects.get(user_id) == bonus_type
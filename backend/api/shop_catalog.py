@@ -0,0 +1,79 @@
+import hashlib
+import json
+import threading
+import time
+
+# Каталог меняется только админскими POST/DELETE; TTL ограничивает расхождение между контейнерами
+CATALOG_TTL = 60
+
+_lock = threading.Lock()
+_catalog = {'version': 0, 'loaded_at': 0.0, 'body': None, 'etag': None}
+
+CATALOG_SQL = '''
+    SELECT id, name, description, price, image_url, is_available
+    FROM shop_items WHERE is_available = TRUE
+    ORDER BY created_at DESC
+'''
+
+def cached_catalog():
+    '''Закэшированный каталог (body, etag) или None, если его нужно перечитать'''
+    with _lock:
+        if _catalog['body'] is None or time.monotonic() - _catalog['loaded_at'] > CATALOG_TTL:
+            return None
+        return _catalog['body'], _catalog['etag']
+
+def load_catalog(cur):
+    '''Чтение доступных товаров и сборка тела ответа с ETag'''
+    with _lock:
+        version = _catalog['version']
+    
+    cur.execute(CATALOG_SQL)
+    items = cur.fetchall()
+    item_list = [{
+        'id': i[0], 'name': i[1], 'description': i[2],
+        'price': i[3], 'image_url': i[4], 'is_available': i[5]
+    } for i in items]
+    
+    body = json.dumps({'items': item_list})
+    # ETag от содержимого одинаков во всех контейнерах с одинаковым каталогом
+    etag = '"' + hashlib.sha1(body.encode()).hexdigest()[:20] + '"'
+    
+    with _lock:
+        # Запись во время чтения увеличила версию — не кэшируем возможно устаревший результат
+        if _catalog['version'] == version:
+            _catalog.update({'loaded_at': time.monotonic(), 'body': body, 'etag': etag})
+    return body, etag
+
+def bump_catalog_version():
+    '''Инвалидация после изменения каталога'''
+    with _lock:
+        _catalog['version'] += 1
+        _catalog['body'] = None
+        _catalog['etag'] = None
+
+def catalog_response(event, body, etag):
+    '''Ответ каталога с поддержкой If-None-Match'''
+    headers = event.get('headers') or {}
+    if_none_match = headers.get('If-None-Match') or headers.get('if-none-match')
+    response_headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag',
+        'Cache-Control': 'no-cache',
+        'ETag': etag
+    }
+    
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return {
+            'statusCode': 304,
+            'headers': response_headers,
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    return {
+        'statusCode': 200,
+        'headers': response_headers,
+        'body': body,
+        'isBase64Encoded': False
+    }
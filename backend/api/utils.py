@@ -1,18 +1,42 @@
-import jwt
-import os
+from tokens import (
+    ACCESS_TOKEN_TTL, REFRESH_TOKEN_TTL, REVOCATIONS_SQL, decode_token, display_name,
+    is_access_revoked, issue_tokens, refresh_revocations, remember_revocation
+)
 
 def verify_token(token):
     '''Проверка JWT токена'''
-    try:
-        jwt_secret = os.environ.get('JWT_SECRET')
-        payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
-        return payload.get('user_id')
-    except:
-        return None
-
-def check_admin(user_id, cur):
-    '''Проверка прав администратора'''
-    cur.execute('SELECT is_admin FROM users WHERE id = %s', (user_id,))
+    payload = decode_token(token)
+    return payload.get('user_id') if payload else None
+
+REVOKE_TOKENS_SQL = '''
+    INSERT INTO token_revocations (user_id, access_revoked_before, refresh_revoked_before)
+    VALUES (%(user_id)s, date_trunc('second', NOW()), CASE WHEN %(refresh)s THEN date_trunc('second', NOW()) END)
+    ON CONFLICT (user_id) DO UPDATE SET
+        access_revoked_before = EXCLUDED.access_revoked_before,
+        refresh_revoked_before = COALESCE(EXCLUDED.refresh_revoked_before, token_revocations.refresh_revoked_before)
+    RETURNING EXTRACT(EPOCH FROM access_revoked_before)
+'''
+
+def revoke_tokens(cur, user_id, refresh=False):
+    '''Отзыв access-токенов пользователя (и refresh при refresh=True)'''
+    cur.execute(REVOKE_TOKENS_SQL, {'user_id': user_id, 'refresh': refresh})
+    remember_revocation(user_id, cur.fetchone()[0])
+
+CHECK_ADMIN_SQL = '''
+    SELECT is_admin FROM users WHERE id = %(user_id)s
+'''
+
+def check_admin(user_id, cur, claims=None):
+    '''Проверка прав администратора.
+
+    Флаг is_admin из access-токена принимается без базы: при снятии
+    прав токены отзываются. Отрицательный или отсутствующий флаг
+    перепроверяется по базе, чтобы только что назначенный админ не
+    ждал нового токена.
+    '''
+    if claims is not None and claims.get('is_admin'):
+        return True
+    cur.execute(CHECK_ADMIN_SQL, {'user_id': user_id})
     result = cur.fetchone()
     return result and result[0]
 
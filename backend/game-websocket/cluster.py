@@ -0,0 +1,353 @@
+'''Шардирование комнат между процессами автономного сервера (server.py)
+
+Каждая комната живёт ровно в одном воркере — владельце по согласованному
+хешированию (sharding.HashRing). Клиент подключается к любому воркеру;
+этот воркер становится для соединения «краем»: держит сокет и, как только
+клиент входит в чужую комнату, пересылает его сообщения владельцу по
+внутреннему каналу, а владелец шлёт кадры клиенту обратно через край.
+Клиенты, знающие раскладку, подключаются сразу к владельцу и пересылки нет.
+
+Состав кластера задаётся JSON-файлом и перечитывается по SIGHUP. Комнаты,
+сменившие владельца, передаются новому вместе с журналом событий, а их
+соединения перепривязываются без переподключения клиентов:
+
+    {"host": "127.0.0.1", "workers": {"w1": {"port": 8801, "peer_port": 9801}, ...}}
+
+Канал между воркерами открыт только своим: первым кадром сосед предъявляет
+общий секрет WS_CLUSTER_SECRET, без него соединение закрывается. Без секрета
+порт соседей допускается только на loopback.
+'''
+import asyncio
+import hmac
+import ipaddress
+import json
+import os
+import struct
+import time
+
+import index
+import game_store
+from flow_control import RESYNC_FRAME
+from room_state import Room
+from sharding import HashRing
+
+# Кадр канала между воркерами: длина данных, тип, длина connection_id
+HEADER = struct.Struct('!IBH')
+
+HELLO, CONNECT, ATTACH, MESSAGE, DISCONNECT, DELIVER, REROUTE, BOUNCE, ADOPT = range(1, 10)
+
+# Порог буфера канала к соседу: выше него кадры владельца копятся в очередях соединений
+LINK_HIGH_WATER = 4 * 1024 * 1024
+CONNECT_RETRIES = 20
+CONNECT_RETRY_DELAY = 0.25
+# Общий секрет воркеров кластера; launch_workers в server.py создаёт его сам
+CLUSTER_SECRET = os.environ.get('WS_CLUSTER_SECRET', '')
+# Кадр HELLO короткий: больший от неизвестного соседа не читается
+HELLO_MAX_LENGTH = 1024
+
+def load_config(path):
+    with open(path) as config_file:
+        return json.load(config_file)
+
+def encode_json(data):
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def routed_room(text):
+    '''room_id из join_room или resume — только эти действия меняют владельца соединения'''
+    if '"room_id"' not in text:
+        return None
+    try:
+        body = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(body, dict) or body.get('action') not in ('join_room', 'resume'):
+        return None
+    return body.get('room_id') or None
+
+class PeerLink:
+    '''Исходящий канал к другому воркеру; кадры до установки соединения копятся в памяти'''
+    
+    def __init__(self, node, worker_id, host, port):
+        self.node = node
+        self.worker_id = worker_id
+        self.writer = None
+        self.pending = []
+        # Соединения, чьи кадры ждут слива буфера канала
+        self.blocked = set()
+        self.wake = asyncio.Event()
+        self.task = asyncio.ensure_future(self.run(host, port))
+    
+    def send(self, kind, connection_id='', payload=b''):
+        cid = connection_id.encode()
+        frame = HEADER.pack(len(payload), kind, len(cid)) + cid + payload
+        if self.writer is None:
+            self.pending.append(frame)
+        else:
+            self.writer.write(frame)
+    
+    def busy(self):
+        return self.writer is None or self.writer.transport.get_write_buffer_size() > LINK_HIGH_WATER
+    
+    async def run(self, host, port):
+        for attempt in range(CONNECT_RETRIES):
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+                break
+            except OSError:
+                await asyncio.sleep(CONNECT_RETRY_DELAY * (attempt + 1))
+        else:
+            self.node.link_lost(self)
+            return
+        hello = encode_json({'worker_id': self.node.worker_id, 'secret': CLUSTER_SECRET})
+        writer.write(HEADER.pack(len(hello), HELLO, 0) + hello)
+        writer.writelines(self.pending)
+        self.pending = []
+        self.writer = writer
+        drainer = asyncio.ensure_future(self.drain_blocked())
+        try:
+            # Сосед ничего не шлёт в этот канал: конец чтения означает его остановку
+            await reader.read()
+        except ConnectionError:
+            pass
+        finally:
+            drainer.cancel()
+            self.node.link_lost(self)
+    
+    async def drain_blocked(self):
+        '''Досылает очереди соединений, упёршихся в буфер канала'''
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            await self.writer.drain()
+            blocked, self.blocked = self.blocked, set()
+            for connection_id in blocked:
+                index.drain_connection(connection_id)
+
+class ClusterNode:
+    '''Маршрутизация соединений по владельцам комнат и передача комнат при смене состава'''
+    
+    def __init__(self, server, worker_id, config):
+        self.server = server
+        self.worker_id = worker_id
+        self.config = config
+        self.ring = HashRing(config['workers'])
+        # Адреса не забываются: выведенный из кольца воркер остаётся краем для своих клиентов
+        self.addresses = dict(config['workers'])
+        self.links = {}
+        # Соединения этого края, пересылаемые другому воркеру: connection_id -> worker_id
+        self.routes = {}
+        # Пользователь и имя из токена каждого клиентского сокета этого края: connection_id -> (user_id, user_name)
+        self.users = {}
+        # Соединения, пришедшие с других краёв: connection_id -> worker_id края
+        self.remote = {}
+    
+    def owner(self, room_id):
+        return self.ring.owner(room_id)
+    
+    def link(self, worker_id):
+        link = self.links.get(worker_id)
+        if link is None:
+            spec = self.addresses[worker_id]
+            host = spec.get('host', self.config.get('host', '127.0.0.1'))
+            link = self.links[worker_id] = PeerLink(self, worker_id, host, spec['peer_port'])
+        return link
+    
+    def link_lost(self, link):
+        '''Сосед недоступен: его клиенты на этом крае закрываются и переподключатся'''
+        if self.links.get(link.worker_id) is link:
+            del self.links[link.worker_id]
+        for connection_id, target in list(self.routes.items()):
+            if target == link.worker_id:
+                del self.routes[connection_id]
+                self.server.close_client(connection_id)
+        for connection_id, edge in list(self.remote.items()):
+            if edge == link.worker_id:
+                del self.remote[connection_id]
+                index.handler(self.server.make_event('DISCONNECT', connection_id), None)
+    
+    # Сторона края: сокеты клиентов этого процесса
+    
+    def client_connected(self, connection_id):
+        record = index.connections[connection_id]
+        self.users[connection_id] = (record['user_id'], record['user_name'])
+    
+    def client_message(self, connection_id, text):
+        room_id = routed_room(text)
+        if room_id is not None:
+            self.route(connection_id, self.owner(room_id))
+        target = self.routes.get(connection_id)
+        if target is None:
+            self.server.dispatch_message(connection_id, text)
+        else:
+            self.link(target).send(MESSAGE, connection_id, text.encode('utf-8'))
+    
+    def client_closed(self, connection_id):
+        self.users.pop(connection_id, None)
+        target = self.routes.pop(connection_id, None)
+        if target is None:
+            index.handler(self.server.make_event('DISCONNECT', connection_id), None)
+        else:
+            self.link(target).send(DISCONNECT, connection_id)
+    
+    def route(self, connection_id, owner):
+        '''Перевод соединения к владельцу новой комнаты; прежний владелец видит обрыв'''
+        current = self.routes.get(connection_id, self.worker_id)
+        if owner == current:
+            return
+        if current == self.worker_id:
+            index.handler(self.server.make_event('DISCONNECT', connection_id), None)
+        else:
+            self.link(current).send(DISCONNECT, connection_id)
+        self.bind(connection_id, owner)
+    
+    def bind(self, connection_id, owner, room_id=None):
+        '''Регистрация соединения у владельца; с room_id — сразу в переехавшей комнате'''
+        user_id, user_name = self.users[connection_id]
+        if owner == self.worker_id:
+            self.routes.pop(connection_id, None)
+            index.register_connection(connection_id, user_id, user_name)
+            if room_id is not None:
+                index.attach_connection(connection_id, room_id)
+            return
+        self.routes[connection_id] = owner
+        link = self.link(owner)
+        link.send(CONNECT, connection_id, encode_json({'user_id': user_id, 'user_name': user_name}))
+        if room_id is not None:
+            link.send(ATTACH, connection_id, encode_json({'room_id': room_id}))
+    
+    # Сторона владельца: соединения, пришедшие с других краёв
+    
+    def post_to_connection(self, connection_id, payload):
+        '''Транспорт для соединений чужих краёв; False, пока канал к краю переполнен'''
+        edge = self.remote.get(connection_id)
+        if edge is None:
+            return True
+        link = self.link(edge)
+        if link.busy():
+            link.blocked.add(connection_id)
+            link.wake.set()
+            return False
+        link.send(DELIVER, connection_id, payload)
+        return True
+    
+    async def handle_peer(self, reader, writer):
+        '''Входящий канал от соседа: первым кадром он называет себя и предъявляет секрет
+        
+        Любой другой первый кадр или неверный секрет закрывает канал: кадры
+        CONNECT от чужого процесса регистрировали бы соединения с любым user_id.
+        '''
+        try:
+            length, kind, cid_length = HEADER.unpack(await reader.readexactly(HEADER.size))
+            if kind != HELLO or cid_length or length > HELLO_MAX_LENGTH:
+                return
+            peer = self.authenticate_peer(await reader.readexactly(length))
+            if peer is None:
+                return
+            while True:
+                length, kind, cid_length = HEADER.unpack(await reader.readexactly(HEADER.size))
+                connection_id = (await reader.readexactly(cid_length)).decode() if cid_length else ''
+                payload = await reader.readexactly(length) if length else b''
+                self.on_peer_frame(peer, kind, connection_id, payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    
+    def authenticate_peer(self, payload):
+        '''worker_id соседа из кадра HELLO или None, если секрет не совпал'''
+        try:
+            hello = json.loads(payload)
+            worker_id, secret = hello['worker_id'], hello['secret']
+        except (ValueError, TypeError, KeyError):
+            return None
+        if not isinstance(worker_id, str) or not isinstance(secret, str):
+            return None
+        if not hmac.compare_digest(secret.encode(), CLUSTER_SECRET.encode()):
+            print(f'{self.worker_id}: rejected peer {worker_id!r}: bad cluster secret', flush=True)
+            return None
+        return worker_id
+    
+    def on_peer_frame(self, peer, kind, connection_id, payload):
+        if kind == MESSAGE:
+            if connection_id in self.remote:
+                self.server.dispatch_message(connection_id, payload.decode('utf-8'))
+            else:
+                # Комната уже уехала: край отправит сообщение новому владельцу
+                self.link(peer).send(BOUNCE, connection_id, payload)
+        elif kind == DELIVER:
+            self.server.write_client(connection_id, payload)
+        elif kind == CONNECT:
+            self.remote[connection_id] = peer
+            data = json.loads(payload)
+            index.register_connection(connection_id, data['user_id'], data['user_name'])
+        elif kind == ATTACH:
+            if connection_id in self.remote:
+                index.attach_connection(connection_id, json.loads(payload)['room_id'])
+        elif kind == DISCONNECT:
+            if self.remote.pop(connection_id, None) is not None:
+                index.handler(self.server.make_event('DISCONNECT', connection_id), None)
+        elif kind == REROUTE:
+            if self.routes.get(connection_id) == peer:
+                data = json.loads(payload)
+                del self.routes[connection_id]
+                self.bind(connection_id, data['owner'], data['room_id'])
+        elif kind == BOUNCE:
+            target = self.routes.get(connection_id)
+            if target is not None and target != peer:
+                self.link(target).send(MESSAGE, connection_id, payload)
+        elif kind == ADOPT:
+            self.adopt(json.loads(payload))
+    
+    # Смена состава кластера
+    
+    def reconfigure(self, config):
+        '''Новый состав: комнаты, сменившие владельца, передаются ему'''
+        self.config = config
+        self.ring = HashRing(config['workers'])
+        self.addresses.update(config['workers'])
+        moved = [room_id for room_id in index.rooms if self.owner(room_id) != self.worker_id]
+        if moved and game_store.enabled():
+            # Новый владелец при необходимости поднимет комнату из базы в актуальном виде
+            game_store.flush_if_due(force=True)
+        for room_id in moved:
+            self.hand_off(room_id, self.owner(room_id))
+        return len(moved)
+    
+    def hand_off(self, room_id, target):
+        index.outbox.flush_room(room_id)
+        room = index.rooms.pop(room_id)
+        link = self.link(target)
+        link.send(ADOPT, '', encode_json(room.handoff_state()))
+        for connection_id in list(room.connection_ids()):
+            record = index.connections.pop(connection_id, None)
+            # Неотправленные кадры не переезжают: клиент докачает их через resume
+            lagging = record is not None and bool(record['queue'])
+            edge = self.remote.pop(connection_id, None)
+            if edge is not None:
+                edge_link = self.link(edge)
+                if lagging:
+                    edge_link.send(DELIVER, connection_id, RESYNC_FRAME)
+                edge_link.send(REROUTE, connection_id, encode_json({'room_id': room_id, 'owner': target}))
+            elif connection_id in self.users:
+                if lagging:
+                    self.server.write_client(connection_id, RESYNC_FRAME)
+                self.bind(connection_id, target, room_id)
+        room.release()
+    
+    def adopt(self, state):
+        room_id = state['room_id']
+        room = index.rooms.get(room_id)
+        if room is None:
+            room = index.rooms[room_id] = Room(room_id)
+        waiting = room.adopt_state(state)
+        deadline = time.monotonic() + index.DISCONNECT_GRACE
+        for player in waiting:
+            index.departures.append((deadline, room_id, player.user_id, player.disconnected_at))
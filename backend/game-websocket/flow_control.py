@@ -0,0 +1,86 @@
+import os
+import time
+from collections import deque
+
+def positive_setting(name, default, cast=float):
+    '''Числовая настройка лимита; ноль или отрицательное значение — ошибка конфигурации при запуске'''
+    value = cast(os.environ.get(name, default))
+    if value <= 0:
+        raise ValueError(f'{name} must be positive, got {value}')
+    return value
+
+# Лимиты входящих сообщений: постоянная скорость в секунду и допустимый всплеск
+CONNECTION_RATE = positive_setting('WS_CONNECTION_RATE', '5')
+CONNECTION_BURST = positive_setting('WS_CONNECTION_BURST', '10')
+ROOM_RATE = positive_setting('WS_ROOM_RATE', '60')
+ROOM_BURST = positive_setting('WS_ROOM_BURST', '120')
+
+# Кадров в очереди медленного получателя; при переполнении очередь заменяется одним resync
+OUTBOUND_QUEUE_SIZE = positive_setting('WS_OUTBOUND_QUEUE_SIZE', '64', int)
+RESYNC_FRAME = b'{"type":"resync"}'
+
+class TokenBucket:
+    '''Маркерная корзина: O(1) на проверку, токены пополняются по времени'''
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+    
+    def __init__(self, rate, capacity):
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def allow(self, cost=1.0, now=None):
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True
+        return False
+    
+    def retry_after(self, cost=1.0):
+        '''Через сколько секунд накопится cost токенов'''
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+class OutboundQueue:
+    '''Ограниченная очередь исходящих кадров соединения
+    
+    Если получатель не успевает забирать кадры и очередь заполнена, устаревшие
+    кадры выбрасываются целиком и заменяются одним resync: клиент докачивает
+    пропущенное через resume из журнала комнаты. До отправки resync новые
+    кадры не копятся — они всё равно придут при докачке.
+    '''
+    __slots__ = ('frames', 'limit', 'overflowed', 'dropped')
+    
+    def __init__(self, limit=OUTBOUND_QUEUE_SIZE):
+        self.frames = deque()
+        self.limit = limit
+        self.overflowed = False
+        self.dropped = 0
+    
+    def __len__(self):
+        return len(self.frames)
+    
+    def push(self, frame):
+        if self.overflowed:
+            self.dropped += 1
+            return False
+        if len(self.frames) >= self.limit:
+            self.dropped += len(self.frames) + 1
+            self.frames.clear()
+            self.frames.append(RESYNC_FRAME)
+            self.overflowed = True
+            return False
+        self.frames.append(frame)
+        return True
+    
+    def peek(self):
+        return self.frames[0] if self.frames else None
+    
+    def pop(self):
+        frame = self.frames.popleft()
+        if frame is RESYNC_FRAME:
+            self.overflowed = False
+        return frame
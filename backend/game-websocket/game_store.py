@@ -0,0 +1,272 @@
+import os
+import threading
+import time
+import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+# Состояние игр живёт в памяти и сбрасывается в game_sessions/session_players пачками
+# не чаще FLUSH_INTERVAL секунд: сообщения чата и голоса в базу не пишутся вовсе
+FLUSH_INTERVAL = float(os.environ.get('WS_FLUSH_INTERVAL', '2'))
+# Сколько раз подряд отвергнутая базой пачка возвращается в очередь, прежде чем будет отброшена
+MAX_FLUSH_FAILURES = int(os.environ.get('WS_MAX_FLUSH_FAILURES', '5'))
+
+_lock = threading.Lock()
+_pool = None
+_dirty = {}
+_finished = set()
+_state = {'flushed_at': 0.0, 'failures': 0}
+
+RESTORE_ROOM_SQL = '''
+    SELECT gs.id, gs.phase, gs.day_number, gs.started_at, sp.user_id, sp.role, sp.is_alive
+    FROM rooms r
+    JOIN game_sessions gs ON gs.id = r.active_session_id AND gs.status = 'active'
+    LEFT JOIN session_players sp ON sp.session_id = gs.id
+    WHERE r.id = %(room_id)s
+'''
+
+FINISH_SESSIONS_SQL = '''
+    UPDATE game_sessions SET status = 'finished', ended_at = CURRENT_TIMESTAMP
+    WHERE id = ANY(%(session_ids)s) AND status = 'active'
+'''
+
+KNOWN_ROOMS_SQL = '''
+    SELECT id FROM rooms WHERE id = ANY(%(room_ids)s)
+'''
+
+SESSIONS_INSERT_SQL = '''
+    INSERT INTO game_sessions (room_id, status, phase, day_number)
+    VALUES %s
+    RETURNING room_id, id
+'''
+
+SESSION_PLAYERS_INSERT_SQL = '''
+    INSERT INTO session_players (session_id, user_id, role, is_alive)
+    VALUES %s
+'''
+
+ROOMS_START_SQL = '''
+    UPDATE rooms r SET status = 'in_game', active_session_id = v.session_id
+    FROM (VALUES %s) AS v(room_id, session_id)
+    WHERE r.id = v.room_id
+'''
+
+SESSIONS_UPDATE_SQL = '''
+    UPDATE game_sessions gs SET phase = v.phase, day_number = v.day_number
+    FROM (VALUES %s) AS v(id, phase, day_number)
+    WHERE gs.id = v.id
+'''
+SESSIONS_UPDATE_TEMPLATE = '(%s::int, %s, %s::int)'
+
+PLAYERS_ALIVE_SQL = '''
+    UPDATE session_players sp SET is_alive = v.is_alive
+    FROM (VALUES %s) AS v(session_id, user_id, is_alive)
+    WHERE sp.session_id = v.session_id AND sp.user_id = v.user_id
+      AND sp.is_alive IS DISTINCT FROM v.is_alive
+'''
+PLAYERS_ALIVE_TEMPLATE = '(%s::int, %s::int, %s::boolean)'
+
+def enabled():
+    '''Без DATABASE_URL (локальные бенчмарки) состояние остаётся только в памяти'''
+    return bool(os.environ.get('DATABASE_URL'))
+
+def get_pool():
+    '''Пул соединений живёт, пока контейнер функции тёплый'''
+    global _pool
+    if _pool is None:
+        # Автономный сервер обращается к базе из нескольких потоков пула
+        with _lock:
+            if _pool is None:
+                _pool = ThreadedConnectionPool(
+                    1,
+                    int(os.environ.get('DB_POOL_MAX', '5')),
+                    os.environ.get('DATABASE_URL')
+                )
+    return _pool
+
+def db_room_id(room_id):
+    '''id комнаты в таблице rooms; комнаты без числового id не сохраняются'''
+    try:
+        return int(room_id)
+    except (TypeError, ValueError):
+        return None
+
+def mark_dirty(room):
+    '''Комната изменилась и будет записана при следующем сбросе'''
+    if enabled() and db_room_id(room.room_id) is not None:
+        with _lock:
+            _dirty[room.room_id] = room
+
+def finish_session(session_id):
+    '''Предыдущая сессия комнаты завершается при старте новой'''
+    if enabled() and session_id:
+        with _lock:
+            _finished.add(session_id)
+
+def load_room_state(room_id):
+    '''Строки активной игры комнаты из базы, один запрос; блокирует, сервер вызывает его вне цикла событий'''
+    room_id = db_room_id(room_id)
+    if not enabled() or room_id is None:
+        return []
+    
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        cur = conn.cursor()
+        cur.execute(RESTORE_ROOM_SQL, {'room_id': room_id})
+        rows = cur.fetchall()
+        conn.rollback()
+        cur.close()
+    finally:
+        pool.putconn(conn)
+    return rows
+
+def apply_room_state(room, rows):
+    '''Перенос строк load_room_state в комнату'''
+    if not rows:
+        return False
+    
+    session_id, phase, day_number, started_at = rows[0][:4]
+    room.session_id = session_id
+    room.game_state = {
+        'phase': phase,
+        'day_number': day_number,
+        'started_at': started_at.isoformat() if started_at else None
+    }
+    room.roles = {row[4]: [row[5], row[6]] for row in rows if row[4] is not None}
+    return True
+
+def restore_room(room):
+    '''Восстановление активной игры комнаты после холодного старта'''
+    return apply_room_state(room, load_room_state(room.room_id))
+
+class RoomSnapshot:
+    '''Копия того, что пишется в базу: запись идёт вне потока, который меняет комнаты'''
+    __slots__ = ('room', 'room_id', 'session_id', 'game_state', 'phase', 'day_number', 'roles')
+    
+    def __init__(self, room):
+        self.room = room
+        self.room_id = db_room_id(room.room_id)
+        self.session_id = room.session_id
+        self.game_state = room.game_state
+        self.phase = room.game_state['phase']
+        self.day_number = room.game_state['day_number']
+        self.roles = [(user_id, role, alive) for user_id, (role, alive) in room.roles.items()]
+
+def take_batch(force=False):
+    '''Накопленные изменения, если прошёл FLUSH_INTERVAL, или None
+
+    Снимок комнат делается в том потоке, который их меняет; write_pending
+    после этого можно выполнять в любом потоке.
+    '''
+    now = time.monotonic()
+    if not force and now - _state['flushed_at'] < FLUSH_INTERVAL:
+        return None
+    with _lock:
+        if not _dirty and not _finished:
+            return None
+        dirty = list(_dirty.values())
+        finished = list(_finished)
+        _dirty.clear()
+        _finished.clear()
+    _state['flushed_at'] = now
+    return [RoomSnapshot(room) for room in dirty if room.game_state], finished
+
+def write_pending(batch):
+    '''Запись пачки из take_batch одной транзакцией; пары (снимок, id новой сессии) или None при сбое'''
+    snapshots, finished = batch
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        assigned = write_batch(conn.cursor(), snapshots, finished)
+        conn.commit()
+    except psycopg2.Error as error:
+        conn.rollback()
+        # Изменения вернутся в очередь и уйдут при следующем сбросе; обработку сообщений сбой базы не ломает.
+        # Недоступная база ждётся сколько угодно, а пачка, которую база отвергает
+        # MAX_FLUSH_FAILURES раз подряд, отбрасывается, чтобы не повторять её вечно
+        if not isinstance(error, psycopg2.OperationalError):
+            _state['failures'] += 1
+        if _state['failures'] < MAX_FLUSH_FAILURES:
+            with _lock:
+                for snapshot in snapshots:
+                    _dirty.setdefault(snapshot.room.room_id, snapshot.room)
+                _finished.update(finished)
+        else:
+            _state['failures'] = 0
+        return None
+    finally:
+        pool.putconn(conn)
+    _state['failures'] = 0
+    return assigned
+
+def assign_sessions(assigned):
+    '''id сессий присваиваются только после коммита: после отката комната создаст сессию заново
+
+    Если за время записи в комнате началась новая игра, id старой ей не достаётся,
+    а сама старая сессия завершается следующей пачкой, чтобы не остаться активной.
+    '''
+    for snapshot, session_id in assigned:
+        room = snapshot.room
+        if room.session_id is None and room.game_state is snapshot.game_state:
+            room.session_id = session_id
+        else:
+            finish_session(session_id)
+
+def flush_if_due(force=False):
+    '''Сброс накопленных изменений, если прошёл FLUSH_INTERVAL'''
+    batch = take_batch(force)
+    if batch is None:
+        return 0
+    assigned = write_pending(batch)
+    if assigned is None:
+        return 0
+    assign_sessions(assigned)
+    return len(batch[0])
+
+def write_batch(cur, snapshots, finished):
+    '''Запись пачки комнат: новые сессии, фазы и состояние игроков, по запросу на таблицу
+    
+    Возвращает пары (снимок, id новой сессии) для assign_sessions.
+    '''
+    if finished:
+        cur.execute(FINISH_SESSIONS_SQL, {'session_ids': finished})
+    
+    started = []
+    updated = []
+    for snapshot in snapshots:
+        (started if snapshot.session_id is None else updated).append(snapshot)
+    
+    if started:
+        # room_id приходит от клиента: игра в комнате, которой нет в rooms, нарушила бы внешний ключ
+        # и откатывала всю пачку при каждом сбросе, поэтому такие игры остаются только в памяти
+        cur.execute(KNOWN_ROOMS_SQL, {'room_ids': [snapshot.room_id for snapshot in started]})
+        known = {row[0] for row in cur.fetchall()}
+        started = [snapshot for snapshot in started if snapshot.room_id in known]
+    
+    assigned = []
+    if started:
+        created = execute_values(cur, SESSIONS_INSERT_SQL, [
+            (snapshot.room_id, 'active', snapshot.phase, snapshot.day_number) for snapshot in started
+        ], fetch=True)
+        session_ids = dict(created)
+        assigned = [(snapshot, session_ids[snapshot.room_id]) for snapshot in started]
+        
+        execute_values(cur, SESSION_PLAYERS_INSERT_SQL, [
+            (session_id, user_id, role, alive)
+            for snapshot, session_id in assigned for user_id, role, alive in snapshot.roles
+        ])
+        
+        execute_values(cur, ROOMS_START_SQL, [(snapshot.room_id, session_id) for snapshot, session_id in assigned])
+    
+    if updated:
+        execute_values(cur, SESSIONS_UPDATE_SQL, [
+            (snapshot.session_id, snapshot.phase, snapshot.day_number) for snapshot in updated
+        ], template=SESSIONS_UPDATE_TEMPLATE)
+        
+        execute_values(cur, PLAYERS_ALIVE_SQL, [
+            (snapshot.session_id, user_id, alive)
+            for snapshot in updated for user_id, _, alive in snapshot.roles
+        ], template=PLAYERS_ALIVE_TEMPLATE)
+    
+    return assigned
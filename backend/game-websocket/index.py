@@ -1,10 +1,33 @@
 import json
 import os
-import psycopg2
+import time
+from collections import deque
 from datetime import datetime
+from room_state import Room, sweep_rooms
+from outbox import Outbox
+from flow_control import TokenBucket, OutboundQueue, CONNECTION_RATE, CONNECTION_BURST
+import game_store
+from ws_auth import authenticate
+
+# Полный список игроков рассылается каждые N изменений состава, между ними — только дельты
+FULL_SYNC_EVERY = int(os.environ.get('WS_FULL_SYNC_EVERY', '10'))
+
+# Сколько секунд оборвавшийся игрок считается в комнате и может вернуться через resume
+DISCONNECT_GRACE = int(os.environ.get('WS_DISCONNECT_GRACE', '30'))
+
+# Действия, которые дополнительно списываются с общего лимита комнаты
+ROOM_LIMITED_ACTIONS = {'send_message', 'vote'}
 
 connections = {}
 rooms = {}
+# (срок, room_id, user_id, disconnected_at) в порядке обрывов: льготный период одинаков,
+# поэтому сроки идут по возрастанию и проверка — просмотр начала очереди
+departures = deque()
+# server.py обращается к базе сам, вне цикла событий, и выключает эти обращения в обработчике
+db_in_handler = True
+# Облачная функция отправляет склеенные события до ответа: после него контейнер может
+# быть заморожен. server.py выключает это и сбрасывает outbox по таймеру из цикла событий
+flush_outbox_on_return = True
 
 def handler(event: dict, context) -> dict:
     '''WebSocket API для real-time игры в Мафию'''
@@ -13,25 +36,40 @@ def handler(event: dict, context) -> dict:
     event_type = request_context.get('eventType', 'MESSAGE')
     connection_id = request_context.get('connectionId', '')
     
+    outbox.flush_due()
+    expire_departures()
+    sweep_rooms(rooms)
+    
     if event_type == 'CONNECT':
-        return handle_connect(connection_id)
+        response = handle_connect(connection_id, event)
     elif event_type == 'DISCONNECT':
-        return handle_disconnect(connection_id)
+        response = handle_disconnect(connection_id)
     elif event_type == 'MESSAGE':
-        return handle_message(connection_id, event)
+        response = handle_message(connection_id, event)
+    else:
+        response = {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Unknown event type'}),
+            'isBase64Encoded': False
+        }
     
-    return {
-        'statusCode': 400,
-        'body': json.dumps({'error': 'Unknown event type'}),
-        'isBase64Encoded': False
-    }
+    if flush_outbox_on_return:
+        outbox.flush_all()
+    if db_in_handler and game_store.enabled():
+        game_store.flush_if_due()
+    return response
 
-def handle_connect(connection_id: str) -> dict:
-    connections[connection_id] = {
-        'connected_at': datetime.now().isoformat(),
-        'room_id': None,
-        'user_id': None
-    }
+def handle_connect(connection_id: str, event: dict) -> dict:
+    # Токен проверяется один раз; дальше личность и имя берутся из записи соединения, а не из сообщений
+    claims = authenticate(event)
+    if not claims:
+        return {
+            'statusCode': 401,
+            'body': json.dumps({'error': 'Invalid or missing token'}),
+            'isBase64Encoded': False
+        }
+    
+    register_connection(connection_id, claims['user_id'], claims.get('name') or 'Guest')
     
     return {
         'statusCode': 200,
@@ -39,21 +77,32 @@ def handle_connect(connection_id: str) -> dict:
         'isBase64Encoded': False
     }
 
+def register_connection(connection_id: str, user_id: int, user_name: str) -> dict:
+    '''Запись соединения уже проверенного пользователя; user_name из его токена'''
+    record = connections[connection_id] = {
+        'connected_at': datetime.now().isoformat(),
+        'room_id': None,
+        'user_id': user_id,
+        'user_name': user_name,
+        'limiter': TokenBucket(CONNECTION_RATE, CONNECTION_BURST),
+        'queue': OutboundQueue()
+    }
+    return record
+
 def handle_disconnect(connection_id: str) -> dict:
     if connection_id in connections:
         conn_data = connections[connection_id]
         room_id = conn_data.get('room_id')
         
         if room_id and room_id in rooms:
-            rooms[room_id]['players'] = [
-                p for p in rooms[room_id]['players'] 
-                if p['connection_id'] != connection_id
-            ]
-            
-            broadcast_to_room(room_id, {
-                'type': 'player_left',
-                'players': rooms[room_id]['players']
-            })
+            player = rooms[room_id].detach(connection_id)
+            if player:
+                departures.append((time.monotonic() + DISCONNECT_GRACE, room_id, player.user_id, player.disconnected_at))
+                broadcast_to_room(room_id, {
+                    'type': 'player_status',
+                    'user_id': player.user_id,
+                    'connected': False
+                })
         
         del connections[connection_id]
     
@@ -68,8 +117,14 @@ def handle_message(connection_id: str, event: dict) -> dict:
         body = json.loads(event.get('body', '{}'))
         action = body.get('action')
         
+        limited = check_rate_limit(connection_id, action)
+        if limited:
+            return limited
+        
         if action == 'join_room':
             return handle_join_room(connection_id, body)
+        elif action == 'resume':
+            return handle_resume(connection_id, body)
         elif action == 'leave_room':
             return handle_leave_room(connection_id)
         elif action == 'send_message':
@@ -93,49 +148,146 @@ def handle_message(connection_id: str, event: dict) -> dict:
             'isBase64Encoded': False
         }
 
+def check_rate_limit(connection_id: str, action: str):
+    '''Ответ 429, если соединение или комната превысили лимит сообщений'''
+    record = connections.get(connection_id)
+    if record is None:
+        return None
+    
+    limiter = record['limiter']
+    if limiter.allow():
+        if action not in ROOM_LIMITED_ACTIONS:
+            return None
+        room = rooms.get(record['room_id'])
+        if room is None or room.limiter.allow():
+            return None
+        limiter = room.limiter
+    
+    return {
+        'statusCode': 429,
+        'body': json.dumps({'error': 'Rate limit exceeded', 'retry_after': round(limiter.retry_after(), 3)}),
+        'isBase64Encoded': False
+    }
+
+def authorized_user(connection_id: str, body: dict):
+    '''(user_id, None) из проверенного при подключении токена или (None, ответ с ошибкой)'''
+    if connection_id not in connections:
+        return None, {'statusCode': 404, 'body': json.dumps({'error': 'Connection not found'}), 'isBase64Encoded': False}
+    
+    user_id = connections[connection_id]['user_id']
+    claimed = body.get('user_id')
+    if claimed is not None and claimed != user_id:
+        return None, {
+            'statusCode': 403,
+            'body': json.dumps({'error': 'user_id does not match token'}),
+            'isBase64Encoded': False
+        }
+    return user_id, None
+
 def handle_join_room(connection_id: str, body: dict) -> dict:
     room_id = body.get('room_id')
-    user_id = body.get('user_id')
-    user_name = body.get('user_name')
     
-    if not room_id or not user_id:
+    if not room_id:
         return {
             'statusCode': 400,
-            'body': json.dumps({'error': 'Missing room_id or user_id'}),
+            'body': json.dumps({'error': 'Missing room_id'}),
             'isBase64Encoded': False
         }
     
-    if room_id not in rooms:
-        rooms[room_id] = {
-            'players': [],
-            'game_state': None,
-            'chat': []
-        }
+    user_id, error = authorized_user(connection_id, body)
+    if error:
+        return error
     
-    connections[connection_id]['room_id'] = room_id
-    connections[connection_id]['user_id'] = user_id
+    room = get_room(room_id)
+    # Накопленные события уходят до входа: дальше вошедший получит состав на момент входа
+    outbox.flush_room(room_id)
     
-    player_exists = any(p['user_id'] == user_id for p in rooms[room_id]['players'])
+    record = connections[connection_id]
+    record['room_id'] = room_id
     
-    if not player_exists:
-        rooms[room_id]['players'].append({
-            'connection_id': connection_id,
-            'user_id': user_id,
-            'user_name': user_name,
-            'ready': False
-        })
+    player = room.join(connection_id, user_id, record['user_name'])
     
-    broadcast_to_room(room_id, {
+    broadcast_membership(room_id, {
         'type': 'player_joined',
-        'players': rooms[room_id]['players'],
-        'user_name': user_name
+        'player': player.to_public_dict(),
+        'user_name': player.user_name
+    }, exclude=connection_id)
+    
+    # Вошедший получает полный состав и свою роль, остальным достаточно дельты; seq и epoch нужны для resume
+    send_to_connection(connection_id, {
+        'type': 'players_sync',
+        'players': room.players_list(),
+        'your_role': player.role,
+        'seq': room.seq,
+        'epoch': room.epoch
     })
     
     return {
         'statusCode': 200,
         'body': json.dumps({
             'message': 'Joined room',
-            'room': rooms[room_id]
+            'room': room.to_dict(player)
+        }),
+        'isBase64Encoded': False
+    }
+
+def handle_resume(connection_id: str, body: dict) -> dict:
+    '''Возврат после обрыва: докачка пропущенных событий или полный снимок комнаты'''
+    room_id = body.get('room_id')
+    last_seq = body.get('last_seq')
+    
+    if not room_id or not isinstance(last_seq, int):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Missing room_id or last_seq'}),
+            'isBase64Encoded': False
+        }
+    
+    user_id, error = authorized_user(connection_id, body)
+    if error:
+        return error
+    
+    room = get_room(room_id)
+    # Накопленные события уходят до привязки соединения, пропущенное придёт из журнала
+    outbox.flush_room(room_id)
+    record = connections[connection_id]
+    record['room_id'] = room_id
+    
+    returning = user_id in room
+    player = room.join(connection_id, user_id, record['user_name'])
+    
+    if returning:
+        broadcast_to_room(room_id, {
+            'type': 'player_status',
+            'user_id': user_id,
+            'connected': True
+        }, exclude=connection_id)
+    else:
+        # Льготный период истёк или комната пересоздана — для остальных это обычный вход
+        broadcast_membership(room_id, {
+            'type': 'player_joined',
+            'player': player.to_public_dict(),
+            'user_name': player.user_name
+        }, exclude=connection_id)
+    
+    missed = room.events_after(last_seq) if body.get('epoch') == room.epoch else None
+    if missed is None:
+        send_to_connection(connection_id, {'type': 'room_snapshot', **room.to_dict(player)})
+    else:
+        for payload in missed:
+            send_to_connection(connection_id, payload)
+    
+    if player.role:
+        send_to_connection(connection_id, {'type': 'role_assigned', 'role': player.role})
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'message': 'Resumed',
+            'replayed': len(missed) if missed is not None else 0,
+            'snapshot': missed is None,
+            'seq': room.seq,
+            'epoch': room.epoch
         }),
         'isBase64Encoded': False
     }
@@ -148,17 +300,15 @@ def handle_leave_room(connection_id: str) -> dict:
     if not room_id or room_id not in rooms:
         return {'statusCode': 404, 'body': json.dumps({'error': 'Room not found'}), 'isBase64Encoded': False}
     
-    rooms[room_id]['players'] = [
-        p for p in rooms[room_id]['players'] 
-        if p['connection_id'] != connection_id
-    ]
+    player = rooms[room_id].leave(connection_id)
     
     connections[connection_id]['room_id'] = None
     
-    broadcast_to_room(room_id, {
-        'type': 'player_left',
-        'players': rooms[room_id]['players']
-    })
+    if player:
+        broadcast_membership(room_id, {
+            'type': 'player_left',
+            'user_id': player.user_id
+        })
     
     return {
         'statusCode': 200,
@@ -170,20 +320,20 @@ def handle_send_message(connection_id: str, body: dict) -> dict:
     if connection_id not in connections:
         return {'statusCode': 404, 'body': json.dumps({'error': 'Connection not found'}), 'isBase64Encoded': False}
     
-    room_id = connections[connection_id].get('room_id')
-    user_name = body.get('user_name')
+    record = connections[connection_id]
+    room_id = record.get('room_id')
     message = body.get('message')
     
     if not room_id or room_id not in rooms:
         return {'statusCode': 404, 'body': json.dumps({'error': 'Room not found'}), 'isBase64Encoded': False}
     
     chat_message = {
-        'user_name': user_name,
+        'user_name': record['user_name'],
         'message': message,
         'timestamp': datetime.now().isoformat()
     }
     
-    rooms[room_id]['chat'].append(chat_message)
+    rooms[room_id].add_chat(chat_message)
     
     broadcast_to_room(room_id, {
         'type': 'new_message',
@@ -207,11 +357,12 @@ def handle_vote(connection_id: str, body: dict) -> dict:
     if not room_id or room_id not in rooms:
         return {'statusCode': 404, 'body': json.dumps({'error': 'Room not found'}), 'isBase64Encoded': False}
     
+    # Переголосование в пределах окна склейки заменяет прежний голос этого игрока
     broadcast_to_room(room_id, {
         'type': 'vote_cast',
         'voter_id': user_id,
         'target_id': target_id
-    })
+    }, coalesce_key=('vote', user_id))
     
     return {
         'statusCode': 200,
@@ -228,31 +379,36 @@ def handle_start_game(connection_id: str, body: dict) -> dict:
     if not room_id or room_id not in rooms:
         return {'statusCode': 404, 'body': json.dumps({'error': 'Room not found'}), 'isBase64Encoded': False}
     
-    players = rooms[room_id]['players']
+    room = rooms[room_id]
+    players = list(room.players())
     
     import random
     roles = ['mafia'] * (len(players) // 3) + ['sheriff'] + ['civilian'] * (len(players) - len(players) // 3 - 1)
     random.shuffle(roles)
     
     for i, player in enumerate(players):
-        player['role'] = roles[i]
-        player['alive'] = True
+        player.role = roles[i]
+        player.alive = True
     
-    rooms[room_id]['game_state'] = {
+    game_store.finish_session(room.session_id)
+    room.session_id = None
+    room.roles = {player.user_id: [player.role, player.alive] for player in players}
+    room.game_state = {
         'phase': 'night',
         'day_number': 1,
         'started_at': datetime.now().isoformat()
     }
+    game_store.mark_dirty(room)
     
     broadcast_to_room(room_id, {
         'type': 'game_started',
-        'game_state': rooms[room_id]['game_state']
+        'game_state': room.game_state
     })
     
     for player in players:
-        send_to_connection(player['connection_id'], {
+        send_to_connection(player.connection_id, {
             'type': 'role_assigned',
-            'role': player['role']
+            'role': player.role
         })
     
     return {
@@ -270,7 +426,7 @@ def handle_next_phase(connection_id: str, body: dict) -> dict:
     if not room_id or room_id not in rooms:
         return {'statusCode': 404, 'body': json.dumps({'error': 'Room not found'}), 'isBase64Encoded': False}
     
-    game_state = rooms[room_id].get('game_state')
+    game_state = rooms[room_id].game_state
     if not game_state:
         return {'statusCode': 400, 'body': json.dumps({'error': 'Game not started'}), 'isBase64Encoded': False}
     
@@ -284,6 +440,8 @@ def handle_next_phase(connection_id: str, body: dict) -> dict:
         game_state['phase'] = 'night'
         game_state['day_number'] += 1
     
+    game_store.mark_dirty(rooms[room_id])
+    
     broadcast_to_room(room_id, {
         'type': 'phase_changed',
         'game_state': game_state
@@ -295,16 +453,102 @@ def handle_next_phase(connection_id: str, body: dict) -> dict:
         'isBase64Encoded': False
     }
 
-def broadcast_to_room(room_id: str, message: dict):
-    if room_id not in rooms:
+def get_room(room_id):
+    room = rooms.get(room_id)
+    if room is None:
+        room = rooms[room_id] = Room(room_id)
+        # Контейнер мог смениться посреди игры: роли и фаза поднимаются из базы
+        if db_in_handler:
+            game_store.restore_room(room)
+    return room
+
+def attach_connection(connection_id: str, room_id) -> None:
+    '''Тихая привязка соединения к комнате, переехавшей с другого воркера кластера
+    
+    Игрок уже был в комнате на прежнем владельце, поэтому остальным ничего не рассылается.
+    '''
+    record = connections.get(connection_id)
+    if record is None:
+        return
+    room = get_room(room_id)
+    outbox.flush_room(room_id)
+    record['room_id'] = room_id
+    room.join(connection_id, record['user_id'], record['user_name'])
+
+def expire_departures():
+    '''Удаление игроков, не вернувшихся за DISCONNECT_GRACE секунд'''
+    now = time.monotonic()
+    while departures and departures[0][0] <= now:
+        _, room_id, user_id, disconnected_at = departures.popleft()
+        room = rooms.get(room_id)
+        if room is not None and room.drop_disconnected(user_id, disconnected_at):
+            broadcast_membership(room_id, {
+                'type': 'player_left',
+                'user_id': user_id
+            })
+
+def broadcast_membership(room_id: str, message: dict, exclude: str = None):
+    '''Рассылка дельты состава; каждое FULL_SYNC_EVERY-е изменение дополняется полным списком'''
+    room = rooms.get(room_id)
+    if room is None:
+        return
+    
+    broadcast_to_room(room_id, message, exclude)
+    
+    room.membership_events += 1
+    if room.membership_events % FULL_SYNC_EVERY == 0:
+        broadcast_to_room(room_id, {
+            'type': 'players_sync',
+            'players': room.players_list()
+        })
+
+def broadcast_to_room(room_id: str, message: dict, exclude: str = None, coalesce_key=None):
+    '''Рассылка события всем игрокам комнаты; JSON кодируется один раз на всех получателей
+    
+    Событие получает номер seq, попадает в журнал комнаты для докачки через resume
+    и уходит через outbox, который склеивает события комнаты за окно в один кадр.
+    '''
+    room = rooms.get(room_id)
+    if room is None:
+        return
+    
+    message['seq'] = room.next_seq()
+    payload = encode_message(message)
+    room.log_event(payload)
+    outbox.enqueue(room_id, payload, exclude, coalesce_key)
+
+def room_connections(room_id):
+    room = rooms.get(room_id)
+    return room.connection_ids() if room is not None else ()
+
+def encode_message(message: dict) -> bytes:
+    return json.dumps(message, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def send_to_connection(connection_id: str, message):
+    '''Отправка в соединение через его ограниченную очередь; принимает словарь или байты'''
+    payload = message if isinstance(message, bytes) else encode_message(message)
+    record = connections.get(connection_id)
+    if record is None:
+        post_to_connection(connection_id, payload)
+        return
+    
+    record['queue'].push(payload)
+    drain_connection(connection_id)
+
+def drain_connection(connection_id: str):
+    '''Отправка кадров из очереди, пока транспорт их принимает'''
+    record = connections.get(connection_id)
+    if record is None:
         return
     
-    for player in rooms[room_id]['players']:
-        send_to_connection(player['connection_id'], message)
+    queue = record['queue']
+    while queue:
+        if post_to_connection(connection_id, queue.peek()) is False:
+            break
+        queue.pop()
 
-def send_to_connection(connection_id: str, message: dict):
-    pass
+def post_to_connection(connection_id: str, payload: bytes):
+    '''Транспорт: False означает, что получатель занят и кадр остаётся в очереди'''
+    return True
 
-def get_db_connection():
-    db_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(db_url)
+outbox = Outbox(send_to_connection, room_connections)
@@ -0,0 +1,113 @@
+import os
+import time
+from collections import deque
+
+# Окно склейки исходящих событий комнаты: за это время события копятся и уходят одним кадром
+COALESCE_WINDOW = float(os.environ.get('WS_COALESCE_WINDOW_MS', '50')) / 1000
+
+BATCH_PREFIX = b'{"type":"batch","events":['
+BATCH_SUFFIX = b']}'
+
+def build_frame(payloads):
+    '''Кадр из уже закодированных событий без повторного кодирования JSON'''
+    if len(payloads) == 1:
+        return payloads[0]
+    return BATCH_PREFIX + b','.join(payloads) + BATCH_SUFFIX
+
+class RoomBatch:
+    '''События комнаты, накопленные за окно'''
+    __slots__ = ('deadline', 'entries', 'keys')
+    
+    def __init__(self, deadline):
+        self.deadline = deadline
+        # [payload, exclude]; вытесненное более новым событием с тем же ключом заменяется None
+        self.entries = []
+        self.keys = {}
+    
+    def add(self, payload, exclude, key):
+        if key is not None:
+            previous = self.keys.get(key)
+            if previous is not None:
+                self.entries[previous] = None
+            self.keys[key] = len(self.entries)
+        self.entries.append((payload, exclude))
+
+class Outbox:
+    '''Склейка исходящих событий по комнатам
+    
+    broadcast ставит событие в пачку комнаты; через window секунд после первого
+    события пачка уходит каждому получателю одним кадром. События с одинаковым
+    ключом (например, переголосование одного игрока) схлопываются в последнее.
+    Сроки пачек идут в порядке создания, поэтому просроченные берутся с начала очереди.
+    
+    Своего таймера нет: flush_due вызывает владелец. server.py делает это из
+    цикла событий, а облачная функция в конце вызова отправляет всё через
+    flush_all — после ответа её контейнер может быть заморожен.
+    '''
+    
+    def __init__(self, send, recipients, window=COALESCE_WINDOW, clock=time.monotonic):
+        self.send = send
+        self.recipients = recipients
+        self.window = window
+        self.clock = clock
+        self.pending = {}
+        self.due = deque()
+        self.stats = {'events': 0, 'collapsed': 0, 'frames': 0}
+    
+    def enqueue(self, room_id, payload, exclude=None, key=None):
+        '''Событие для всех получателей комнаты, кроме exclude'''
+        self.stats['events'] += 1
+        if self.window <= 0:
+            self._deliver(room_id, [(payload, exclude)])
+            return
+        
+        batch = self.pending.get(room_id)
+        if batch is None:
+            batch = self.pending[room_id] = RoomBatch(self.clock() + self.window)
+            self.due.append((batch.deadline, room_id, batch))
+        elif key is not None and key in batch.keys:
+            self.stats['collapsed'] += 1
+        batch.add(payload, exclude, key)
+    
+    def flush_due(self, now=None):
+        '''Отправка пачек, у которых истекло окно; возвращает число отправленных пачек'''
+        now = self.clock() if now is None else now
+        ready = []
+        while self.due and self.due[0][0] <= now:
+            _, room_id, batch = self.due.popleft()
+            # Пачка могла уже уйти через flush_room, а в комнате начаться новая
+            if self.pending.get(room_id) is batch:
+                del self.pending[room_id]
+                ready.append((room_id, batch))
+        for room_id, batch in ready:
+            self._deliver(room_id, [entry for entry in batch.entries if entry is not None])
+        return len(ready)
+    
+    def flush_room(self, room_id):
+        '''Немедленная отправка пачки комнаты, например перед снимком состояния для нового игрока'''
+        batch = self.pending.pop(room_id, None)
+        if batch is not None:
+            self._deliver(room_id, [entry for entry in batch.entries if entry is not None])
+    
+    def flush_all(self):
+        ready = list(self.pending.items())
+        self.pending.clear()
+        self.due.clear()
+        for room_id, batch in ready:
+            self._deliver(room_id, [entry for entry in batch.entries if entry is not None])
+    
+    def _deliver(self, room_id, entries):
+        excluded = {exclude for _, exclude in entries if exclude is not None}
+        shared = None
+        for connection_id in list(self.recipients(room_id)):
+            if connection_id in excluded:
+                payloads = [payload for payload, exclude in entries if exclude != connection_id]
+                if not payloads:
+                    continue
+                frame = build_frame(payloads)
+            else:
+                if shared is None:
+                    shared = build_frame([payload for payload, _ in entries])
+                frame = shared
+            self.stats['frames'] += 1
+            self.send(connection_id, frame)
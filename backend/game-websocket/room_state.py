@@ -0,0 +1,315 @@
+import os
+import time
+import uuid
+from collections import deque
+from itertools import islice
+from flow_control import TokenBucket, ROOM_RATE, ROOM_BURST
+
+# Сколько сообщений чата хранится в комнате и сколько отдаётся при входе
+CHAT_HISTORY_SIZE = int(os.environ.get('WS_CHAT_HISTORY_SIZE', '200'))
+CHAT_ON_JOIN = int(os.environ.get('WS_CHAT_ON_JOIN', '50'))
+
+# Журнал последних событий комнаты для докачки после переподключения
+EVENT_LOG_SIZE = int(os.environ.get('WS_EVENT_LOG_SIZE', '500'))
+
+# Пустая комната удаляется после простоя; при превышении бюджета — раньше, начиная с самых старых
+ROOM_IDLE_TTL = int(os.environ.get('WS_ROOM_IDLE_TTL', '600'))
+MEMORY_BUDGET = int(os.environ.get('WS_MEMORY_BUDGET_MB', '256')) * 1024 * 1024
+SWEEP_INTERVAL = 30
+OVER_BUDGET_SWEEP_INTERVAL = 1
+
+# Оценки размеров в байтах: точный sys.getsizeof по вложенным объектам дорог на горячем пути
+ROOM_BYTES = 1024
+PLAYER_BYTES = 512
+MESSAGE_BYTES = 256
+
+_usage = {'bytes': 0, 'swept_at': 0.0}
+
+def message_bytes(message):
+    return MESSAGE_BYTES + len(message.get('user_name') or '') + len(message.get('message') or '')
+
+def memory_usage():
+    '''Оценка памяти, занятой всеми комнатами процесса'''
+    return _usage['bytes']
+
+class Player:
+    '''Игрок комнаты; __slots__ экономит память на десятках тысяч комнат'''
+    __slots__ = ('connection_id', 'user_id', 'user_name', 'ready', 'role', 'alive', 'disconnected_at')
+    
+    def __init__(self, connection_id, user_id, user_name):
+        self.connection_id = connection_id
+        self.user_id = user_id
+        self.user_name = user_name
+        self.ready = False
+        self.role = None
+        self.alive = None
+        self.disconnected_at = None
+    
+    def to_public_dict(self):
+        '''Вид игрока для всей комнаты: роль не раскрывается, её получает только сам игрок'''
+        data = {
+            'connection_id': self.connection_id,
+            'user_id': self.user_id,
+            'user_name': self.user_name,
+            'ready': self.ready,
+            'connected': self.disconnected_at is None
+        }
+        if self.role is not None:
+            data['alive'] = self.alive
+        return data
+
+class Room:
+    '''Состояние комнаты с индексами участников по connection_id и user_id'''
+    __slots__ = ('room_id', 'by_user', 'by_connection', 'game_state', 'chat', 'chat_bytes', 'touched_at',
+                 'membership_events', 'session_id', 'roles', 'epoch', 'seq', 'events', 'event_bytes', 'limiter')
+    
+    def __init__(self, room_id):
+        self.room_id = room_id
+        # dict сохраняет порядок вставки — это порядок входа игроков для отображения
+        self.by_user = {}
+        self.by_connection = {}
+        self.game_state = None
+        # Сессия в game_sessions и роли {user_id: [role, alive]}, в том числе временно вышедших игроков
+        self.session_id = None
+        self.roles = {}
+        # Кольцевой буфер: старые сообщения вытесняются, память комнаты ограничена
+        self.chat = deque(maxlen=CHAT_HISTORY_SIZE)
+        self.chat_bytes = 0
+        self.touched_at = time.monotonic()
+        # Счётчик дельт состава: по нему рассылается периодическая полная синхронизация
+        self.membership_events = 0
+        # Журнал (seq, payload) разосланных событий; epoch меняется при пересоздании комнаты,
+        # и клиент с чужой эпохой получает полный снимок вместо докачки
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.events = deque(maxlen=EVENT_LOG_SIZE)
+        self.event_bytes = 0
+        # Общий лимит чата и голосов комнаты поверх лимитов отдельных соединений
+        self.limiter = TokenBucket(ROOM_RATE, ROOM_BURST)
+        _usage['bytes'] += ROOM_BYTES
+    
+    def __len__(self):
+        return len(self.by_user)
+    
+    def __contains__(self, user_id):
+        return user_id in self.by_user
+    
+    def players(self):
+        '''Игроки в порядке входа'''
+        return self.by_user.values()
+    
+    def connection_ids(self):
+        return self.by_connection.keys()
+    
+    def join(self, connection_id, user_id, user_name):
+        '''Добавление игрока; повторный вход того же пользователя переносит его на новое соединение'''
+        self.touched_at = time.monotonic()
+        player = self.by_user.get(user_id)
+        if player is None:
+            player = Player(connection_id, user_id, user_name)
+            saved = self.roles.get(user_id)
+            if saved:
+                player.role, player.alive = saved
+            self.by_user[user_id] = player
+            _usage['bytes'] += PLAYER_BYTES
+        else:
+            self.by_connection.pop(player.connection_id, None)
+            player.connection_id = connection_id
+            player.disconnected_at = None
+            if user_name:
+                player.user_name = user_name
+        self.by_connection[connection_id] = player
+        return player
+    
+    def leave(self, connection_id):
+        '''Удаление игрока по соединению за O(1); None, если соединение не в комнате'''
+        self.touched_at = time.monotonic()
+        player = self.by_connection.pop(connection_id, None)
+        if player is not None:
+            self.by_user.pop(player.user_id, None)
+            _usage['bytes'] -= PLAYER_BYTES
+        return player
+    
+    def detach(self, connection_id):
+        '''Обрыв соединения: игрок остаётся в комнате до истечения льготного периода'''
+        player = self.by_connection.pop(connection_id, None)
+        if player is not None:
+            player.connection_id = None
+            player.disconnected_at = time.monotonic()
+        return player
+    
+    def drop_disconnected(self, user_id, disconnected_at):
+        '''Удаление игрока, так и не вернувшегося после обрыва с отметкой disconnected_at'''
+        player = self.by_user.get(user_id)
+        if player is None or player.disconnected_at is None or player.disconnected_at != disconnected_at:
+            return None
+        del self.by_user[user_id]
+        _usage['bytes'] -= PLAYER_BYTES
+        self.touched_at = time.monotonic()
+        return player
+    
+    def log_event(self, payload):
+        '''Запись разосланного события в журнал; возвращает его номер'''
+        if len(self.events) == self.events.maxlen:
+            evicted = len(self.events[0][1])
+            self.event_bytes -= evicted
+            _usage['bytes'] -= evicted
+        self.events.append((self.seq, payload))
+        self.event_bytes += len(payload)
+        _usage['bytes'] += len(payload)
+    
+    def next_seq(self):
+        self.seq += 1
+        return self.seq
+    
+    def events_after(self, last_seq):
+        '''Пропущенные события или None, если часть из них уже вытеснена из журнала'''
+        if last_seq >= self.seq:
+            return []
+        if not self.events or self.events[0][0] > last_seq + 1:
+            return None
+        skip = len(self.events) - (self.seq - last_seq)
+        return [payload for _, payload in islice(self.events, skip, None)]
+    
+    def add_chat(self, message):
+        '''Добавление сообщения в буфер с учётом вытесненного'''
+        self.touched_at = time.monotonic()
+        if len(self.chat) == self.chat.maxlen:
+            evicted = message_bytes(self.chat[0])
+            self.chat_bytes -= evicted
+            _usage['bytes'] -= evicted
+        size = message_bytes(message)
+        self.chat.append(message)
+        self.chat_bytes += size
+        _usage['bytes'] += size
+    
+    def recent_chat(self, limit=CHAT_ON_JOIN):
+        '''Последние limit сообщений без копирования всего буфера'''
+        skip = max(0, len(self.chat) - limit)
+        return list(islice(self.chat, skip, None))
+    
+    def trim_chat(self, keep):
+        '''Сокращение истории чата до keep последних сообщений'''
+        while len(self.chat) > keep:
+            evicted = message_bytes(self.chat.popleft())
+            self.chat_bytes -= evicted
+            _usage['bytes'] -= evicted
+    
+    def memory_bytes(self):
+        return ROOM_BYTES + len(self.by_user) * PLAYER_BYTES + self.chat_bytes + self.event_bytes
+    
+    def release(self):
+        '''Снятие комнаты с учёта памяти при удалении'''
+        _usage['bytes'] -= self.memory_bytes()
+        self.by_user.clear()
+        self.by_connection.clear()
+        self.chat.clear()
+        self.chat_bytes = 0
+        self.events.clear()
+        self.event_bytes = 0
+    
+    def handoff_state(self):
+        '''Состояние для передачи комнаты другому воркеру кластера
+    
+        Журнал событий передаётся вместе с seq и epoch: после переезда
+        клиенты докачивают пропущенное через resume как обычно.
+        '''
+        return {
+            'room_id': self.room_id,
+            'epoch': self.epoch,
+            'seq': self.seq,
+            'game_state': self.game_state,
+            'session_id': self.session_id,
+            # Ключи-числа JSON превратил бы в строки, поэтому списки
+            'roles': [[user_id, role, alive] for user_id, (role, alive) in self.roles.items()],
+            'players': [[p.user_id, p.user_name, p.ready, p.role, p.alive] for p in self.by_user.values()],
+            'chat': list(self.chat),
+            'events': [[seq, payload.decode('utf-8')] for seq, payload in self.events]
+        }
+    
+    def adopt_state(self, state):
+        '''Приём комнаты от другого воркера; игроки ждут переподключения как после обрыва
+        
+        ATTACH от края может прийти раньше ADOPT от прежнего владельца: такой
+        игрок уже сидит в пустой комнате без роли. Его соединение остаётся,
+        а готовность, роль и жизнь берутся у прежнего владельца.
+        '''
+        now = time.monotonic()
+        self.touched_at = now
+        self.epoch = state['epoch']
+        self.seq = state['seq']
+        self.game_state = state['game_state']
+        self.session_id = state['session_id']
+        self.roles = {user_id: [role, alive] for user_id, role, alive in state['roles']}
+        arrived, self.by_user = self.by_user, {}
+        for user_id, user_name, ready, role, alive in state['players']:
+            player = arrived.pop(user_id, None)
+            if player is None:
+                player = Player(None, user_id, user_name)
+                player.disconnected_at = now
+                _usage['bytes'] += PLAYER_BYTES
+            player.ready, player.role, player.alive = ready, role, alive
+            self.by_user[user_id] = player
+        # Вошедшие до прихода комнаты, которых не было у прежнего владельца, — в конце состава
+        self.by_user.update(arrived)
+        self.trim_chat(0)
+        for message in state['chat']:
+            self.add_chat(message)
+        _usage['bytes'] -= self.event_bytes
+        self.events.clear()
+        self.event_bytes = 0
+        for seq, payload in state['events']:
+            encoded = payload.encode('utf-8')
+            self.events.append((seq, encoded))
+            self.event_bytes += len(encoded)
+        _usage['bytes'] += self.event_bytes
+        return [player for player in self.by_user.values() if player.disconnected_at == now]
+    
+    def players_list(self):
+        return [player.to_public_dict() for player in self.by_user.values()]
+    
+    def to_dict(self, viewer=None, chat_limit=CHAT_ON_JOIN):
+        '''Снимок комнаты для игрока viewer: состав в публичном виде и только его собственная роль'''
+        return {
+            'players': self.players_list(),
+            'your_role': viewer.role if viewer is not None else None,
+            'game_state': self.game_state,
+            'chat': self.recent_chat(chat_limit),
+            'seq': self.seq,
+            'epoch': self.epoch
+        }
+
+def sweep_rooms(rooms, force=False):
+    '''Удаление простаивающих пустых комнат и сжатие чатов при превышении бюджета памяти
+    
+    Полный проход по комнатам выполняется не чаще SWEEP_INTERVAL секунд,
+    а при оценке памяти выше MEMORY_BUDGET — не чаще раза в секунду.
+    '''
+    now = time.monotonic()
+    interval = OVER_BUDGET_SWEEP_INTERVAL if _usage['bytes'] > MEMORY_BUDGET else SWEEP_INTERVAL
+    if not force and now - _usage['swept_at'] < interval:
+        return 0
+    _usage['swept_at'] = now
+    
+    evicted = 0
+    for room_id in [rid for rid, room in rooms.items() if not room.by_user and now - room.touched_at > ROOM_IDLE_TTL]:
+        rooms.pop(room_id).release()
+        evicted += 1
+    
+    if _usage['bytes'] <= MEMORY_BUDGET:
+        return evicted
+    
+    # Бюджет всё ещё превышен: сначала пустые комнаты, затем история чата, от давно неактивных к свежим
+    idle_first = sorted(rooms.values(), key=lambda room: room.touched_at)
+    for room in idle_first:
+        if _usage['bytes'] <= MEMORY_BUDGET:
+            break
+        if not room.by_user:
+            rooms.pop(room.room_id).release()
+            evicted += 1
+    for room in idle_first:
+        if _usage['bytes'] <= MEMORY_BUDGET:
+            break
+        if room.room_id in rooms:
+            room.trim_chat(CHAT_ON_JOIN)
+    return evicted
@@ -0,0 +1,350 @@
+'''Автономный WebSocket-сервер игры для собственных узлов
+
+Те же обработчики, что и в облачной функции (index.handler), но поверх
+настоящих сокетов в одном цикле asyncio: соединения, комнаты и журналы
+событий живут в памяти процесса между сообщениями.
+
+    JWT_SECRET=... DATABASE_URL=... python server.py --host 0.0.0.0 --port 8765
+
+Несколько процессов делят комнаты по согласованному хешированию (cluster.py):
+--workers N поднимает N воркеров на общем порту, --cluster/--worker-id
+запускают один воркер по готовому файлу состава. Воркеры на разных машинах
+должны получить одинаковый WS_CLUSTER_SECRET.
+
+    python server.py --port 8765 --workers 8
+'''
+import argparse
+import asyncio
+import json
+import os
+import resource
+import secrets
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from urllib.parse import parse_qsl, urlsplit
+
+import psycopg2
+
+import index
+import game_store
+import ws_auth
+from cluster import CLUSTER_SECRET, ClusterNode, is_loopback, load_config, routed_room
+from flow_control import RESYNC_FRAME
+from room_state import Room, sweep_rooms
+from ws_protocol import (
+    OP_BINARY, OP_CLOSE, OP_PING, OP_PONG, OP_TEXT, ProtocolError,
+    encode_frame, handshake_response, read_frame, read_request, reject_response
+)
+
+# Порог буфера записи сокета: выше него получатель считается медленным
+# и кадры копятся в его ограниченной очереди (flow_control.OutboundQueue)
+WRITE_HIGH_WATER = 256 * 1024
+MAINTENANCE_INTERVAL = 1.0
+HANDSHAKE_TIMEOUT = 10
+
+class Client:
+    __slots__ = ('connection_id', 'writer', 'writable', 'resync')
+    
+    def __init__(self, connection_id, writer):
+        self.connection_id = connection_id
+        self.writer = writer
+        # Поднимается, когда очередь соединения ждёт освобождения буфера записи
+        self.writable = asyncio.Event()
+        # Пересылаемые владельцем кадры пропущены из-за медленного сокета: после слива — resync
+        self.resync = False
+
+clients = {}
+# ClusterNode, если процесс — воркер кластера
+node = None
+# Сообщения соединений, ждущих подъёма комнаты из базы, в порядке прихода: connection_id -> [text]
+held = {}
+
+def post_to_connection(connection_id, payload):
+    '''Транспорт index: запись кадра в сокет или False, если буфер переполнен'''
+    client = clients.get(connection_id)
+    if client is None:
+        return node.post_to_connection(connection_id, payload) if node is not None else True
+    transport = client.writer.transport
+    if transport.is_closing():
+        return True
+    if transport.get_write_buffer_size() > WRITE_HIGH_WATER:
+        client.writable.set()
+        return False
+    client.writer.write(encode_frame(payload))
+    return True
+
+def write_client(connection_id, payload):
+    '''Запись кадра, пришедшего от владельца комнаты с другого воркера
+    
+    Очередь соединения живёт у владельца; здесь при переполненном буфере кадр
+    отбрасывается, а клиент после слива получает resync и докачивает пропущенное.
+    '''
+    client = clients.get(connection_id)
+    if client is None or client.writer.transport.is_closing():
+        return
+    if client.resync or client.writer.transport.get_write_buffer_size() > WRITE_HIGH_WATER:
+        client.resync = True
+        client.writable.set()
+        return
+    client.writer.write(encode_frame(payload))
+
+def close_client(connection_id):
+    client = clients.get(connection_id)
+    if client is not None:
+        client.writer.close()
+
+async def writer_loop(client):
+    '''Дожидается слива буфера сокета и досылает очередь соединения'''
+    while True:
+        await client.writable.wait()
+        client.writable.clear()
+        await client.writer.drain()
+        if client.resync:
+            client.resync = False
+            client.writer.write(encode_frame(RESYNC_FRAME))
+        index.drain_connection(client.connection_id)
+
+def make_event(event_type, connection_id, body=None, params=None, headers=None):
+    return {
+        'requestContext': {'eventType': event_type, 'connectionId': connection_id},
+        'queryStringParameters': params or {},
+        'headers': headers or {},
+        'body': body if body is not None else ''
+    }
+
+def dispatch_message(connection_id, text):
+    '''Сообщение в обработчик; вход или возврат в комнату, которой нет в памяти, ждёт её подъёма из базы'''
+    if connection_id in held:
+        held[connection_id].append(text)
+        return
+    room_id = routed_room(text) if game_store.enabled() else None
+    if room_id is not None and room_id not in index.rooms:
+        held[connection_id] = [text]
+        asyncio.ensure_future(restore_and_release(connection_id, room_id))
+        return
+    handle_text(connection_id, text)
+
+async def restore_and_release(connection_id, room_id):
+    '''Подъём комнаты из базы в пуле потоков, затем отложенные сообщения соединения по порядку'''
+    try:
+        rows = await asyncio.get_running_loop().run_in_executor(None, game_store.load_room_state, room_id)
+    except psycopg2.Error as error:
+        print(f'room {room_id} restore failed: {error}', flush=True)
+        rows = []
+    if room_id not in index.rooms:
+        game_store.apply_room_state(index.rooms.setdefault(room_id, Room(room_id)), rows)
+    for text in held.pop(connection_id, []):
+        dispatch_message(connection_id, text)
+
+def handle_text(connection_id, text):
+    response = index.handler(make_event('MESSAGE', connection_id, text), None)
+    if response['statusCode'] >= 400:
+        # В облаке ответ обработчика получает отправитель; здесь — отдельным кадром
+        error = json.loads(response['body'])
+        index.send_to_connection(connection_id, {'type': 'error', 'status': response['statusCode'], **error})
+
+async def handle_socket(reader, writer):
+    try:
+        path, headers = await asyncio.wait_for(read_request(reader), HANDSHAKE_TIMEOUT)
+    except (ProtocolError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+        writer.write(reject_response(400, 'Bad Request'))
+        writer.close()
+        return
+    
+    connection_id = uuid.uuid4().hex
+    params = dict(parse_qsl(urlsplit(path).query))
+    event_headers = {'X-Auth-Token': headers['x-auth-token']} if 'x-auth-token' in headers else {}
+    response = index.handler(make_event('CONNECT', connection_id, params=params, headers=event_headers), None)
+    if response['statusCode'] != 200:
+        writer.write(reject_response(response['statusCode'], 'Unauthorized'))
+        writer.close()
+        return
+    
+    writer.write(handshake_response(headers['sec-websocket-key']))
+    client = clients[connection_id] = Client(connection_id, writer)
+    if node is not None:
+        node.client_connected(connection_id)
+    drainer = asyncio.ensure_future(writer_loop(client))
+    try:
+        while True:
+            opcode, payload = await read_frame(reader)
+            if opcode in (OP_TEXT, OP_BINARY):
+                if node is not None:
+                    node.client_message(connection_id, payload.decode('utf-8'))
+                else:
+                    dispatch_message(connection_id, payload.decode('utf-8'))
+            elif opcode == OP_PING:
+                writer.write(encode_frame(payload, OP_PONG))
+            elif opcode == OP_CLOSE:
+                writer.write(encode_frame(payload[:2], OP_CLOSE))
+                break
+    except (ProtocolError, asyncio.IncompleteReadError, ConnectionError, UnicodeDecodeError):
+        pass
+    finally:
+        drainer.cancel()
+        clients.pop(connection_id, None)
+        held.pop(connection_id, None)
+        if node is not None:
+            node.client_closed(connection_id)
+        else:
+            index.handler(make_event('DISCONNECT', connection_id), None)
+        writer.close()
+
+async def maintenance():
+    '''То, что в облаке делается на входе в handler: склейка, льготный период, уборка; запись в базу — в storage()'''
+    interval = min(MAINTENANCE_INTERVAL, index.outbox.window or MAINTENANCE_INTERVAL)
+    last_housekeeping = 0.0
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        index.outbox.flush_due()
+        if loop.time() - last_housekeeping >= MAINTENANCE_INTERVAL:
+            last_housekeeping = loop.time()
+            index.expire_departures()
+            sweep_rooms(index.rooms)
+
+async def storage():
+    '''Обращения к базе в пуле потоков: отзывы токенов и сброс состояния игр не блокируют цикл событий
+    
+    Снимок комнат делается здесь, в цикле событий; в потоке идёт только запись.
+    '''
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, ws_auth.refresh_revocations)
+            batch = game_store.take_batch()
+            if batch is not None:
+                assigned = await loop.run_in_executor(None, game_store.write_pending, batch)
+                if assigned:
+                    game_store.assign_sessions(assigned)
+        except psycopg2.Error as error:
+            print(f'storage error: {error}', flush=True)
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
+
+def raise_fd_limit():
+    '''Десятки тысяч соединений требуют поднятого мягкого лимита дескрипторов'''
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+async def serve(host, port, backlog, cluster_path=None, worker_id=None):
+    global node
+    # События копятся между сообщениями и уходят по окну склейки из maintenance(): запись в сокеты только из цикла событий
+    index.flush_outbox_on_return = False
+    index.post_to_connection = post_to_connection
+    # Блокирующие запросы psycopg2 выполняет storage() и подъём комнат в пуле потоков
+    index.db_in_handler = False
+    ws_auth.refresh_on_check = False
+    if game_store.enabled():
+        # Отзывы загружаются до приёма первых подключений
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, ws_auth.refresh_revocations, True)
+        except psycopg2.Error as error:
+            print(f'revocations load failed: {error}', flush=True)
+    servers = []
+    if cluster_path:
+        config = load_config(cluster_path)
+        spec = config['workers'][worker_id]
+        peer_host = spec.get('host', config.get('host', '127.0.0.1'))
+        if not CLUSTER_SECRET and not is_loopback(peer_host):
+            raise SystemExit(f'{worker_id}: WS_CLUSTER_SECRET is required to accept peers on {peer_host}')
+        node = ClusterNode(sys.modules[__name__], worker_id, config)
+        servers.append(await asyncio.start_server(node.handle_peer, peer_host, spec['peer_port'], limit=64 * 1024))
+        # Собственный порт воркера — для клиентов, подключающихся сразу к владельцу комнаты
+        servers.append(await asyncio.start_server(handle_socket, host, spec['port'], backlog=backlog, limit=64 * 1024))
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGHUP, lambda: print(f'{worker_id}: moved {node.reconfigure(load_config(cluster_path))} rooms', flush=True))
+    if port:
+        # Общий порт: при нескольких воркерах ядро раздаёт им входящие соединения (SO_REUSEPORT)
+        servers.append(await asyncio.start_server(handle_socket, host, port, backlog=backlog, limit=64 * 1024,
+                                                  reuse_port=node is not None))
+    housekeeping = asyncio.ensure_future(maintenance())
+    persistence = asyncio.ensure_future(storage()) if game_store.enabled() else None
+    try:
+        await asyncio.gather(*(server.serve_forever() for server in servers))
+    finally:
+        housekeeping.cancel()
+        if persistence is not None:
+            persistence.cancel()
+        for server in servers:
+            server.close()
+        index.outbox.flush_all()
+        if game_store.enabled():
+            game_store.flush_if_due(force=True)
+
+def launch_workers(args):
+    '''Запуск воркеров кластера на одной машине: по процессу на ядро, общий порт --port
+    
+    Файл состава пишется в --cluster (или во временный файл). SIGHUP родителю
+    запускает воркеров, добавленных в файл, и рассылает SIGHUP остальным —
+    комнаты перераспределяются без переподключения клиентов.
+    '''
+    path = args.cluster or os.path.join(tempfile.mkdtemp(prefix='game-websocket-'), 'cluster.json')
+    # Воркеры наследуют окружение: без заданного секрета у кластера будет свой случайный
+    os.environ.setdefault('WS_CLUSTER_SECRET', secrets.token_hex(32))
+    if not os.path.exists(path):
+        workers = {f'w{n}': {'port': args.port + n, 'peer_port': args.port + 1000 + n} for n in range(1, args.workers + 1)}
+        with open(path, 'w') as config_file:
+            json.dump({'host': '127.0.0.1', 'workers': workers}, config_file, indent=2)
+    
+    children = {}
+    
+    def spawn_new():
+        for worker_id in load_config(path)['workers']:
+            if worker_id not in children:
+                children[worker_id] = subprocess.Popen([
+                    sys.executable, os.path.abspath(__file__), '--host', args.host, '--port', str(args.port),
+                    '--backlog', str(args.backlog), '--cluster', path, '--worker-id', worker_id
+                ])
+    
+    def reload(signum, frame):
+        existing = list(children.values())
+        spawn_new()
+        for child in existing:
+            child.send_signal(signal.SIGHUP)
+    
+    def stop(signum, frame):
+        for child in children.values():
+            child.terminate()
+    
+    spawn_new()
+    print(f'game-websocket cluster of {len(children)} workers on {args.host}:{args.port}, layout in {path}', flush=True)
+    signal.signal(signal.SIGHUP, reload)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while any(child.poll() is None for child in children.values()):
+        time.sleep(0.5)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8765, help='общий порт для клиентов; 0 — только порт воркера')
+    parser.add_argument('--backlog', type=int, default=4096)
+    parser.add_argument('--workers', type=int, default=0, help='запустить кластер из N процессов')
+    parser.add_argument('--cluster', help='JSON-файл состава кластера')
+    parser.add_argument('--worker-id', help='имя этого воркера в файле состава')
+    args = parser.parse_args()
+    
+    if args.workers:
+        launch_workers(args)
+        return
+    if args.cluster and not args.worker_id:
+        parser.error('--cluster requires --worker-id')
+    
+    limit = raise_fd_limit()
+    name = f'{args.worker_id} ' if args.worker_id else ''
+    print(f'game-websocket {name}listening on {args.host}:{args.port}, fd limit {limit}', flush=True)
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    asyncio.run(serve(args.host, args.port, args.backlog, args.cluster, args.worker_id))
+
+if __name__ == '__main__':
+    main()
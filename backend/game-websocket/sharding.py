@@ -0,0 +1,50 @@
+import hashlib
+from bisect import bisect
+
+# Виртуальных узлов на воркер: сглаживают распределение комнат по кольцу
+VIRTUAL_NODES = 128
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+class HashRing:
+    '''Согласованное хеширование комнат по воркерам
+    
+    При добавлении или удалении воркера переезжает только ~1/N комнат,
+    остальные остаются у прежних владельцев.
+    '''
+    
+    def __init__(self, workers=(), virtual_nodes=VIRTUAL_NODES):
+        self.virtual_nodes = virtual_nodes
+        self.workers = set()
+        self._points = []
+        self._owners = []
+        for worker in workers:
+            self.add(worker)
+    
+    def add(self, worker):
+        if worker in self.workers:
+            return
+        self.workers.add(worker)
+        self._rebuild()
+    
+    def remove(self, worker):
+        if worker not in self.workers:
+            return
+        self.workers.discard(worker)
+        self._rebuild()
+    
+    def _rebuild(self):
+        points = sorted(
+            (ring_hash(f'{worker}#{n}'), worker)
+            for worker in self.workers for n in range(self.virtual_nodes)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [worker for _, worker in points]
+    
+    def owner(self, room_id):
+        '''Воркер, которому принадлежит комната; O(log N) по точкам кольца'''
+        if not self._points:
+            return None
+        index = bisect(self._points, ring_hash(str(room_id)))
+        return self._owners[index % len(self._owners)]
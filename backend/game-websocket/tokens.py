@@ -0,0 +1,99 @@
+import jwt
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# Один модуль выдачи и проверки токенов для api, функций входа и game-websocket. Функции
+# деплоятся отдельными каталогами, поэтому в них лежат копии этого файла:
+# правится он, копии обновляет benchmarks/shared_modules.py --write.
+
+# Короткий access-токен несёт роли и проверяется без базы; refresh обменивается на новый в api (path=auth)
+ACCESS_TOKEN_TTL = timedelta(minutes=15)
+REFRESH_TOKEN_TTL = timedelta(days=30)
+
+def display_name(profile_name, first_name):
+    '''Имя игрока в комнатах и чате, как его показывает клиент: имя профиля, иначе имя из аккаунта входа'''
+    return profile_name or first_name or 'Guest'
+
+def issue_tokens(user_id, is_admin, profile_created, name):
+    '''Новая пара access/refresh токенов; name из display_name игровой сервер берёт вместо присланного клиентом'''
+    jwt_secret = os.environ.get('JWT_SECRET')
+    now = datetime.utcnow()
+    access_token = jwt.encode({
+        'type': 'access',
+        'user_id': user_id,
+        'is_admin': bool(is_admin),
+        'profile_created': bool(profile_created),
+        'name': name,
+        'iat': now,
+        'exp': now + ACCESS_TOKEN_TTL
+    }, jwt_secret, algorithm='HS256')
+    refresh_token = jwt.encode({
+        'type': 'refresh',
+        'user_id': user_id,
+        'jti': uuid.uuid4().hex,
+        'iat': now,
+        'exp': now + REFRESH_TOKEN_TTL
+    }, jwt_secret, algorithm='HS256')
+    return {
+        'token': access_token,
+        'refresh_token': refresh_token,
+        'expires_in': int(ACCESS_TOKEN_TTL.total_seconds())
+    }
+
+# Как часто процесс перечитывает список отзывов, секунд; отзыв вступает в силу с этой задержкой
+REVOCATIONS_REFRESH_INTERVAL = 30
+
+# Берутся только отзывы моложе срока жизни access-токена: более старые токены и так истекли
+REVOCATIONS_SQL = '''
+    SELECT user_id, EXTRACT(EPOCH FROM access_revoked_before)
+    FROM token_revocations
+    WHERE access_revoked_before > NOW() - %(access_ttl)s
+'''
+
+# {user_id: unix-время}: access-токены, выпущенные раньше, отозваны
+_revoked_access = {}
+_revocations = {'loaded_at': 0.0}
+
+def decode_token(token, token_type='access'):
+    '''Проверка подписи и срока JWT, возвращает claims или None.
+
+    Токены без поля type выпускались до появления refresh-токенов и
+    принимаются как access до истечения срока. Access-токен должен нести
+    user_id и не быть отозван.
+    '''
+    try:
+        jwt_secret = os.environ.get('JWT_SECRET')
+        payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
+    except Exception:
+        return None
+    if payload.get('type', 'access') != token_type:
+        return None
+    if token_type == 'access' and (not payload.get('user_id') or is_access_revoked(payload)):
+        return None
+    return payload
+
+def is_access_revoked(payload):
+    '''Проверка по закэшированному списку отзывов за O(1)'''
+    revoked_before = _revoked_access.get(payload.get('user_id'))
+    return revoked_before is not None and payload.get('iat', 0) < revoked_before
+
+def revocations_due(force=False):
+    '''Пора ли перечитать отзывы: не чаще раза в REVOCATIONS_REFRESH_INTERVAL'''
+    return force or time.monotonic() - _revocations['loaded_at'] >= REVOCATIONS_REFRESH_INTERVAL
+
+def refresh_revocations(cur, force=False):
+    '''Перечитывание отзывов через курсор вызывающего, если подошёл срок; True, если список обновлён'''
+    global _revoked_access
+    if not revocations_due(force):
+        return False
+    now = time.monotonic()
+    cur.execute(REVOCATIONS_SQL, {'access_ttl': ACCESS_TOKEN_TTL})
+    _revoked_access = {row[0]: int(row[1]) for row in cur.fetchall()}
+    _revocations['loaded_at'] = now
+    return True
+
+def remember_revocation(user_id, revoked_before):
+    '''Отзыв, записанный этим процессом, действует сразу, не дожидаясь перечитывания'''
+    _revoked_access[user_id] = int(revoked_before)
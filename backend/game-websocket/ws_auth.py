@@ -0,0 +1,37 @@
+import game_store
+import tokens
+from tokens import decode_token
+
+def token_from_event(event):
+    '''Токен из строки подключения (?token=...) или заголовка X-Auth-Token'''
+    params = event.get('queryStringParameters') or {}
+    headers = event.get('headers') or {}
+    return params.get('token') or headers.get('X-Auth-Token') or headers.get('x-auth-token')
+
+# server.py обновляет список сам, вне цикла событий, и выключает обновление при проверке
+refresh_on_check = True
+
+def refresh_revocations(force=False):
+    '''Перечитывание отзывов из tokens.py через соединение пула game_store'''
+    if not game_store.enabled() or not tokens.revocations_due(force):
+        return False
+    
+    pool = game_store.get_pool()
+    conn = pool.getconn()
+    try:
+        cur = conn.cursor()
+        tokens.refresh_revocations(cur, force=True)
+        conn.rollback()
+        cur.close()
+    finally:
+        pool.putconn(conn)
+    return True
+
+def authenticate(event):
+    '''Claims подключения или None, если токена нет, он недействителен или отозван'''
+    token = token_from_event(event)
+    if not token:
+        return None
+    if refresh_on_check:
+        refresh_revocations()
+    return decode_token(token)
@@ -0,0 +1,113 @@
+import base64
+import hashlib
+import os
+import struct
+
+# Минимальная реализация RFC 6455 для автономного сервера и нагрузочного теста:
+# рукопожатие, текстовые и управляющие кадры без расширений и фрагментации исходящих
+
+GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+MAX_FRAME_SIZE = 64 * 1024
+
+class ProtocolError(Exception):
+    pass
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1(key.encode() + GUID).digest()).decode()
+
+def handshake_response(key):
+    return (
+        'HTTP/1.1 101 Switching Protocols\r\n'
+        'Upgrade: websocket\r\n'
+        'Connection: Upgrade\r\n'
+        f'Sec-WebSocket-Accept: {accept_key(key)}\r\n\r\n'
+    ).encode()
+
+def reject_response(status, reason):
+    return f'HTTP/1.1 {status} {reason}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'.encode()
+
+async def read_request(reader):
+    '''Путь и заголовки HTTP-запроса на апгрейд'''
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    parts = lines[0].split(' ')
+    if len(parts) < 3 or parts[0] != 'GET':
+        raise ProtocolError('Bad request line')
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if headers.get('upgrade', '').lower() != 'websocket' or 'sec-websocket-key' not in headers:
+        raise ProtocolError('Not a websocket upgrade')
+    return parts[1], headers
+
+def encode_frame(payload, opcode=OP_TEXT, mask=False):
+    '''Кадр целиком; сервер шлёт без маски, клиент обязан маскировать'''
+    length = len(payload)
+    head = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        head.append(mask_bit | length)
+    elif length < 65536:
+        head.append(mask_bit | 126)
+        head += struct.pack('!H', length)
+    else:
+        head.append(mask_bit | 127)
+        head += struct.pack('!Q', length)
+    if mask:
+        key = os.urandom(4)
+        head += key
+        payload = apply_mask(payload, key)
+    return bytes(head) + payload
+
+def apply_mask(payload, key):
+    # Маска через одно целочисленное XOR на весь кадр вместо цикла по байтам
+    repeated = (key * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(len(payload), 'big')
+
+async def read_frame(reader, max_size=MAX_FRAME_SIZE, require_mask=True):
+    '''(opcode, payload) следующего кадра; фрагменты склеиваются
+    
+    Клиент маскирует каждый кадр (RFC 6455, 5.1), и сервер закрывает соединение
+    на немаскированном. Кадры сервера не маскируются: клиенты читают их с
+    require_mask=False.
+    '''
+    opcode = None
+    chunks = []
+    total = 0
+    while True:
+        first, second = await reader.readexactly(2)
+        fin = first & 0x80
+        frame_opcode = first & 0x0F
+        length = second & 0x7F
+        if require_mask and not second & 0x80:
+            raise ProtocolError('Client frame is not masked')
+        if length == 126:
+            length = struct.unpack('!H', await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', await reader.readexactly(8))[0]
+        if length > max_size or (frame_opcode < OP_CLOSE and total + length > max_size):
+            raise ProtocolError('Message too large')
+        key = await reader.readexactly(4) if second & 0x80 else None
+        payload = await reader.readexactly(length)
+        if key:
+            payload = apply_mask(payload, key)
+        
+        if frame_opcode >= OP_CLOSE:
+            # Управляющие кадры могут приходить между фрагментами и не фрагментируются
+            return frame_opcode, payload
+        if frame_opcode != OP_CONTINUATION:
+            opcode = frame_opcode
+        chunks.append(payload)
+        total += length
+        if fin:
+            return opcode, b''.join(chunks)
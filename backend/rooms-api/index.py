@@ -2,6 +2,34 @@ import json
 import os
 import psycopg2
 
+ROOMS_LIST_SQL = '''
+    SELECT r.id, r.name, r.max_players, r.current_players, r.status,
+           r.created_at, u.first_name, u.username
+    FROM rooms r
+    LEFT JOIN users u ON r.created_by = u.id
+    WHERE r.status = %(status)s
+    ORDER BY r.created_at DESC
+    LIMIT 50
+'''
+
+ROOM_CREATE_SQL = '''
+    INSERT INTO rooms (name, password, max_players, current_players, status, created_by)
+    VALUES (%(name)s, %(password)s, %(max_players)s, 1, 'waiting', %(user_id)s)
+    RETURNING id, name, max_players, current_players, status, created_at
+'''
+
+ROOM_CLOSE_SQL = '''
+    UPDATE rooms SET status = %(status)s WHERE id = %(room_id)s
+'''
+
+# {assignments} — список присваиваний из фиксированного набора колонок update_room
+ROOM_UPDATE_SQL = '''
+    UPDATE rooms
+    SET {assignments}
+    WHERE id = %(room_id)s
+    RETURNING id, name, max_players, current_players, status
+'''
+
 def handler(event: dict, context) -> dict:
     '''API для управления комнатами игры'''
     method = event.get('httpMethod', 'GET')
@@ -44,15 +72,7 @@ def get_rooms(event: dict) -> dict:
         conn = psycopg2.connect(db_url)
         cur = conn.cursor()
         
-        cur.execute('''
-            SELECT r.id, r.name, r.max_players, r.current_players, r.status, 
-                   r.created_at, u.first_name, u.username
-            FROM rooms r
-            LEFT JOIN users u ON r.created_by = u.id
-            WHERE r.status = %s
-            ORDER BY r.created_at DESC
-            LIMIT 50
-        ''', (status,))
+        cur.execute(ROOMS_LIST_SQL, {'status': status})
         
         rooms = []
         for row in cur.fetchall():
@@ -105,11 +125,9 @@ def create_room(event: dict) -> dict:
         conn = psycopg2.connect(db_url)
         cur = conn.cursor()
         
-        cur.execute('''
-            INSERT INTO rooms (name, password, max_players, current_players, status, created_by)
-            VALUES (%s, %s, %s, 1, 'waiting', %s)
-            RETURNING id, name, max_players, current_players, status, created_at
-        ''', (name, password, max_players, user_id))
+        cur.execute(ROOM_CREATE_SQL, {
+            'name': name, 'password': password, 'max_players': max_players, 'user_id': user_id
+        })
         
         room = cur.fetchone()
         conn.commit()
@@ -161,15 +179,15 @@ def update_room(event: dict) -> dict:
         cur = conn.cursor()
         
         updates = []
-        params = []
+        params = {'room_id': room_id}
         
         if current_players is not None:
-            updates.append('current_players = %s')
-            params.append(current_players)
+            updates.append('current_players = %(current_players)s')
+            params['current_players'] = current_players
         
         if status is not None:
-            updates.append('status = %s')
-            params.append(status)
+            updates.append('status = %(status)s')
+            params['status'] = status
         
         if not updates:
             return {
@@ -179,14 +197,7 @@ def update_room(event: dict) -> dict:
                 'isBase64Encoded': False
             }
         
-        params.append(room_id)
-        
-        cur.execute(f'''
-            UPDATE rooms
-            SET {', '.join(updates)}
-            WHERE id = %s
-            RETURNING id, name, max_players, current_players, status
-        ''', params)
+        cur.execute(ROOM_UPDATE_SQL.format(assignments=', '.join(updates)), params)
         
         room = cur.fetchone()
         conn.commit()
@@ -241,7 +252,7 @@ def delete_room(event: dict) -> dict:
         conn = psycopg2.connect(db_url)
         cur = conn.cursor()
         
-        cur.execute('UPDATE rooms SET status = %s WHERE id = %s', ('closed', room_id))
+        cur.execute(ROOM_CLOSE_SQL, {'status': 'closed', 'room_id': room_id})
         
         conn.commit()
         cur.close()
@@ -1,11 +1,10 @@
 import json
 import os
-import hashlib
-import hmac
-from datetime import datetime, timedelta
-from urllib.parse import parse_qs
-import psycopg2
-import jwt
+from login_service import upsert_user
+from tokens import display_name, issue_tokens
+from telegram_verifier import get_verifier
+
+AUTH_MAX_AGE = int(os.environ.get('TELEGRAM_AUTH_MAX_AGE', '86400'))
 
 def handler(event: dict, context) -> dict:
     '''API для авторизации через Telegram Widget'''
@@ -41,7 +40,6 @@ def handler(event: dict, context) -> dict:
             first_name = body.get('first_name', '')
             last_name = body.get('last_name', '')
             photo_url = body.get('photo_url', '')
-            auth_date = body.get('auth_date')
             hash_value = body.get('hash')
             
             if not telegram_id or not hash_value:
@@ -61,63 +59,15 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
-            check_data = {
-                'id': str(telegram_id),
-                'first_name': first_name,
-                'username': username,
-                'photo_url': photo_url,
-                'auth_date': str(auth_date)
-            }
-            check_data = {k: v for k, v in check_data.items() if v}
-            
-            data_check_string = '\n'.join([f'{k}={v}' for k, v in sorted(check_data.items())])
-            secret_key = hashlib.sha256(bot_token.encode()).digest()
-            calculated_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
-            
-            if calculated_hash != hash_value:
+            error = get_verifier(bot_token, AUTH_MAX_AGE).verify(body)
+            if error:
                 return {
                     'statusCode': 401,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Invalid authentication'}),
+                    'body': json.dumps({'error': error}),
                     'isBase64Encoded': False
                 }
             
-            db_url = os.environ.get('DATABASE_URL')
-            conn = psycopg2.connect(db_url)
-            cur = conn.cursor()
-            
-            cur.execute('''
-                INSERT INTO users (telegram_id, username, first_name, last_name, photo_url, last_login)
-                VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-                ON CONFLICT (telegram_id) 
-                DO UPDATE SET 
-                    username = EXCLUDED.username,
-                    first_name = EXCLUDED.first_name,
-                    last_name = EXCLUDED.last_name,
-                    photo_url = EXCLUDED.photo_url,
-                    last_login = CURRENT_TIMESTAMP
-                RETURNING id, telegram_id, username, first_name, last_name, photo_url, reputation, level, total_games, wins, losses
-            ''', (telegram_id, username, first_name, last_name, photo_url))
-            
-            user = cur.fetchone()
-            conn.commit()
-            cur.close()
-            conn.close()
-            
-            user_data = {
-                'id': user[0],
-                'telegram_id': user[1],
-                'username': user[2],
-                'first_name': user[3],
-                'last_name': user[4],
-                'photo_url': user[5],
-                'reputation': user[6],
-                'level': user[7],
-                'total_games': user[8],
-                'wins': user[9],
-                'losses': user[10]
-            }
-            
             jwt_secret = os.environ.get('JWT_SECRET')
             if not jwt_secret:
                 return {
@@ -127,20 +77,16 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
-            token = jwt.encode(
-                {
-                    'user_id': user[0],
-                    'telegram_id': user[1],
-                    'exp': datetime.utcnow() + timedelta(days=30)
-                },
-                jwt_secret,
-                algorithm='HS256'
+            user_data = upsert_user(telegram_id, username, first_name, last_name, photo_url)
+            tokens = issue_tokens(
+                user_data['id'], user_data['is_admin'], user_data['profile_created'],
+                display_name(user_data['profile_name'], user_data['first_name'])
             )
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'user': user_data, 'token': token}),
+                'body': json.dumps({'user': user_data, **tokens}),
                 'isBase64Encoded': False
             }
             
@@ -0,0 +1,52 @@
+import hashlib
+import hmac
+import time
+
+# Допустимое опережение часов клиента относительно сервера, секунд
+CLOCK_SKEW = 60
+
+class TelegramVerifier:
+    '''Проверка данных Telegram Login Widget.
+
+    Секрет (sha256 от токена бота) вычисляется один раз на тёплый
+    контейнер; подпись сравнивается за постоянное время.
+    '''
+
+    def __init__(self, bot_token, max_age=86400):
+        self.bot_token = bot_token
+        self.max_age = max_age
+        self._secret = hashlib.sha256(bot_token.encode()).digest()
+
+    def verify(self, data, now=None):
+        '''Возвращает текст ошибки или None, если данные подлинные и свежие'''
+        hash_value = data.get('hash')
+        if not isinstance(hash_value, str):
+            return 'Invalid authentication'
+        
+        try:
+            auth_date = int(data.get('auth_date'))
+        except (TypeError, ValueError):
+            return 'Invalid authentication'
+        
+        now = time.time() if now is None else now
+        if auth_date > now + CLOCK_SKEW or now - auth_date > self.max_age:
+            return 'Authentication data expired'
+        
+        # Строка проверки — все полученные поля, кроме hash, по алфавиту
+        data_check_string = '\n'.join(
+            f'{k}={v}' for k, v in sorted(data.items()) if k != 'hash' and v is not None
+        )
+        calculated_hash = hmac.new(self._secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+        
+        if not hmac.compare_digest(calculated_hash, hash_value):
+            return 'Invalid authentication'
+        return None
+
+_verifier = None
+
+def get_verifier(bot_token, max_age):
+    '''Проверяющий объект, переиспользуемый между вызовами тёплого контейнера'''
+    global _verifier
+    if _verifier is None or _verifier.bot_token != bot_token or _verifier.max_age != max_age:
+        _verifier = TelegramVerifier(bot_token, max_age)
+    return _verifier
@@ -1,9 +1,26 @@
 import json
 import os
-from datetime import datetime, timedelta
-import psycopg2
-import jwt
 import requests
+from requests.adapters import HTTPAdapter
+from login_service import upsert_user
+from tokens import display_name, issue_tokens
+
+YANDEX_TOKEN_URL = os.environ.get('YANDEX_TOKEN_URL', 'https://oauth.yandex.ru/token')
+YANDEX_INFO_URL = os.environ.get('YANDEX_INFO_URL', 'https://login.yandex.ru/info')
+HTTP_TIMEOUT = (
+    float(os.environ.get('YANDEX_CONNECT_TIMEOUT', '3')),
+    float(os.environ.get('YANDEX_READ_TIMEOUT', '5'))
+)
+
+def make_session():
+    '''HTTP-сессия с keep-alive: повторные входы в тёплом контейнере не делают новый TLS-handshake'''
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=10, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+http = make_session()
 
 def handler(event: dict, context) -> dict:
     '''API для авторизации через Яндекс ID'''
@@ -57,13 +74,13 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
-            token_response = requests.post('https://oauth.yandex.ru/token', data={
+            token_response = http.post(YANDEX_TOKEN_URL, data={
                 'grant_type': 'authorization_code',
                 'code': code,
                 'client_id': client_id,
                 'client_secret': client_secret,
                 'redirect_uri': redirect_uri
-            })
+            }, timeout=HTTP_TIMEOUT)
             
             if token_response.status_code != 200:
                 return {
@@ -75,9 +92,9 @@ def handler(event: dict, context) -> dict:
             
             access_token = token_response.json().get('access_token')
             
-            user_info_response = requests.get('https://login.yandex.ru/info', headers={
+            user_info_response = http.get(YANDEX_INFO_URL, headers={
                 'Authorization': f'OAuth {access_token}'
-            })
+            }, timeout=HTTP_TIMEOUT)
             
             if user_info_response.status_code != 200:
                 return {
@@ -96,59 +113,33 @@ def handler(event: dict, context) -> dict:
             if photo_url:
                 photo_url = f'https://avatars.yandex.net/get-yapic/{photo_url}/islands-200'
             
-            db_url = os.environ.get('DATABASE_URL')
-            conn = psycopg2.connect(db_url)
-            cur = conn.cursor()
-            
-            cur.execute('''
-                INSERT INTO users (telegram_id, username, first_name, last_name, photo_url, last_login)
-                VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-                ON CONFLICT (telegram_id) 
-                DO UPDATE SET 
-                    username = EXCLUDED.username,
-                    first_name = EXCLUDED.first_name,
-                    last_name = EXCLUDED.last_name,
-                    photo_url = EXCLUDED.photo_url,
-                    last_login = CURRENT_TIMESTAMP
-                RETURNING id, telegram_id, username, first_name, last_name, photo_url, reputation, level, total_games, wins, losses
-            ''', (int(yandex_id), username, first_name, last_name, photo_url))
-            
-            user = cur.fetchone()
-            conn.commit()
-            cur.close()
-            conn.close()
-            
-            user_data = {
-                'id': user[0],
-                'telegram_id': user[1],
-                'username': user[2],
-                'first_name': user[3],
-                'last_name': user[4],
-                'photo_url': user[5],
-                'reputation': user[6],
-                'level': user[7],
-                'total_games': user[8],
-                'wins': user[9],
-                'losses': user[10]
-            }
-            
-            token = jwt.encode(
-                {
-                    'user_id': user[0],
-                    'yandex_id': user[1],
-                    'exp': datetime.utcnow() + timedelta(days=30)
-                },
-                jwt_secret,
-                algorithm='HS256'
+            user_data = upsert_user(int(yandex_id), username, first_name, last_name, photo_url)
+            tokens = issue_tokens(
+                user_data['id'], user_data['is_admin'], user_data['profile_created'],
+                display_name(user_data['profile_name'], user_data['first_name'])
             )
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'user': user_data, 'token': token}),
+                'body': json.dumps({'user': user_data, **tokens}),
                 'isBase64Encoded': False
             }
             
+        except requests.Timeout:
+            return {
+                'statusCode': 504,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Yandex OAuth timeout'}),
+                'isBase64Encoded': False
+            }
+        except requests.RequestException:
+            return {
+                'statusCode': 502,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Yandex OAuth unavailable'}),
+                'isBase64Encoded': False
+            }
         except json.JSONDecodeError:
             return {
                 'statusCode': 400,
@@ -0,0 +1,107 @@
+import os
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+# Общий модуль входа для telegram-auth и yandex-auth: функции деплоятся
+# отдельными каталогами, поэтому в yandex-auth лежит копия этого файла, которую
+# обновляет benchmarks/shared_modules.py --write. Токены выдаёт tokens.py, общий с api.
+
+USER_COLUMNS = '''id, telegram_id, username, first_name, last_name, photo_url,
+                  reputation, level, total_games, wins, losses, is_admin, profile_created,
+                  profile_name'''
+
+# Строка переписывается только если изменились поля профиля или last_login
+# устарел больше чем на час; иначе существующая строка возвращается без записи
+UPSERT_USER_SQL = f'''
+    WITH upserted AS (
+        INSERT INTO users (telegram_id, username, first_name, last_name, photo_url, last_login)
+        VALUES (%(external_id)s, %(username)s, %(first_name)s, %(last_name)s, %(photo_url)s, CURRENT_TIMESTAMP)
+        ON CONFLICT (telegram_id)
+        DO UPDATE SET
+            username = EXCLUDED.username,
+            first_name = EXCLUDED.first_name,
+            last_name = EXCLUDED.last_name,
+            photo_url = EXCLUDED.photo_url,
+            last_login = CURRENT_TIMESTAMP
+        WHERE (users.username, users.first_name, users.last_name, users.photo_url)
+              IS DISTINCT FROM (EXCLUDED.username, EXCLUDED.first_name, EXCLUDED.last_name, EXCLUDED.photo_url)
+           OR users.last_login < CURRENT_TIMESTAMP - INTERVAL '1 hour'
+        RETURNING {USER_COLUMNS}
+    )
+    SELECT {USER_COLUMNS} FROM upserted
+    UNION ALL
+    SELECT {USER_COLUMNS} FROM users
+    WHERE telegram_id = %(external_id)s AND NOT EXISTS (SELECT 1 FROM upserted)
+'''
+
+# Если строку только что вставил параллельный вход, снимок запроса выше её
+# не видит и ничего не возвращает; новый запрос видит уже закоммиченную строку
+USER_SQL = f'''
+    SELECT {USER_COLUMNS} FROM users WHERE telegram_id = %(external_id)s
+'''
+
+_pool = None
+
+def get_pool():
+    '''Пул соединений живёт, пока контейнер функции тёплый'''
+    global _pool
+    if _pool is None:
+        _pool = ThreadedConnectionPool(
+            1,
+            int(os.environ.get('DB_POOL_MAX', '5')),
+            os.environ.get('DATABASE_URL')
+        )
+    return _pool
+
+def upsert_user(external_id, username, first_name, last_name, photo_url):
+    '''Создание или обновление пользователя при входе, одна транзакция'''
+    params = {
+        'external_id': external_id,
+        'username': username,
+        'first_name': first_name,
+        'last_name': last_name,
+        'photo_url': photo_url
+    }
+    pool = get_pool()
+    # Пока контейнер спал, база могла закрыть простаивающее соединение из пула:
+    # оно выбрасывается, и запрос повторяется один раз на свежем (upsert идемпотентен)
+    for attempt in range(2):
+        conn = pool.getconn()
+        try:
+            cur = conn.cursor()
+            cur.execute(UPSERT_USER_SQL, params)
+            user = cur.fetchone()
+            if user is None:
+                cur.execute(USER_SQL, {'external_id': external_id})
+                user = cur.fetchone()
+            conn.commit()
+            cur.close()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            pool.putconn(conn, close=True)
+            if attempt:
+                raise
+            continue
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            pool.putconn(conn, close=bool(conn.closed))
+            raise
+        pool.putconn(conn)
+        break
+    
+    return {
+        'id': user[0],
+        'telegram_id': user[1],
+        'username': user[2],
+        'first_name': user[3],
+        'last_name': user[4],
+        'photo_url': user[5],
+        'reputation': user[6],
+        'level': user[7],
+        'total_games': user[8],
+        'wins': user[9],
+        'losses': user[10],
+        'is_admin': user[11],
+        'profile_created': user[12],
+        'profile_name': user[13]
+    }
@@ -0,0 +1,74 @@
+'''Конкурентная активация бонусов через PUT ?path=bonuses
+
+Один пользователь с ограниченным запасом бонуса одновременно отправляет
+сотни активаций. Проверяется, что успешных активаций ровно столько,
+сколько было бонусов, и баланс не уходит в минус; печатается задержка
+и число SQL-запросов на активацию.
+
+    DATABASE_URL=postgres://... python benchmarks/bonus_activation.py --requests 300 --balance 50
+'''
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from common import Timer, connect, load_function, make_event, make_token, seed_users, summarize
+
+api = load_function('api')
+import metrics  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=300, help='параллельных активаций')
+    parser.add_argument('--balance', type=int, default=50, help='начальный запас бонуса')
+    parser.add_argument('--workers', type=int, default=64, help='потоков')
+    args = parser.parse_args()
+
+    conn = connect()
+    cur = conn.cursor()
+    user_id = seed_users(conn, 1, offset=900_000)[0]
+    cur.execute('UPDATE users SET bonus_shield = %s WHERE id = %s', (args.balance, user_id))
+    cur.execute('''
+        INSERT INTO rooms (name, max_players, status, created_by) VALUES ('bonus bench', 10, 'in_game', %s)
+        RETURNING id
+    ''', (user_id,))
+    room_id = cur.fetchone()[0]
+    cur.execute("INSERT INTO game_sessions (room_id, status) VALUES (%s, 'active') RETURNING id", (room_id,))
+    session_id = cur.fetchone()[0]
+    conn.commit()
+
+    token = make_token(user_id)
+    event = make_event('PUT', {'path': 'bonuses'}, token, {'session_id': session_id, 'bonus_type': 'shield'})
+
+    def activate(_):
+        with Timer() as t:
+            response = api.handler(event, None)
+        return response['statusCode'], t.elapsed
+
+    before = metrics.snapshot()
+    with Timer() as total, ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(activate, range(args.requests)))
+    after = metrics.snapshot()
+
+    succeeded = sum(1 for status, _ in results if status == 200)
+    rejected = sum(1 for status, _ in results if status == 400)
+    cur.execute('SELECT bonus_shield FROM users WHERE id = %s', (user_id,))
+    remaining = cur.fetchone()[0]
+
+    queries = sum(v - before.get(k, 0) for k, v in after.items()
+                  if k[0] == 'mafia_db_queries_total' and dict(k[1]).get('route') == 'bonuses')
+    print(f'requests={args.requests} succeeded={succeeded} rejected={rejected} '
+          f'remaining={remaining} elapsed={total.elapsed:.2f}s')
+    print(f'sql queries per activation: {queries / args.requests:.2f}')
+    print(summarize({'bonuses/activate': [elapsed for _, elapsed in results]}))
+
+    cur.execute('DELETE FROM game_active_bonuses WHERE session_id = %s', (session_id,))
+    cur.execute('DELETE FROM game_sessions WHERE id = %s', (session_id,))
+    cur.execute('DELETE FROM rooms WHERE id = %s', (room_id,))
+    conn.commit()
+    conn.close()
+
+    ok = succeeded == min(args.balance, args.requests) and remaining == args.balance - succeeded and remaining >= 0
+    print('no over-spend' if ok else 'OVER-SPEND DETECTED')
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    raise SystemExit(main())
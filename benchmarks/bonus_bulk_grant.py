@@ -0,0 +1,56 @@
+'''Массовая выдача бонусов: один POST ?path=bonuses&action=bulk против поштучных POST
+
+    DATABASE_URL=postgres://... python benchmarks/bonus_bulk_grant.py --grants 1000
+'''
+import argparse
+import json
+import random
+
+from common import Timer, connect, load_function, make_event, make_token, seed_users
+
+api = load_function('api')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--grants', type=int, default=1000, help='выдач в пачке')
+    parser.add_argument('--skip-single', action='store_true', help='не замерять поштучную выдачу')
+    args = parser.parse_args()
+
+    conn = connect()
+    user_ids = seed_users(conn, args.grants + 1, offset=800_000)
+    admin_id, targets = user_ids[0], user_ids[1:]
+    cur = conn.cursor()
+    cur.execute('UPDATE users SET is_admin = TRUE WHERE id = %s', (admin_id,))
+    cur.execute('SELECT SUM(bonus_shield + bonus_documents + bonus_privilege) FROM users WHERE id = ANY(%s)', (targets,))
+    total_before = cur.fetchone()[0] or 0
+    conn.commit()
+    token = make_token(admin_id)
+
+    grants = [{'user_id': uid, 'bonus_type': random.choice(['documents', 'shield', 'privilege']), 'amount': 1}
+              for uid in targets]
+
+    with Timer() as bulk:
+        response = api.handler(make_event('POST', {'path': 'bonuses', 'action': 'bulk'}, token, {'grants': grants}), None)
+    result = json.loads(response['body'])
+    print(f'bulk:   {len(grants)} grants in {bulk.elapsed * 1000:.1f}ms '
+          f'(status {response["statusCode"]}, granted={result.get("granted")})')
+
+    if not args.skip_single:
+        with Timer() as single:
+            for grant in grants:
+                api.handler(make_event('POST', {'path': 'bonuses'}, token, grant), None)
+        print(f'single: {len(grants)} grants in {single.elapsed * 1000:.1f}ms '
+              f'({single.elapsed / bulk.elapsed:.1f}x slower)')
+
+    cur.execute('SELECT SUM(bonus_shield + bonus_documents + bonus_privilege) FROM users WHERE id = ANY(%s)', (targets,))
+    total_after = cur.fetchone()[0]
+    expected = total_before + len(grants) * (1 if args.skip_single else 2)
+    cur.execute('UPDATE users SET is_admin = FALSE WHERE id = %s', (admin_id,))
+    conn.commit()
+    conn.close()
+
+    print('balances consistent' if total_after == expected else f'MISMATCH: {total_after} != {expected}')
+    return 0 if total_after == expected else 1
+
+if __name__ == '__main__':
+    raise SystemExit(main())
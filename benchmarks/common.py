@@ -0,0 +1,118 @@
+'''Общие помощники для нагрузочных тестов и бенчмарков
+
+Скрипты работают с локальным Postgres, в который применены миграции
+из db_migrations/. Подключение берётся из DATABASE_URL, секрет JWT —
+из JWT_SECRET (для локального прогона подставляется тестовый).
+'''
+import importlib.util
+import json
+import math
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import jwt
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, 'backend')
+MIGRATIONS = os.path.join(ROOT, 'db_migrations')
+
+# Диапазон telegram_id для синтетических пользователей, чтобы не задеть реальные данные
+BENCH_TELEGRAM_ID_BASE = 9_000_000_000
+
+os.environ.setdefault('JWT_SECRET', 'bench-secret')
+
+def load_function(name, module='index'):
+    '''Импорт модуля облачной функции из backend/<name>'''
+    path = os.path.join(BACKEND, name)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    spec = importlib.util.spec_from_file_location(f'{name.replace("-", "_")}_{module}', os.path.join(path, f'{module}.py'))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+def connect():
+    db_url = os.environ.get('DATABASE_URL')
+    if not db_url:
+        sys.exit('DATABASE_URL is not set')
+    return psycopg2.connect(db_url)
+
+def make_token(user_id, name=None):
+    '''Access JWT в том же формате, что выдают функции авторизации; имя по умолчанию как у seed_users'''
+    return jwt.encode(
+        {'type': 'access', 'user_id': user_id, 'name': name or f'Bench {user_id}',
+         'exp': datetime.utcnow() + timedelta(hours=1)},
+        os.environ['JWT_SECRET'],
+        algorithm='HS256'
+    )
+
+def seed_users(conn, count, offset=0):
+    '''Создание синтетических пользователей, возвращает список id'''
+    cur = conn.cursor()
+    cur.execute('''
+        INSERT INTO users (telegram_id, username, first_name)
+        SELECT %s + n, 'bench_' || n, 'Bench ' || n
+        FROM generate_series(%s, %s) AS n
+        ON CONFLICT (telegram_id) DO UPDATE SET username = EXCLUDED.username
+        RETURNING id
+    ''', (BENCH_TELEGRAM_ID_BASE, offset, offset + count - 1))
+    ids = sorted(row[0] for row in cur.fetchall())
+    conn.commit()
+    cur.close()
+    return ids
+
+def make_event(method, params, token=None, body=None, headers=None):
+    '''Событие в формате облачной функции'''
+    event_headers = dict(headers or {})
+    if token:
+        event_headers['X-Auth-Token'] = token
+    return {
+        'httpMethod': method,
+        'queryStringParameters': params,
+        'headers': event_headers,
+        'body': json.dumps(body) if body is not None else '',
+    }
+
+def ws_event(event_type, connection_id, body=None, token=None):
+    '''Событие game-websocket; токен передаётся при CONNECT, как из браузера (?token=...)'''
+    return {
+        'requestContext': {'eventType': event_type, 'connectionId': connection_id},
+        'queryStringParameters': {'token': token} if token else {},
+        'body': json.dumps(body) if body is not None else ''
+    }
+
+def percentile(samples, pct):
+    '''Перцентиль методом ближайшего ранга'''
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(timings):
+    '''Строки отчёта: действие, количество, p50/p95/p99 в миллисекундах'''
+    lines = [f'{"action":<16}{"count":>8}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"max ms":>10}']
+    for action in sorted(timings):
+        samples = timings[action]
+        lines.append(
+            f'{action:<16}{len(samples):>8}'
+            f'{percentile(samples, 50) * 1000:>10.2f}'
+            f'{percentile(samples, 95) * 1000:>10.2f}'
+            f'{percentile(samples, 99) * 1000:>10.2f}'
+            f'{max(samples) * 1000:>10.2f}'
+        )
+    return '\n'.join(lines)
+
+class Timer:
+    '''Контекст для замера времени'''
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        return False
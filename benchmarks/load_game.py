@@ -0,0 +1,168 @@
+'''Нагрузочный тест: N комнат одновременно проходят полную игру через api/index.py
+
+Каждая комната: создание, вход игроков (room/join), опрос room/state,
+всплеск чата, game/start, голосования и опрос game/state. Отчёт —
+пропускная способность, p50/p95/p99 по действиям и число SQL-запросов
+на маршрут (по счётчикам из metrics.py).
+
+    DATABASE_URL=postgres://... python benchmarks/load_game.py --rooms 50 --players 10
+'''
+import argparse
+import json
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from common import Timer, connect, load_function, make_event, make_token, seed_users, summarize
+
+api = load_function('api')
+import metrics  # noqa: E402  тот же модуль, что использует api/index.py
+
+def call(timings, errors, action, event):
+    with Timer() as t:
+        response = api.handler(event, None)
+    timings[action].append(t.elapsed)
+    if response['statusCode'] != 200:
+        errors[action] += 1
+        return None
+    return json.loads(response['body'])
+
+def play_room(room_no, user_ids, args):
+    '''Полный сценарий одной комнаты, возвращает замеры и ошибки'''
+    timings = defaultdict(list)
+    errors = defaultdict(int)
+    tokens = {uid: make_token(uid) for uid in user_ids}
+    creator = user_ids[0]
+
+    created = call(timings, errors, 'rooms/create', make_event(
+        'POST', {'path': 'rooms'}, tokens[creator],
+        {'name': f'bench room {room_no}', 'max_players': 20}
+    ))
+    if not created:
+        return timings, errors
+    room_id = created['room_id']
+
+    for uid in user_ids:
+        call(timings, errors, 'room/join', make_event(
+            'POST', {'path': 'room', 'action': 'join'}, tokens[uid],
+            {'room_id': room_id, 'user_name': f'player {uid}'}
+        ))
+
+    for _ in range(args.polls):
+        for uid in user_ids:
+            call(timings, errors, 'room/state', make_event(
+                'GET', {'path': 'room', 'action': 'state', 'room_id': str(room_id)}, tokens[uid]
+            ))
+
+    for n in range(args.chat):
+        for uid in user_ids:
+            call(timings, errors, 'room/chat', make_event(
+                'POST', {'path': 'room', 'action': 'chat'}, tokens[uid],
+                {'room_id': room_id, 'message': f'message {n} from {uid}'}
+            ))
+
+    started = call(timings, errors, 'game/start', make_event(
+        'POST', {'path': 'game', 'action': 'start'}, tokens[creator], {'room_id': room_id}
+    ))
+    if not started:
+        return timings, errors
+    session_id = started['session_id']
+
+    for _ in range(args.rounds):
+        for uid in user_ids:
+            call(timings, errors, 'game/vote', make_event(
+                'POST', {'path': 'game', 'action': 'vote'}, tokens[uid],
+                {'session_id': session_id, 'target_id': random.choice(user_ids)}
+            ))
+        for _ in range(args.polls):
+            for uid in user_ids:
+                call(timings, errors, 'game/state', make_event(
+                    'GET', {'path': 'game', 'action': 'state', 'session_id': str(session_id)}, tokens[uid]
+                ))
+
+    call(timings, errors, 'room/leave', make_event(
+        'POST', {'path': 'room', 'action': 'leave'}, tokens[creator], {'room_id': room_id}
+    ))
+    return timings, errors
+
+def cleanup(conn, user_ids):
+    '''Удаление комнат и игр, созданных синтетическими пользователями'''
+    cur = conn.cursor()
+    cur.execute('SELECT id FROM rooms WHERE created_by = ANY(%s)', (user_ids,))
+    room_ids = [r[0] for r in cur.fetchall()]
+    cur.execute('SELECT id FROM game_sessions WHERE room_id = ANY(%s)', (room_ids,))
+    session_ids = [r[0] for r in cur.fetchall()]
+    cur.execute('DELETE FROM votes WHERE session_id = ANY(%s)', (session_ids,))
+    cur.execute('DELETE FROM game_active_bonuses WHERE session_id = ANY(%s)', (session_ids,))
+    cur.execute('DELETE FROM session_players WHERE session_id = ANY(%s)', (session_ids,))
+    cur.execute('UPDATE rooms SET active_session_id = NULL WHERE id = ANY(%s)', (room_ids,))
+    cur.execute('DELETE FROM game_sessions WHERE id = ANY(%s)', (session_ids,))
+    cur.execute('DELETE FROM room_chat WHERE room_id = ANY(%s)', (room_ids,))
+    cur.execute('DELETE FROM room_players WHERE room_id = ANY(%s)', (room_ids,))
+    cur.execute('DELETE FROM rooms WHERE id = ANY(%s)', (room_ids,))
+    conn.commit()
+    cur.close()
+
+def db_queries_by_route(before, after):
+    queries = {}
+    requests = defaultdict(int)
+    for (name, labels), value in after.items():
+        delta = value - before.get((name, labels), 0)
+        if not delta:
+            continue
+        labels = dict(labels)
+        if name == 'mafia_db_queries_total':
+            queries[labels['route']] = delta
+        elif name == 'mafia_api_requests_total':
+            requests[labels['route']] += delta
+    return queries, requests
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rooms', type=int, default=20, help='одновременных комнат')
+    parser.add_argument('--players', type=int, default=10, help='игроков в комнате (4-20)')
+    parser.add_argument('--polls', type=int, default=5, help='опросов состояния на игрока за фазу')
+    parser.add_argument('--chat', type=int, default=3, help='сообщений чата на игрока')
+    parser.add_argument('--rounds', type=int, default=3, help='раундов голосования')
+    parser.add_argument('--keep', action='store_true', help='не удалять созданные данные')
+    args = parser.parse_args()
+
+    conn = connect()
+    user_ids = seed_users(conn, args.rooms * args.players)
+    groups = [user_ids[i * args.players:(i + 1) * args.players] for i in range(args.rooms)]
+
+    before = metrics.snapshot()
+    started = time.perf_counter()
+    timings = defaultdict(list)
+    errors = defaultdict(int)
+    with ThreadPoolExecutor(max_workers=args.rooms) as pool:
+        for room_timings, room_errors in pool.map(lambda g: play_room(g[0], g[1], args), enumerate(groups)):
+            for action, samples in room_timings.items():
+                timings[action].extend(samples)
+            for action, count in room_errors.items():
+                errors[action] += count
+    elapsed = time.perf_counter() - started
+    after = metrics.snapshot()
+
+    total = sum(len(s) for s in timings.values())
+    print(f'rooms={args.rooms} players={args.players} requests={total} '
+          f'elapsed={elapsed:.2f}s throughput={total / elapsed:.1f} req/s')
+    print(summarize(timings))
+
+    queries, requests = db_queries_by_route(before, after)
+    print(f'\n{"route":<16}{"queries":>10}{"per req":>10}')
+    for route in sorted(queries):
+        per_request = queries[route] / requests[route] if requests[route] else 0
+        print(f'{route:<16}{queries[route]:>10}{per_request:>10.2f}')
+
+    if errors:
+        print('\nerrors: ' + ', '.join(f'{a}={c}' for a, c in sorted(errors.items())))
+
+    if not args.keep:
+        cleanup(conn, user_ids)
+    conn.close()
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
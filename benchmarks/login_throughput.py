@@ -0,0 +1,85 @@
+'''Пропускная способность входа через telegram-auth
+
+Первый проход создаёт пользователей, повторные — входы без изменений
+профиля, которые не должны переписывать строку (проверяется по xmin).
+
+    DATABASE_URL=postgres://... python benchmarks/login_throughput.py --users 500 --workers 8
+'''
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import BENCH_TELEGRAM_ID_BASE, Timer, connect, load_function, summarize
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'bench:token')
+auth = load_function('telegram-auth')
+
+def signed_payload(telegram_id):
+    '''Данные виджета Telegram с корректной подписью'''
+    data = {
+        'id': telegram_id,
+        'first_name': f'Login {telegram_id}',
+        'username': f'login_{telegram_id}',
+        'auth_date': int(time.time()),
+    }
+    check_string = '\n'.join(f'{k}={v}' for k, v in sorted(data.items()))
+    secret = hashlib.sha256(os.environ['TELEGRAM_BOT_TOKEN'].encode()).digest()
+    data['hash'] = hmac.new(secret, check_string.encode(), hashlib.sha256).hexdigest()
+    return data
+
+def login(payload):
+    with Timer() as t:
+        response = auth.handler({'httpMethod': 'POST', 'body': json.dumps(payload)}, None)
+    return response['statusCode'], t.elapsed
+
+def run(payloads, workers):
+    with Timer() as total, ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(login, payloads))
+    errors = sum(1 for status, _ in results if status != 200)
+    return [elapsed for _, elapsed in results], errors, total.elapsed
+
+def row_versions(cur, telegram_ids):
+    cur.execute('SELECT telegram_id, xmin::text FROM users WHERE telegram_id = ANY(%s)', (telegram_ids,))
+    return dict(cur.fetchall())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=3, help='повторных входов каждого пользователя')
+    args = parser.parse_args()
+
+    telegram_ids = [BENCH_TELEGRAM_ID_BASE + 700_000 + n for n in range(args.users)]
+    conn = connect()
+    cur = conn.cursor()
+
+    timings = {}
+    samples, errors, elapsed = run([signed_payload(t) for t in telegram_ids], args.workers)
+    timings['first_login'] = samples
+    print(f'first login:  {len(samples) / elapsed:8.1f} logins/s, errors={errors}')
+
+    versions = row_versions(cur, telegram_ids)
+    conn.commit()
+    repeat_samples = []
+    for _ in range(args.repeats):
+        samples, errors, elapsed = run([signed_payload(t) for t in telegram_ids], args.workers)
+        repeat_samples.extend(samples)
+        print(f'repeat login: {len(samples) / elapsed:8.1f} logins/s, errors={errors}')
+    timings['repeat_login'] = repeat_samples
+
+    rewritten = sum(1 for t, v in row_versions(cur, telegram_ids).items() if versions.get(t) != v)
+    conn.commit()
+    print(f'rows rewritten by unchanged repeat logins: {rewritten}')
+    print(summarize(timings))
+
+    cur.execute('DELETE FROM users WHERE telegram_id = ANY(%s)', (telegram_ids,))
+    conn.commit()
+    conn.close()
+    return 1 if rewritten else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
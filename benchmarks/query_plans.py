@@ -0,0 +1,232 @@
+'''Регрессионная проверка планов запросов на больших данных
+
+Для каждого SQL-запроса из api/rooms.py, api/game_state.py, api/bonuses.py,
+api/session_bonuses.py, api/profile_cache.py, api/shop_catalog.py,
+api/purchases.py, api/tokens.py, api/utils.py, api/auth.py, api/index.py,
+rooms-api/index.py и game-websocket/game_store.py выполняет EXPLAIN (ANALYZE,
+FORMAT JSON) на базе, наполненной seed_dataset.py. Текст запросов импортируется
+из модулей функций. Проверка падает, если план содержит Seq Scan по большой
+таблице или время выполнения превышает бюджет запроса, а также если запрос не
+использует ожидаемый индекс (expect_index). Модифицирующие запросы выполняются
+в транзакции, которая откатывается.
+
+    DATABASE_URL=postgres://localhost/mafia_bench python benchmarks/query_plans.py
+'''
+import argparse
+import json
+
+from common import connect, load_function
+
+# Таблицы, полный просмотр которых на продакшен-объёмах недопустим
+LARGE_TABLES = {'users', 'rooms', 'room_chat', 'votes', 'game_sessions', 'session_players'}
+
+DEFAULT_BUDGET_MS = 20
+
+def q(name, source, sql, params=None, budget_ms=DEFAULT_BUDGET_MS, allow_seq_scan=False, expect_index=None):
+    '''Запрос из модуля функции; params дополняют значения из pick_params'''
+    return {
+        'name': name, 'source': source, 'sql': sql, 'params': params or {}, 'budget_ms': budget_ms,
+        'allow_seq_scan': allow_seq_scan, 'expect_index': expect_index
+    }
+
+# SQL берётся из самих модулей, чтобы проверялось ровно то, что выполняется
+rooms = load_function('api', 'rooms')
+game_state = load_function('api', 'game_state')
+bonuses = load_function('api', 'bonuses')
+session_bonuses = load_function('api', 'session_bonuses')
+profile_cache = load_function('api', 'profile_cache')
+shop_catalog = load_function('api', 'shop_catalog')
+purchases = load_function('api', 'purchases')
+utils = load_function('api', 'utils')
+auth = load_function('api', 'auth')
+api = load_function('api', 'index')
+rooms_api = load_function('rooms-api', 'index')
+game_store = load_function('game-websocket', 'game_store')
+
+QUERIES = [
+    # api/rooms.py
+    q('rooms.cleanup_stale', 'api/rooms.py:handle_rooms', rooms.ROOMS_CLEANUP_SQL),
+    q('rooms.list', 'api/rooms.py:handle_rooms', rooms.ROOMS_LIST_SQL,
+      budget_ms=100, expect_index='idx_rooms_status_created'),
+    q('rooms.create', 'api/rooms.py:handle_rooms', rooms.ROOM_CREATE_SQL,
+      {'name': 'bench', 'password': None, 'max_players': 10}),
+    q('room.join_creator', 'api/rooms.py:handle_room', rooms.ROOM_CREATOR_SQL),
+    q('room.join_upsert', 'api/rooms.py:handle_room', rooms.ROOM_JOIN_SQL, {'user_name': 'bench', 'is_creator': False}),
+    q('room.state_touch', 'api/rooms.py:handle_room', rooms.ROOM_TOUCH_SQL),
+    q('room.state_cleanup', 'api/rooms.py:handle_room', rooms.ROOM_CLEANUP_SQL),
+    q('room.state_players', 'api/rooms.py:handle_room', rooms.ROOM_PLAYERS_SQL),
+    q('room.state_chat', 'api/rooms.py:handle_room', rooms.ROOM_CHAT_SQL, expect_index='idx_room_chat_room'),
+    q('room.state_session', 'api/rooms.py:handle_room', rooms.ROOM_SESSION_SQL),
+    q('room.chat_member', 'api/rooms.py:handle_room', rooms.CHAT_MEMBER_SQL),
+    q('room.chat_insert', 'api/rooms.py:handle_room', rooms.CHAT_INSERT_SQL,
+      {'user_name': 'bench', 'message': 'bench message'}),
+    q('room.leave', 'api/rooms.py:handle_room', rooms.ROOM_LEAVE_SQL),
+    q('game.start_players', 'api/rooms.py:handle_game', rooms.GAME_PLAYERS_SQL),
+    q('game.start_session', 'api/rooms.py:handle_game', rooms.GAME_SESSION_SQL),
+    q('game.start_player_role', 'api/rooms.py:handle_game', rooms.SESSION_PLAYER_SQL,
+      {'role': 'civilian', 'is_alive': True}),
+    q('game.start_room', 'api/rooms.py:handle_game', rooms.GAME_ROOM_SQL, {'status': 'in_game'}),
+    q('game.vote_session', 'api/rooms.py:handle_game', rooms.VOTE_SESSION_SQL),
+    q('game.vote_delete', 'api/rooms.py:handle_game', rooms.VOTE_DELETE_SQL, expect_index='idx_votes_voter_phase'),
+    q('game.vote_insert', 'api/rooms.py:handle_game', rooms.VOTE_INSERT_SQL),
+    # api/game_state.py
+    q('state.session', 'api/game_state.py', game_state.SESSION_SQL),
+    q('state.players', 'api/game_state.py', game_state.SESSION_PLAYERS_SQL),
+    q('state.voted', 'api/game_state.py', game_state.PLAYER_VOTED_SQL, expect_index='idx_votes_voter_phase'),
+    q('state.finish', 'api/game_state.py', game_state.FINISH_SESSION_SQL),
+    q('state.chat', 'api/game_state.py', game_state.SESSION_CHAT_SQL, expect_index='idx_room_chat_room'),
+    # api/bonuses.py
+    q('bonuses.get', 'api/bonuses.py', bonuses.BONUSES_SQL),
+    q('bonuses.grant', 'api/bonuses.py', bonuses.GRANT_BONUS_SQL.format(column='bonus_shield'), {'amount': 1}),
+    q('bonuses.activate', 'api/bonuses.py', bonuses.ACTIVATE_BONUS_SQL.format(column='bonus_shield'),
+      {'bonus_type': 'shield'}),
+    q('bonuses.bulk_grant', 'api/bonuses.py:grant_bonuses_bulk',
+      bonuses.BULK_GRANT_SQL.replace('%s', '(%(user_id)s::int, 0, 1, 0)')),
+    q('session_bonuses.load', 'api/session_bonuses.py', session_bonuses.SESSION_BONUSES_SQL,
+      expect_index='idx_game_active_bonuses_session'),
+    # api/index.py
+    q('profile.get', 'api/profile_cache.py', profile_cache.PROFILE_SQL),
+    q('profile.name_taken', 'api/profile_cache.py', profile_cache.NAME_TAKEN_SQL,
+      expect_index='idx_users_profile_name_lower'),
+    q('profile.claim', 'api/index.py', api.CLAIM_PROFILE_SQL, {'profile_name': 'bench_unique_name'}),
+    q('admin.check', 'api/utils.py:check_admin', utils.CHECK_ADMIN_SQL),
+    q('auth.revocations', 'api/tokens.py:refresh_revocations', utils.REVOCATIONS_SQL,
+      {'access_ttl': utils.ACCESS_TOKEN_TTL}),
+    q('auth.revoke', 'api/utils.py:revoke_tokens', utils.REVOKE_TOKENS_SQL, {'refresh': True}),
+    q('auth.refresh_user', 'api/auth.py:handle_auth', auth.REFRESH_USER_SQL),
+    q('auth.use_refresh', 'api/auth.py:handle_auth', auth.USE_REFRESH_TOKEN_SQL,
+      {'jti': 'bench-jti', 'exp': 2_000_000_000}),
+    q('admin.count', 'api/index.py', api.ADMIN_COUNT_SQL),
+    # Полный список профилей отдаётся целиком — просмотр таблицы ожидаем
+    q('admin.users', 'api/index.py', api.ADMIN_USERS_SQL, budget_ms=2000, allow_seq_scan=True),
+    q('admin.set', 'api/index.py', api.ADMIN_SET_SQL, {'is_admin': False}),
+    q('shop.list', 'api/shop_catalog.py', shop_catalog.CATALOG_SQL, expect_index='idx_shop_items_available_created'),
+    q('shop.create', 'api/index.py', api.SHOP_CREATE_SQL,
+      {'name': 'bench', 'description': '', 'price': 10, 'image_url': ''}),
+    q('shop.delete', 'api/index.py', api.SHOP_DELETE_SQL),
+    # api/purchases.py
+    q('shop.purchase', 'api/purchases.py:purchase_item', purchases.PURCHASE_SQL),
+    q('shop.purchase_replay', 'api/purchases.py:purchase_item', purchases.PURCHASE_REPLAY_SQL),
+    q('shop.purchases', 'api/purchases.py:list_purchases', purchases.PURCHASES_SQL),
+    # rooms-api/index.py
+    q('rooms_api.list', 'rooms-api/index.py', rooms_api.ROOMS_LIST_SQL, {'status': 'waiting'},
+      expect_index='idx_rooms_status_created'),
+    q('rooms_api.create', 'rooms-api/index.py', rooms_api.ROOM_CREATE_SQL,
+      {'name': 'bench', 'password': None, 'max_players': 10}),
+    q('rooms_api.update', 'rooms-api/index.py',
+      rooms_api.ROOM_UPDATE_SQL.format(assignments='current_players = %(current_players)s'), {'current_players': 5}),
+    q('rooms_api.close', 'rooms-api/index.py', rooms_api.ROOM_CLOSE_SQL, {'status': 'closed'}),
+    # game-websocket/game_store.py
+    q('ws.restore_room', 'game-websocket/game_store.py:restore_room', game_store.RESTORE_ROOM_SQL),
+    q('ws.finish_sessions', 'game-websocket/game_store.py:write_batch', game_store.FINISH_SESSIONS_SQL),
+    q('ws.known_rooms', 'game-websocket/game_store.py:write_batch', game_store.KNOWN_ROOMS_SQL),
+    q('ws.sessions_insert', 'game-websocket/game_store.py:write_batch',
+      game_store.SESSIONS_INSERT_SQL.replace('%s', "(%(room_id)s, 'active', 'night', 1)")),
+    q('ws.session_players_insert', 'game-websocket/game_store.py:write_batch',
+      game_store.SESSION_PLAYERS_INSERT_SQL.replace('%s', "(%(session_id)s, %(user_id)s, 'civilian', true)")),
+    q('ws.rooms_start', 'game-websocket/game_store.py:write_batch',
+      game_store.ROOMS_START_SQL.replace('%s', '(%(room_id)s, %(session_id)s)')),
+    q('ws.sessions_update', 'game-websocket/game_store.py:write_batch',
+      game_store.SESSIONS_UPDATE_SQL.replace('%s', '(%(session_id)s::int, %(phase)s, %(day_number)s::int)')),
+    q('ws.players_alive', 'game-websocket/game_store.py:write_batch',
+      game_store.PLAYERS_ALIVE_SQL.replace('%s', '(%(session_id)s::int, %(voter_id)s::int, false)')),
+]
+
+def pick_params(cur):
+    '''Реальные идентификаторы из наполненной базы для подстановки в запросы'''
+    cur.execute('''
+        SELECT rp.room_id, rp.user_id
+        FROM rooms r JOIN room_players rp ON rp.room_id = r.id
+        WHERE r.status = 'waiting'
+        LIMIT 1
+    ''')
+    room_id, user_id = cur.fetchone()
+    cur.execute('''
+        SELECT gs.id, gs.phase, gs.day_number, sp.user_id
+        FROM game_sessions gs JOIN session_players sp ON sp.session_id = gs.id
+        WHERE gs.status = 'active'
+        LIMIT 1
+    ''')
+    session_id, phase, day_number, voter_id = cur.fetchone()
+    cur.execute('SELECT profile_name FROM users WHERE profile_name IS NOT NULL LIMIT 1')
+    profile_name = cur.fetchone()[0]
+    cur.execute('SELECT id FROM shop_items LIMIT 1')
+    item_id = cur.fetchone()[0]
+    return {
+        'room_id': room_id, 'user_id': user_id, 'session_id': session_id,
+        'phase': phase, 'day_number': day_number, 'voter_id': voter_id,
+        'target_id': user_id, 'profile_name': profile_name,
+        'item_id': item_id, 'request_id': 'bench-request',
+        'room_ids': [room_id], 'session_ids': [session_id],
+    }
+
+def walk(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from walk(child)
+
+def explain(conn, query, params, runs):
+    '''Лучшее время из нескольких прогонов и план последнего'''
+    cur = conn.cursor()
+    best = None
+    plan = None
+    for _ in range(runs):
+        cur.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + query['sql'], {**params, **query['params']})
+        result = cur.fetchone()[0]
+        result = result[0] if isinstance(result, list) else json.loads(result)[0]
+        conn.rollback()
+        if best is None or result['Execution Time'] < best:
+            best = result['Execution Time']
+        plan = result['Plan']
+    cur.close()
+    return best, plan
+
+def check(query, elapsed_ms, plan, budget_scale):
+    '''Список нарушений для запроса'''
+    problems = []
+    nodes = list(walk(plan))
+    if not query['allow_seq_scan']:
+        for node in nodes:
+            if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in LARGE_TABLES:
+                problems.append(f'seq scan on {node["Relation Name"]}')
+    if query['expect_index'] and not any(node.get('Index Name') == query['expect_index'] for node in nodes):
+        problems.append(f'index {query["expect_index"]} not used')
+    budget = query['budget_ms'] * budget_scale
+    if elapsed_ms > budget:
+        problems.append(f'{elapsed_ms:.1f}ms > budget {budget:.0f}ms')
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help='прогонов на запрос (берётся лучший)')
+    parser.add_argument('--budget-scale', type=float, default=1.0, help='множитель бюджетов для медленных машин')
+    parser.add_argument('--only', help='подстрока имени запроса')
+    parser.add_argument('--verbose', action='store_true', help='печатать планы с нарушениями')
+    args = parser.parse_args()
+
+    conn = connect()
+    cur = conn.cursor()
+    params = pick_params(cur)
+    cur.close()
+    conn.rollback()
+
+    failures = 0
+    print(f'{"query":<28}{"ms":>10}{"budget":>10}  result')
+    for query in QUERIES:
+        if args.only and args.only not in query['name']:
+            continue
+        elapsed_ms, plan = explain(conn, query, params, args.runs)
+        problems = check(query, elapsed_ms, plan, args.budget_scale)
+        status = 'FAIL ' + '; '.join(problems) if problems else 'ok'
+        print(f'{query["name"]:<28}{elapsed_ms:>10.2f}{query["budget_ms"] * args.budget_scale:>10.0f}  {status}')
+        if problems:
+            failures += 1
+            if args.verbose:
+                print(json.dumps(plan, indent=2))
+
+    conn.close()
+    print(f'\n{failures} of {len(QUERIES)} queries failed' if failures else '\nall query plans ok')
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,161 @@
+'''Наполнение Postgres объёмами, близкими к продакшену
+
+Применяет миграции из db_migrations/ к пустой базе и генерирует данные
+на стороне сервера через generate_series. При --scale 1.0:
+1M пользователей, 100k комнат, 10M сообщений room_chat, 5M голосов.
+
+    DATABASE_URL=postgres://localhost/mafia_bench python benchmarks/seed_dataset.py --scale 1.0
+'''
+import argparse
+import glob
+import os
+import time
+
+from common import MIGRATIONS, connect
+
+BASE_VOLUMES = {
+    'users': 1_000_000,
+    'rooms': 100_000,
+    'room_chat': 10_000_000,
+    'votes': 5_000_000,
+    'shop_items': 1_000,
+}
+
+def apply_migrations(conn):
+    '''Применение всех миграций по порядку версий'''
+    cur = conn.cursor()
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS, 'V*.sql'))):
+        with open(path, encoding='utf-8') as f:
+            cur.execute(f.read())
+        print(f'applied {os.path.basename(path)}')
+    conn.commit()
+    cur.close()
+
+def step(cur, title, sql, params=None):
+    started = time.perf_counter()
+    cur.execute(sql, params)
+    print(f'{title:<24}{cur.rowcount:>12} rows {time.perf_counter() - started:>8.1f}s')
+
+def seed(conn, scale):
+    '''Генерация данных; распределения подобраны под реальные выборки API'''
+    volumes = {k: max(1, int(v * scale)) for k, v in BASE_VOLUMES.items()}
+    cur = conn.cursor()
+
+    step(cur, 'users', '''
+        INSERT INTO users (telegram_id, username, first_name, last_name, reputation, level,
+                           profile_name, profile_created, is_admin,
+                           bonus_documents, bonus_shield, bonus_privilege, created_at)
+        SELECT n, 'user_' || n, 'First ' || n, 'Last ' || n, (n %% 5000), 1 + (n %% 30),
+               CASE WHEN n %% 3 = 0 THEN 'player_' || n END, n %% 3 = 0, n = 1,
+               n %% 4, n %% 3, n %% 2, NOW() - (n || ' seconds')::interval
+        FROM generate_series(1, %s) AS n
+    ''', (volumes['users'],))
+    cur.execute('SELECT MIN(id), MAX(id) FROM users')
+    u_min, u_max = cur.fetchone()
+    u_span = u_max - u_min
+
+    # ~1% ожидающих, ~1% в игре, остальные закрыты
+    step(cur, 'rooms', '''
+        INSERT INTO rooms (name, password, max_players, current_players, status, created_by, created_at)
+        SELECT 'Room ' || n, CASE WHEN n %% 7 = 0 THEN 'secret' END, 20, 0,
+               CASE WHEN n %% 100 = 0 THEN 'waiting' WHEN n %% 100 = 1 THEN 'in_game' ELSE 'closed' END,
+               %s + (random() * %s)::int, NOW() - (n || ' seconds')::interval
+        FROM generate_series(1, %s) AS n
+    ''', (u_min, u_span, volumes['rooms']))
+    cur.execute('SELECT MIN(id), MAX(id) FROM rooms')
+    r_min, r_max = cur.fetchone()
+    r_span = r_max - r_min
+
+    step(cur, 'game_sessions', '''
+        INSERT INTO game_sessions (room_id, status, phase, day_number)
+        SELECT id, CASE WHEN status = 'in_game' THEN 'active' ELSE 'finished' END,
+               'day', 1 + (id % 5)
+        FROM rooms WHERE status = 'in_game' OR id % 2 = 0
+    ''')
+    step(cur, 'rooms.active_session_id', '''
+        UPDATE rooms r SET active_session_id = gs.id
+        FROM game_sessions gs
+        WHERE gs.room_id = r.id AND gs.status = 'active'
+    ''')
+    cur.execute('SELECT MIN(id), MAX(id) FROM game_sessions')
+    s_min, s_max = cur.fetchone()
+    s_span = s_max - s_min
+
+    step(cur, 'session_players', '''
+        INSERT INTO session_players (session_id, user_id, role, is_alive)
+        SELECT gs.id, %s + ((gs.id * 10 + k) %% %s),
+               CASE WHEN k < 2 THEN 'mafia' WHEN k = 2 THEN 'doctor' ELSE 'civilian' END,
+               k %% 3 <> 0
+        FROM game_sessions gs, generate_series(0, 9) AS k
+    ''', (u_min, u_span + 1))
+
+    step(cur, 'room_players', '''
+        INSERT INTO room_players (room_id, user_id, user_name, is_creator, last_seen)
+        SELECT r.id, %s + ((r.id * 10 + k) %% %s), 'player ' || k, k = 0, NOW()
+        FROM rooms r, generate_series(0, 9) AS k
+        WHERE r.status IN ('waiting', 'in_game')
+        ON CONFLICT (room_id, user_id) DO NOTHING
+    ''', (u_min, u_span + 1))
+
+    step(cur, 'room_chat', '''
+        INSERT INTO room_chat (room_id, user_id, user_name, message, created_at)
+        SELECT %s + (random() * %s)::int, %s + (random() * %s)::int, 'user', 'message ' || n,
+               NOW() - (random() * 86400 * 30 || ' seconds')::interval
+        FROM generate_series(1, %s) AS n
+    ''', (r_min, r_span, u_min, u_span, volumes['room_chat']))
+
+    step(cur, 'votes', '''
+        INSERT INTO votes (session_id, voter_id, target_id, phase, day_number)
+        SELECT %s + (random() * %s)::int, %s + (random() * %s)::int, %s + (random() * %s)::int,
+               CASE WHEN n %% 2 = 0 THEN 'day' ELSE 'night' END, 1 + (n %% 5)
+        FROM generate_series(1, %s) AS n
+    ''', (s_min, s_span, u_min, u_span, u_min, u_span, volumes['votes']))
+
+    step(cur, 'game_active_bonuses', '''
+        INSERT INTO game_active_bonuses (session_id, user_id, bonus_type)
+        SELECT session_id, user_id, (ARRAY['documents', 'shield', 'privilege'])[1 + id % 3]
+        FROM session_players WHERE id % 5 = 0
+        ON CONFLICT (session_id, user_id) DO NOTHING
+    ''')
+
+    step(cur, 'shop_items', '''
+        INSERT INTO shop_items (name, description, price, image_url, is_available, created_by, created_at)
+        SELECT 'Item ' || n, 'Description ' || n, 10 + n %% 500, '', n %% 4 <> 0, %s,
+               NOW() - (n || ' minutes')::interval
+        FROM generate_series(1, %s) AS n
+    ''', (u_min, volumes['shop_items']))
+
+    conn.commit()
+    cur.close()
+
+def analyze(conn):
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute('ANALYZE')
+    cur.close()
+    conn.autocommit = False
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0, help='множитель объёмов (1.0 = продакшен)')
+    parser.add_argument('--skip-migrations', action='store_true', help='схема уже применена')
+    args = parser.parse_args()
+
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass('users') IS NOT NULL")
+    schema_exists = cur.fetchone()[0]
+    if schema_exists:
+        cur.execute('SELECT EXISTS (SELECT 1 FROM users)')
+        if cur.fetchone()[0]:
+            raise SystemExit('database is not empty, use a fresh one for seeding')
+    cur.close()
+
+    if not args.skip_migrations and not schema_exists:
+        apply_migrations(conn)
+    seed(conn, args.scale)
+    analyze(conn)
+    conn.close()
+
+if __name__ == '__main__':
+    main()
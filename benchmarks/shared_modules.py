@@ -0,0 +1,49 @@
+'''Проверка и обновление модулей, общих для нескольких облачных функций
+
+Каждая функция упаковывается из своего каталога backend/<name>, поэтому общий
+код лежит в них копиями. Правится каноническая копия, остальные обновляются
+этим скриптом; без --write он только сверяет копии и завершается с кодом 1
+при расхождении.
+
+    python benchmarks/shared_modules.py
+    python benchmarks/shared_modules.py --write
+'''
+import argparse
+import os
+import sys
+
+from common import BACKEND
+
+# Каноническая копия -> копии в других функциях
+SHARED = {
+    'api/tokens.py': ['telegram-auth/tokens.py', 'yandex-auth/tokens.py', 'game-websocket/tokens.py'],
+    'telegram-auth/login_service.py': ['yandex-auth/login_service.py'],
+}
+
+def read(path):
+    with open(os.path.join(BACKEND, path), 'rb') as source:
+        return source.read()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--write', action='store_true', help='перезаписать копии канонической версией')
+    args = parser.parse_args()
+    
+    stale = []
+    for canonical, copies in SHARED.items():
+        content = read(canonical)
+        for copy in copies:
+            target = os.path.join(BACKEND, copy)
+            if os.path.islink(target) or not os.path.exists(target) or read(copy) != content:
+                stale.append(copy)
+                if args.write:
+                    if os.path.islink(target):
+                        os.remove(target)
+                    with open(target, 'wb') as output:
+                        output.write(content)
+                print(f'{"updated" if args.write else "differs"}: {copy} (from {canonical})')
+    if stale and not args.write:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
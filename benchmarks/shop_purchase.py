@@ -0,0 +1,92 @@
+'''Конкурентные покупки одного товара через POST ?path=shop&action=purchase
+
+Сотни пользователей одновременно покупают один товар; каждый отправляет
+несколько покупок с разными request_id, и каждую — несколько раз
+(ретраи клиента). Проверяется, что на каждый request_id списание
+произошло не больше одного раза, покупок не больше, чем позволяет
+баланс, и репутация не уходит в минус; печатается задержка и число
+SQL-запросов на покупку.
+
+    DATABASE_URL=postgres://... python benchmarks/shop_purchase.py --users 100 --per-user 3 --repeats 2
+'''
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from common import Timer, connect, load_function, make_event, make_token, seed_users, summarize
+
+api = load_function('api')
+import metrics  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100, help='покупателей')
+    parser.add_argument('--per-user', type=int, default=3, help='разных покупок (request_id) на пользователя')
+    parser.add_argument('--repeats', type=int, default=2, help='отправок каждого request_id')
+    parser.add_argument('--affordable', type=int, default=2, help='на сколько покупок хватает репутации')
+    parser.add_argument('--price', type=int, default=100, help='цена товара')
+    parser.add_argument('--workers', type=int, default=64, help='потоков')
+    args = parser.parse_args()
+
+    conn = connect()
+    cur = conn.cursor()
+    user_ids = seed_users(conn, args.users, offset=950_000)
+    balance = args.price * args.affordable
+    cur.execute('UPDATE users SET reputation = %s WHERE id = ANY(%s)', (balance, user_ids))
+    cur.execute('DELETE FROM shop_purchases WHERE user_id = ANY(%s)', (user_ids,))
+    cur.execute('''
+        INSERT INTO shop_items (name, description, price, created_by) VALUES ('purchase bench', '', %s, %s)
+        RETURNING id
+    ''', (args.price, user_ids[0]))
+    item_id = cur.fetchone()[0]
+    conn.commit()
+
+    requests = []
+    for user_id in user_ids:
+        token = make_token(user_id)
+        for n in range(args.per_user):
+            body = {'item_id': item_id, 'request_id': f'bench-{user_id}-{n}'}
+            event = make_event('POST', {'path': 'shop', 'action': 'purchase'}, token, body)
+            # Повторы идут подряд и разбираются разными потоками пула одновременно
+            requests.extend([event] * args.repeats)
+
+    def purchase(event):
+        with Timer() as t:
+            response = api.handler(event, None)
+        return response['statusCode'], t.elapsed
+
+    before = metrics.snapshot()
+    with Timer() as total, ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(purchase, requests))
+    after = metrics.snapshot()
+
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+
+    cur.execute('''
+        SELECT u.id, u.reputation, COUNT(p.id), COALESCE(SUM(p.price), 0)
+        FROM users u LEFT JOIN shop_purchases p ON p.user_id = u.id AND p.item_id = %s
+        WHERE u.id = ANY(%s)
+        GROUP BY u.id, u.reputation
+    ''', (item_id, user_ids))
+    rows = cur.fetchall()
+    expected = min(args.per_user, args.affordable)
+    inconsistent = [r for r in rows if r[1] < 0 or r[2] != expected or r[1] != balance - r[3]]
+
+    queries = sum(v - before.get(k, 0) for k, v in after.items()
+                  if k[0] == 'mafia_db_queries_total' and dict(k[1]).get('route') == 'shop/purchase')
+    print(f'requests={len(requests)} statuses={statuses} elapsed={total.elapsed:.2f}s '
+          f'throughput={len(requests) / total.elapsed:.0f} req/s')
+    print(f'sql queries per purchase request: {queries / len(requests):.2f}')
+    print(summarize({'shop/purchase': [elapsed for _, elapsed in results]}))
+
+    cur.execute('DELETE FROM shop_purchases WHERE item_id = %s', (item_id,))
+    cur.execute('DELETE FROM shop_items WHERE id = %s', (item_id,))
+    conn.commit()
+    conn.close()
+
+    print('balances consistent' if not inconsistent else f'INCONSISTENT for {len(inconsistent)} users')
+    return 0 if not inconsistent else 1
+
+if __name__ == '__main__':
+    raise SystemExit(main())
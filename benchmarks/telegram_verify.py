@@ -0,0 +1,70 @@
+'''Микробенчмарк проверки подписи Telegram Login Widget
+
+Сравнивает прежний путь (sha256 от токена бота и сборка строки на
+каждый вход) с переиспользуемым TelegramVerifier. База не нужна.
+
+    python benchmarks/telegram_verify.py --iterations 200000
+'''
+import argparse
+import hashlib
+import hmac
+import os
+import sys
+import time
+
+from common import BACKEND
+
+sys.path.insert(0, os.path.join(BACKEND, 'telegram-auth'))
+from telegram_verifier import TelegramVerifier  # noqa: E402
+
+BOT_TOKEN = '123456789:bench-token-for-telegram-login-widget'
+
+def sample(now):
+    data = {
+        'id': 123456789,
+        'first_name': 'Bench',
+        'last_name': 'User',
+        'username': 'bench_user',
+        'photo_url': 'https://t.me/i/userpic/320/bench.jpg',
+        'auth_date': int(now),
+    }
+    check_string = '\n'.join(f'{k}={v}' for k, v in sorted(data.items()))
+    secret = hashlib.sha256(BOT_TOKEN.encode()).digest()
+    data['hash'] = hmac.new(secret, check_string.encode(), hashlib.sha256).hexdigest()
+    return data
+
+def legacy_verify(data):
+    '''Прежняя проверка из telegram-auth/index.py'''
+    check_data = {k: str(v) for k, v in data.items() if k != 'hash' and v}
+    data_check_string = '\n'.join([f'{k}={v}' for k, v in sorted(check_data.items())])
+    secret_key = hashlib.sha256(BOT_TOKEN.encode()).digest()
+    calculated_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return calculated_hash == data['hash']
+
+def measure(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return iterations / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200_000)
+    args = parser.parse_args()
+
+    now = time.time()
+    data = sample(now)
+    verifier = TelegramVerifier(BOT_TOKEN)
+    assert verifier.verify(data, now) is None
+    assert legacy_verify(data)
+    forged = dict(data, hash='0' * 64)
+    assert verifier.verify(forged, now) == 'Invalid authentication'
+    assert verifier.verify(data, now + 2 * 86400) == 'Authentication data expired'
+
+    legacy = measure(lambda: legacy_verify(data), args.iterations)
+    reused = measure(lambda: verifier.verify(data, now), args.iterations)
+    print(f'legacy per-call secret: {legacy:12.0f} verifications/s')
+    print(f'reused verifier:        {reused:12.0f} verifications/s ({reused / legacy:.2f}x)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+'''Стоимость рассылки событий game-websocket в зависимости от размера комнаты
+
+Для каждого размера комнаты из --sizes измеряет:
+- broadcast_to_room с кодированием JSON один раз против кодирования на
+  каждого получателя (прежняя схема);
+- объём рассылки при входе игрока: дельта player_joined с периодическим
+  players_sync против полного списка игроков в каждом событии.
+Отправка в соединения подменяется подсчётом байт. База не нужна.
+
+    python benchmarks/ws_broadcast.py --sizes 5,10,20,50,100 --events 2000
+'''
+import argparse
+import json
+
+from common import Timer, load_function
+
+ws = load_function('game-websocket')
+
+sent = {'frames': 0, 'bytes': 0}
+
+def count_frame(connection_id, payload):
+    sent['frames'] += 1
+    sent['bytes'] += len(payload)
+
+def fill_room(room_id, size):
+    room = ws.rooms[room_id] = ws.Room(room_id)
+    for n in range(1, size + 1):
+        room.join(f'{room_id}-c{n}', n, f'Байкер {n}')
+    return room
+
+def per_recipient_broadcast(room_id, message):
+    '''Прежняя схема: кодирование на каждого получателя'''
+    for connection_id in ws.rooms[room_id].connection_ids():
+        ws.post_to_connection(connection_id, json.dumps(message).encode('utf-8'))
+
+def bench_encoding(size, events):
+    room_id = f'enc-{size}'
+    room = fill_room(room_id, size)
+    message = {'type': 'phase_changed', 'game_state': {'phase': 'day', 'day_number': 3, 'started_at': '2026-01-01T00:00:00'},
+               'players': room.players_list()}
+    with Timer() as old:
+        for _ in range(events):
+            per_recipient_broadcast(room_id, message)
+    with Timer() as new:
+        for _ in range(events):
+            ws.broadcast_to_room(room_id, message)
+    return old.elapsed / events, new.elapsed / events
+
+def bench_membership(size, full_list):
+    '''Байты, разосланные при заполнении комнаты до size игроков'''
+    room_id = f'mem-{size}-{full_list}'
+    ws.rooms[room_id] = room = ws.Room(room_id)
+    sent.update(frames=0, bytes=0)
+    for n in range(1, size + 1):
+        player = room.join(f'{room_id}-c{n}', n, f'Байкер {n}')
+        if full_list:
+            ws.broadcast_to_room(room_id, {'type': 'player_joined', 'players': room.players_list(),
+                                           'user_name': player.user_name})
+        else:
+            ws.broadcast_membership(room_id, {'type': 'player_joined', 'player': player.to_public_dict(),
+                                              'user_name': player.user_name}, exclude=player.connection_id)
+            ws.send_to_connection(player.connection_id, {'type': 'players_sync', 'players': room.players_list()})
+    return sent['frames'], sent['bytes']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='5,10,20,50,100', help='размеры комнат через запятую')
+    parser.add_argument('--events', type=int, default=2000, help='событий на размер комнаты')
+    args = parser.parse_args()
+
+    ws.post_to_connection = count_frame
+    # Без окна склейки: измеряется сама рассылка, каждое событие уходит сразу
+    ws.outbox.window = 0
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    print(f'{"players":>8}{"per-recipient us":>18}{"encode-once us":>16}{"speedup":>9}'
+          f'{"full-list KB":>14}{"delta KB":>10}{"saved":>8}')
+    for size in sizes:
+        old, new = bench_encoding(size, args.events)
+        _, full_bytes = bench_membership(size, full_list=True)
+        _, delta_bytes = bench_membership(size, full_list=False)
+        print(f'{size:>8}{old * 1e6:>18.1f}{new * 1e6:>16.1f}{old / new:>8.1f}x'
+              f'{full_bytes / 1024:>14.1f}{delta_bytes / 1024:>10.1f}{1 - delta_bytes / full_bytes:>8.0%}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+'''Масштабирование game-websocket по ядрам: кластер server.py --workers N
+
+Для каждого числа воркеров из --workers поднимает кластер на одной машине
+и нагружает его одинаковой нагрузкой на воркер: --connections-per-worker
+соединений по --room-size в комнате шлют чат с частотой --rate. Генераторы
+нагрузки — отдельные процессы (--generators-per-worker на воркер), чтобы
+упиралась в ядра сервер, а не клиент. Печатает доставленные события в секунду,
+ускорение относительно одного воркера и задержку доставки.
+
+--routing owner подключает клиента сразу к воркеру-владельцу его комнаты
+(клиент знает раскладку кольца), --routing shared — к общему порту, откуда
+ядро раздаёт соединения случайным воркерам и большая часть трафика идёт
+пересылкой между ними. С --rebalance в середине прогона в кластер добавляется
+ещё один воркер: видно, сколько комнат переехало и потерялись ли события.
+
+    python benchmarks/ws_cluster_scaling.py --workers 1,2,4,8 --duration 20
+'''
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import BACKEND, make_token, percentile
+from ws_server_load import open_socket, send
+
+sys.path.insert(0, os.path.join(BACKEND, 'game-websocket'))
+from sharding import HashRing  # noqa: E402
+from ws_protocol import OP_CLOSE, OP_PING, OP_PONG, OP_TEXT, encode_frame, read_frame  # noqa: E402
+
+HOST = '127.0.0.1'
+
+def cluster_layout(port, workers):
+    return {'host': HOST, 'workers': {
+        f'w{n}': {'port': port + n, 'peer_port': port + 1000 + n} for n in range(1, workers + 1)
+    }}
+
+def room_of(args, n):
+    return f'scale-{n // args.room_size}'
+
+async def client(args, n, port, stats, latencies, window, gate):
+    user_id = args.user_offset + n
+    measure_from, stop_at = window
+    async with gate:
+        try:
+            reader, writer = await open_socket(HOST, port, make_token(user_id))
+        except (OSError, ConnectionError, asyncio.IncompleteReadError):
+            stats['failed'] += 1
+            return
+    stats['connected'] += 1
+    send(writer, {'action': 'join_room', 'room_id': room_of(args, n), 'user_name': f'scale {user_id}'})
+    
+    async def receive():
+        while True:
+            opcode, payload = await read_frame(reader, max_size=16 * 1024 * 1024, require_mask=False)
+            if opcode == OP_PING:
+                writer.write(encode_frame(payload, OP_PONG, mask=True))
+                continue
+            if opcode == OP_CLOSE:
+                return
+            if opcode != OP_TEXT:
+                continue
+            message = json.loads(payload)
+            now = time.monotonic()
+            for event in message['events'] if message.get('type') == 'batch' else [message]:
+                kind = event.get('type')
+                if kind == 'new_message':
+                    if measure_from <= now < stop_at:
+                        stats['delivered'] += 1
+                        if random.random() < 0.05:
+                            latencies.append(now - float(event['message']['message']))
+                elif kind in ('error', 'resync'):
+                    stats[kind] += 1
+    
+    receiving = asyncio.ensure_future(receive())
+    await asyncio.sleep(max(0.0, measure_from - 1 - time.monotonic()) + random.uniform(0, 1 / args.rate))
+    try:
+        while time.monotonic() < stop_at and not receiving.done():
+            send(writer, {'action': 'send_message', 'user_name': f'scale {user_id}', 'message': repr(time.monotonic())})
+            if time.monotonic() >= measure_from:
+                stats['sent'] += 1
+            await asyncio.sleep(1 / args.rate)
+        await asyncio.sleep(0.5)
+    finally:
+        if receiving.done() and time.monotonic() < stop_at:
+            stats['dropped'] += 1
+        receiving.cancel()
+        writer.close()
+
+def generator(args, assignments, window, results):
+    '''Процесс-генератор: своя доля соединений в своём цикле событий'''
+    stats = {'connected': 0, 'failed': 0, 'sent': 0, 'delivered': 0, 'error': 0, 'resync': 0, 'dropped': 0}
+    latencies = []
+    
+    async def run():
+        gate = asyncio.Semaphore(200)
+        await asyncio.gather(*(client(args, n, port, stats, latencies, window, gate) for n, port in assignments))
+    
+    asyncio.run(run())
+    results.put((stats, latencies))
+
+def spawn_cluster(args, path, workers):
+    with open(path, 'w') as config_file:
+        json.dump(cluster_layout(args.port, workers), config_file)
+    env = dict(os.environ, WS_CONNECTION_RATE='1000', WS_CONNECTION_BURST='1000',
+               WS_ROOM_RATE='100000', WS_ROOM_BURST='100000')
+    env.pop('DATABASE_URL', None)
+    return subprocess.Popen([sys.executable, os.path.join(BACKEND, 'game-websocket', 'server.py'),
+                             '--host', HOST, '--port', str(args.port), '--workers', str(workers), '--cluster', path],
+                            env=env)
+
+def run_round(args, workers, path):
+    connections = args.connections_per_worker * workers
+    layout = cluster_layout(args.port, workers)
+    ring = HashRing(layout['workers'])
+    
+    def port_for(n):
+        if args.routing == 'shared':
+            return args.port
+        return layout['workers'][ring.owner(room_of(args, n))]['port']
+    
+    cluster = spawn_cluster(args, path, workers)
+    time.sleep(1.0 + 0.2 * workers)
+    
+    measure_from = time.monotonic() + args.warmup
+    window = (measure_from, measure_from + args.duration)
+    generators = workers * args.generators_per_worker
+    # Комнаты целиком в одном генераторе: порядок соединений не влияет на раскладку
+    shares = [[] for _ in range(generators)]
+    for n in range(connections):
+        shares[(n // args.room_size) % generators].append((n, port_for(n)))
+    
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=generator, args=(args, share, window, results)) for share in shares]
+    for process in processes:
+        process.start()
+    
+    if args.rebalance:
+        time.sleep(max(0.0, measure_from + args.duration / 2 - time.monotonic()))
+        with open(path, 'w') as config_file:
+            json.dump(cluster_layout(args.port, workers + 1), config_file)
+        cluster.send_signal(signal.SIGHUP)
+        print(f'  +1 worker at {args.duration / 2:.0f}s of measurement', flush=True)
+    
+    totals = {}
+    latencies = []
+    for _ in processes:
+        stats, sample = results.get()
+        for key, value in stats.items():
+            totals[key] = totals.get(key, 0) + value
+        latencies.extend(sample)
+    for process in processes:
+        process.join()
+    cluster.send_signal(signal.SIGTERM)
+    cluster.wait()
+    return totals, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4', help='числа воркеров через запятую')
+    parser.add_argument('--connections-per-worker', type=int, default=1000)
+    parser.add_argument('--room-size', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=2.0, help='сообщений чата в секунду на соединение')
+    parser.add_argument('--generators-per-worker', type=int, default=2)
+    parser.add_argument('--routing', choices=('owner', 'shared'), default='owner')
+    parser.add_argument('--rebalance', action='store_true', help='добавить воркер посреди прогона')
+    parser.add_argument('--warmup', type=float, default=5, help='секунд на подключение до замера')
+    parser.add_argument('--duration', type=float, default=15, help='секунд замера')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--user-offset', type=int, default=1_000_000)
+    args = parser.parse_args()
+    
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    path = os.path.join(tempfile.mkdtemp(prefix='ws-cluster-'), 'cluster.json')
+    
+    print(f'cpus={os.cpu_count()} routing={args.routing} connections/worker={args.connections_per_worker} '
+          f'room_size={args.room_size} rate={args.rate}/s', flush=True)
+    print(f'{"workers":>7} {"conns":>7} {"sent/s":>9} {"delivered/s":>12} {"speedup":>8} {"eff":>5} '
+          f'{"p50 ms":>7} {"p99 ms":>7}  errors/resync/dropped/failed')
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(',')]:
+        totals, latencies = run_round(args, workers, path)
+        delivered = totals['delivered'] / args.duration
+        baseline = baseline or delivered / workers
+        speedup = delivered / baseline if baseline else 0
+        print(f'{workers:>7} {totals["connected"]:>7} {totals["sent"] / args.duration:>9.0f} {delivered:>12.0f} '
+              f'{speedup:>7.2f}x {speedup / workers:>5.0%} {percentile(latencies, 50) * 1000:>7.1f} '
+              f'{percentile(latencies, 99) * 1000:>7.1f}  '
+              f'{totals["error"]}/{totals["resync"]}/{totals["dropped"]}/{totals["failed"]}', flush=True)
+        expected = totals['sent'] * args.room_size
+        if expected and totals['delivered'] < expected * 0.98:
+            print(f'  delivered {totals["delivered"]} of ~{expected} expected', flush=True)
+
+if __name__ == '__main__':
+    main()
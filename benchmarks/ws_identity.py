@@ -0,0 +1,55 @@
+'''Проверка: имя игрока в game-websocket берётся из токена, а не из сообщений
+
+Два игрока подключаются через handler функции с токенами, в которых имена
+Alice и Bob. Bob входит в комнату, называясь Alice, возвращается через
+resume и пишет в чат от имени Admin. Остальные должны видеть его как Bob.
+Завершается с кодом 1, если присланное клиентом имя попало в комнату или в
+рассылку. База не нужна.
+
+    python benchmarks/ws_identity.py
+'''
+import json
+import sys
+
+from common import load_function, make_token, ws_event
+
+ws = load_function('game-websocket')
+
+ROOM = 'identity-check'
+SPOOFED = {'Alice', 'Admin', 'Mallory'}
+
+def message(connection_id, body):
+    return ws.handler(ws_event('MESSAGE', connection_id, body), None)
+
+def main():
+    frames = []
+    ws.outbox.window = 0
+    ws.post_to_connection = lambda connection_id, payload: frames.append((connection_id, json.loads(payload)))
+
+    for connection_id, user_id, name in (('alice', 1, 'Alice'), ('bob', 2, 'Bob')):
+        ws.handler(ws_event('CONNECT', connection_id, token=make_token(user_id, name)), None)
+    message('alice', {'action': 'join_room', 'room_id': ROOM})
+    message('bob', {'action': 'join_room', 'room_id': ROOM, 'user_name': 'Alice'})
+    message('bob', {'action': 'resume', 'room_id': ROOM, 'last_seq': 0, 'user_name': 'Mallory'})
+    message('bob', {'action': 'send_message', 'message': 'hi', 'user_name': 'Admin'})
+    ws.outbox.flush_all()
+
+    seen = [frame for connection_id, frame in frames if connection_id == 'alice']
+    names = {
+        'roster': sorted((player['user_name'] for player in ws.rooms[ROOM].players_list()), key=str),
+        'player_joined': [frame['user_name'] for frame in seen if frame.get('type') == 'player_joined'],
+        'new_message': [frame['message']['user_name'] for frame in seen if frame.get('type') == 'new_message'],
+        'chat': [entry['user_name'] for entry in ws.rooms[ROOM].recent_chat(10)],
+    }
+    failed = False
+    for where, found in names.items():
+        leaked = SPOOFED.intersection(found) - ({'Alice'} if where == 'roster' else set())
+        print(f'{where:14} {found} {"SPOOFED" if leaked or not found else "ok"}')
+        failed = failed or bool(leaked) or not found
+    if names['roster'] != ['Alice', 'Bob']:
+        print(f'roster expected [Alice, Bob], got {names["roster"]}')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+'''Вход и выход игроков в game-websocket на большом числе комнат
+
+Заполняет --rooms комнат по --players игроков через handler функции
+(CONNECT + join_room), затем гоняет --cycles циклов, в которых каждый
+игрок выходит из комнаты (leave_room или DISCONNECT) и входит обратно.
+Печатает пропускную способность и p50/p95/p99 по действиям. С --compare
+те же операции прогоняются на прежней схеме (список игроков со
+сканированием) для сравнения стоимости самих структур данных. База не нужна.
+
+    python benchmarks/ws_room_churn.py --rooms 10000 --players 20 --cycles 3
+'''
+import argparse
+import random
+
+from common import Timer, load_function, make_token, summarize, ws_event
+
+ws = load_function('game-websocket')
+
+tokens = {}
+
+def join(connection_id, room_id, user_id):
+    if user_id not in tokens:
+        tokens[user_id] = make_token(user_id)
+    ws.handler(ws_event('CONNECT', connection_id, token=tokens[user_id]), None)
+    return ws.handler(ws_event('MESSAGE', connection_id, {
+        'action': 'join_room', 'room_id': room_id, 'user_id': user_id, 'user_name': f'bench {user_id}'
+    }), None)
+
+def run_handler(args, rng):
+    timings = {'join': [], 'leave': [], 'disconnect': []}
+    with Timer() as fill:
+        for r in range(args.rooms):
+            for p in range(args.players):
+                user_id = r * args.players + p + 1
+                join(f'c{user_id}-0', f'room-{r}', user_id)
+    print(f'filled {args.rooms} rooms x {args.players} players in {fill.elapsed:.2f}s')
+
+    operations = 0
+    with Timer() as churn:
+        for cycle in range(1, args.cycles + 1):
+            for r in range(args.rooms):
+                order = list(range(args.players))
+                rng.shuffle(order)
+                for p in order:
+                    user_id = r * args.players + p + 1
+                    old_connection = f'c{user_id}-{cycle - 1}'
+                    if p % 2:
+                        with Timer() as t:
+                            ws.handler(ws_event('MESSAGE', old_connection, {'action': 'leave_room'}), None)
+                        timings['leave'].append(t.elapsed)
+                    with Timer() as t:
+                        ws.handler(ws_event('DISCONNECT', old_connection), None)
+                    timings['disconnect'].append(t.elapsed)
+                    with Timer() as t:
+                        join(f'c{user_id}-{cycle}', f'room-{r}', user_id)
+                    timings['join'].append(t.elapsed)
+                    operations += 2
+    sizes = {len(room) for room in ws.rooms.values()}
+    print(f'churn: {operations} ops in {churn.elapsed:.2f}s '
+          f'({operations / churn.elapsed:.0f} ops/s), room sizes after churn: {sorted(sizes)}')
+    print(summarize(timings))
+
+def run_list_baseline(args, rng):
+    '''Прежняя схема: список игроков, поиск и удаление сканированием'''
+    rooms = {}
+    for r in range(args.rooms):
+        rooms[f'room-{r}'] = [{'connection_id': f'c{r * args.players + p + 1}', 'user_id': r * args.players + p + 1}
+                              for p in range(args.players)]
+    with Timer() as t:
+        for _ in range(args.cycles):
+            for r in range(args.rooms):
+                players = rooms[f'room-{r}']
+                order = list(range(args.players))
+                rng.shuffle(order)
+                for p in order:
+                    user_id = r * args.players + p + 1
+                    players[:] = [x for x in players if x['connection_id'] != f'c{user_id}']
+                    if not any(x['user_id'] == user_id for x in players):
+                        players.append({'connection_id': f'c{user_id}', 'user_id': user_id})
+    ops = args.cycles * args.rooms * args.players * 2
+    print(f'list baseline (structures only): {ops} ops in {t.elapsed:.2f}s ({ops / t.elapsed:.0f} ops/s)')
+
+def run_dict_structures(args, rng):
+    '''Новая схема без обработчика: только операции Room'''
+    rooms = {}
+    for r in range(args.rooms):
+        room = rooms[f'room-{r}'] = ws.Room(f'room-{r}')
+        for p in range(args.players):
+            room.join(f'c{r * args.players + p + 1}', r * args.players + p + 1, None)
+    with Timer() as t:
+        for _ in range(args.cycles):
+            for r in range(args.rooms):
+                room = rooms[f'room-{r}']
+                order = list(range(args.players))
+                rng.shuffle(order)
+                for p in order:
+                    user_id = r * args.players + p + 1
+                    room.leave(f'c{user_id}')
+                    room.join(f'c{user_id}', user_id, None)
+    ops = args.cycles * args.rooms * args.players * 2
+    print(f'dict rooms (structures only):     {ops} ops in {t.elapsed:.2f}s ({ops / t.elapsed:.0f} ops/s)')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rooms', type=int, default=10_000, help='комнат')
+    parser.add_argument('--players', type=int, default=20, help='игроков в комнате')
+    parser.add_argument('--cycles', type=int, default=3, help='циклов выхода и входа каждого игрока')
+    parser.add_argument('--compare', action='store_true', help='сравнить со списковой схемой')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Без окна склейки: измеряется сама рассылка, каждое событие уходит сразу
+    ws.outbox.window = 0
+    run_handler(args, rng)
+    if args.compare:
+        run_list_baseline(args, rng)
+        run_dict_structures(args, rng)
+
+if __name__ == '__main__':
+    main()
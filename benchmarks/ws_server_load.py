@@ -0,0 +1,168 @@
+'''Нагрузочный тест автономного сервера game-websocket (server.py)
+
+Открывает --connections соединений (по --room-size в комнате), каждое
+входит в комнату и шлёт сообщения чата с частотой --rate в секунду.
+В тексте сообщения — время отправки по CLOCK_MONOTONIC, поэтому получатели
+на той же машине считают задержку доставки. Печатает время подключения,
+отправленные и доставленные события, p50/p95/p99 задержки доставки и
+память сервера. С --spawn сервер запускается тут же с JWT_SECRET теста
+и поднятыми лимитами частоты. База не нужна.
+
+    python benchmarks/ws_server_load.py --spawn --connections 20000 --room-size 20 --duration 30
+'''
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from urllib.parse import quote, urlsplit
+
+from common import BACKEND, make_token, percentile
+
+sys.path.insert(0, os.path.join(BACKEND, 'game-websocket'))
+from ws_protocol import OP_CLOSE, OP_PING, OP_PONG, OP_TEXT, encode_frame, read_frame  # noqa: E402
+
+stats = {'connected': 0, 'failed': 0, 'sent': 0, 'delivered': 0, 'frames': 0, 'errors': 0}
+connect_times = []
+latencies = []
+
+async def open_socket(host, port, token):
+    reader, writer = await asyncio.open_connection(host, port, limit=1024 * 1024)
+    key = 'dGhlIHNhbXBsZSBub25jZQ=='
+    writer.write((
+        f'GET /?token={quote(token)} HTTP/1.1\r\nHost: {host}:{port}\r\n'
+        f'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+        f'Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n'
+    ).encode())
+    status = await reader.readuntil(b'\r\n\r\n')
+    if not status.startswith(b'HTTP/1.1 101'):
+        writer.close()
+        raise ConnectionError(status.split(b'\r\n', 1)[0].decode())
+    return reader, writer
+
+def send(writer, message):
+    writer.write(encode_frame(json.dumps(message).encode(), OP_TEXT, mask=True))
+
+def consume(payload):
+    message = json.loads(payload)
+    events = message['events'] if message.get('type') == 'batch' else [message]
+    now = time.monotonic()
+    for event in events:
+        if event.get('type') == 'new_message':
+            stats['delivered'] += 1
+            latencies.append(now - float(event['message']['message']))
+        elif event.get('type') == 'error':
+            stats['errors'] += 1
+
+async def reader_loop(reader, writer):
+    while True:
+        opcode, payload = await read_frame(reader, max_size=16 * 1024 * 1024, require_mask=False)
+        if opcode == OP_TEXT:
+            stats['frames'] += 1
+            consume(payload)
+        elif opcode == OP_PING:
+            writer.write(encode_frame(payload, OP_PONG, mask=True))
+        elif opcode == OP_CLOSE:
+            return
+
+async def client(args, host, port, n, gate, stop_at):
+    user_id = args.user_offset + n
+    room_id = f'load-{n // args.room_size}'
+    async with gate:
+        started = time.monotonic()
+        try:
+            reader, writer = await open_socket(host, port, make_token(user_id))
+        except (OSError, ConnectionError, asyncio.IncompleteReadError):
+            stats['failed'] += 1
+            return
+        connect_times.append(time.monotonic() - started)
+        stats['connected'] += 1
+    
+    send(writer, {'action': 'join_room', 'room_id': room_id, 'user_name': f'load {user_id}'})
+    receiving = asyncio.ensure_future(reader_loop(reader, writer))
+    # Случайный сдвиг, чтобы отправки не шли волнами
+    await asyncio.sleep(random.uniform(0, 1 / args.rate))
+    try:
+        while time.monotonic() < stop_at and not receiving.done():
+            send(writer, {'action': 'send_message', 'user_name': f'load {user_id}', 'message': repr(time.monotonic())})
+            stats['sent'] += 1
+            await asyncio.sleep(1 / args.rate)
+        await asyncio.sleep(1)
+    finally:
+        receiving.cancel()
+        writer.close()
+
+def server_rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+async def run(args, host, port, server_pid):
+    gate = asyncio.Semaphore(args.connect_concurrency)
+    ramp_started = time.monotonic()
+    stop_at = ramp_started + args.duration
+    tasks = [asyncio.ensure_future(client(args, host, port, n, gate, stop_at)) for n in range(args.connections)]
+    
+    while not all(task.done() for task in tasks):
+        await asyncio.sleep(5)
+        rss = server_rss_mb(server_pid) if server_pid else None
+        print(f'[{time.monotonic() - ramp_started:5.0f}s] connected={stats["connected"]} failed={stats["failed"]} '
+              f'sent={stats["sent"]} delivered={stats["delivered"]}'
+              + (f' server_rss={rss:.0f}MB' if rss else ''), flush=True)
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='ws://127.0.0.1:8765', help='адрес сервера')
+    parser.add_argument('--spawn', action='store_true', help='запустить server.py на время теста')
+    parser.add_argument('--connections', type=int, default=10_000)
+    parser.add_argument('--room-size', type=int, default=20)
+    parser.add_argument('--rate', type=float, default=0.2, help='сообщений чата в секунду на соединение')
+    parser.add_argument('--duration', type=float, default=30, help='секунд отправки')
+    parser.add_argument('--connect-concurrency', type=int, default=500, help='одновременных рукопожатий')
+    parser.add_argument('--user-offset', type=int, default=1_000_000)
+    args = parser.parse_args()
+    
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    server = None
+    if args.spawn:
+        env = dict(os.environ, WS_CONNECTION_RATE='50', WS_ROOM_RATE='1000', WS_ROOM_BURST='2000')
+        env.pop('DATABASE_URL', None)
+        server = subprocess.Popen([sys.executable, os.path.join(BACKEND, 'game-websocket', 'server.py'),
+                                   '--host', host, '--port', str(port)], env=env)
+        time.sleep(1.5)
+    
+    try:
+        started = time.monotonic()
+        asyncio.run(run(args, host, port, server.pid if server else None))
+        elapsed = time.monotonic() - started
+    finally:
+        rss = server_rss_mb(server.pid) if server else None
+        if server:
+            server.terminate()
+            server.wait()
+    
+    expected = stats['sent'] * args.room_size
+    print(f'connections: {stats["connected"]} ok, {stats["failed"]} failed; '
+          f'connect p50={percentile(connect_times, 50) * 1000:.1f}ms p99={percentile(connect_times, 99) * 1000:.1f}ms')
+    print(f'chat sent={stats["sent"]} delivered={stats["delivered"]} (~{expected} expected) '
+          f'frames={stats["frames"]} errors={stats["errors"]} in {elapsed:.1f}s')
+    print(f'delivery latency p50={percentile(latencies, 50) * 1000:.1f}ms '
+          f'p95={percentile(latencies, 95) * 1000:.1f}ms p99={percentile(latencies, 99) * 1000:.1f}ms')
+    if rss:
+        print(f'server rss {rss:.0f}MB ({rss * 1024 / max(1, stats["connected"]):.1f}KB per connection)')
+
+if __name__ == '__main__':
+    main()
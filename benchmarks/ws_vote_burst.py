@@ -0,0 +1,83 @@
+'''Склейка исходящих событий game-websocket во время всплеска голосов
+
+В --rooms комнатах по --players игроков каждый игрок голосует в случайный
+момент в пределах --burst секунд, часть игроков (--revote) переголосовывает.
+Один и тот же поток голосов прогоняется с окнами склейки из --windows (мс):
+считаются события, схлопнутые переголосования, отправленные кадры и кадры
+в секунду на комнату. Склейка между сообщениями моделируется как в server.py;
+облачная функция отправляет пачку в конце каждого вызова. Время моделируется,
+база не нужна.
+
+    python benchmarks/ws_vote_burst.py --rooms 100 --players 20 --windows 0,50,100
+'''
+import argparse
+import random
+
+from common import load_function, make_token, ws_event
+
+ws = load_function('game-websocket')
+from outbox import Outbox  # noqa: E402
+
+clock = {'now': 0.0}
+
+def make_votes(args, rng):
+    '''Голоса (время, connection_id, цель) в порядке времени'''
+    votes = []
+    for r in range(args.rooms):
+        for p in range(1, args.players + 1):
+            connection_id = f'r{r}-c{p}'
+            votes.append((rng.uniform(0, args.burst), connection_id, rng.randint(1, args.players)))
+            if rng.random() < args.revote:
+                votes.append((rng.uniform(0, args.burst), connection_id, rng.randint(1, args.players)))
+    return sorted(votes)
+
+def run(args, votes, window):
+    ws.connections.clear()
+    ws.rooms.clear()
+    ws.outbox = Outbox(ws.send_to_connection, ws.room_connections, window=window, clock=lambda: clock['now'])
+    clock['now'] = 0.0
+    tokens = {p: make_token(p) for p in range(1, args.players + 1)}
+    for r in range(args.rooms):
+        for p in range(1, args.players + 1):
+            connection_id = f'r{r}-c{p}'
+            ws.handler(ws_event('CONNECT', connection_id, token=tokens[p]), None)
+            ws.handler(ws_event('MESSAGE', connection_id, {
+                'action': 'join_room', 'room_id': f'room-{r}', 'user_id': p, 'user_name': f'bench {p}'
+            }), None)
+    ws.outbox.flush_all()
+    ws.outbox.stats.update(events=0, collapsed=0, frames=0)
+
+    for at, connection_id, target in votes:
+        clock['now'] = at
+        ws.outbox.flush_due()
+        ws.handler(ws_event('MESSAGE', connection_id, {'action': 'vote', 'target_id': target}), None)
+    clock['now'] = args.burst + 1
+    ws.outbox.flush_due()
+    ws.outbox.flush_all()
+    return dict(ws.outbox.stats)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rooms', type=int, default=100, help='комнат')
+    parser.add_argument('--players', type=int, default=20, help='игроков в комнате')
+    parser.add_argument('--burst', type=float, default=3.0, help='длительность всплеска, секунд')
+    parser.add_argument('--revote', type=float, default=0.3, help='доля игроков, меняющих голос')
+    parser.add_argument('--windows', default='0,50,100', help='окна склейки в миллисекундах')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    ws.post_to_connection = lambda connection_id, payload: None
+    ws.flush_outbox_on_return = False
+    votes = make_votes(args, random.Random(args.seed))
+
+    baseline = None
+    print(f'{"window ms":>10}{"events":>9}{"collapsed":>11}{"frames":>10}{"frames/s/room":>15}{"saved":>8}')
+    for window_ms in [float(w) for w in args.windows.split(',')]:
+        stats = run(args, votes, window_ms / 1000)
+        baseline = baseline or stats['frames']
+        per_room = stats['frames'] / args.burst / args.rooms
+        print(f'{window_ms:>10.0f}{stats["events"]:>9}{stats["collapsed"]:>11}{stats["frames"]:>10}'
+              f'{per_room:>15.0f}{1 - stats["frames"] / baseline:>8.0%}')
+
+if __name__ == '__main__':
+    main()
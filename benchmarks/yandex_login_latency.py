@@ -0,0 +1,73 @@
+'''Задержка входа через yandex-auth с холодными и тёплыми соединениями
+
+Запускает заглушку OAuth (yandex_stub.py) и вызывает обработчик
+yandex-auth: "cold" — новая HTTP-сессия на каждый вход (как прямые
+вызовы requests.post/get), "warm" — общая сессия модуля с keep-alive.
+С --certfile/--keyfile заглушка работает по TLS, и разница включает
+handshake. Проверяет также, что зависший OAuth даёт 504 по таймауту.
+
+    DATABASE_URL=postgres://... python benchmarks/yandex_login_latency.py --logins 200
+'''
+import argparse
+import json
+import os
+
+from common import Timer, connect, summarize
+import yandex_stub
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--certfile')
+    parser.add_argument('--keyfile')
+    args = parser.parse_args()
+
+    server, url = yandex_stub.start(certfile=args.certfile, keyfile=args.keyfile)
+    stalled, stalled_url = yandex_stub.start(delay=2.0)
+    os.environ['YANDEX_TOKEN_URL'] = f'{url}/token'
+    os.environ['YANDEX_INFO_URL'] = f'{url}/info'
+    os.environ['YANDEX_READ_TIMEOUT'] = '0.5'
+    os.environ.setdefault('YANDEX_CLIENT_ID', 'bench')
+    os.environ.setdefault('YANDEX_CLIENT_SECRET', 'bench')
+    if args.certfile:
+        os.environ['REQUESTS_CA_BUNDLE'] = args.certfile
+
+    from common import load_function
+    auth = load_function('yandex-auth')
+
+    def login(n):
+        body = json.dumps({'code': str(n), 'redirect_uri': 'http://localhost/callback'})
+        with Timer() as t:
+            response = auth.handler({'httpMethod': 'POST', 'body': body}, None)
+        return response['statusCode'], t.elapsed
+
+    timings = {'cold': [], 'warm': []}
+    errors = 0
+    for n in range(args.logins):
+        auth.http = auth.make_session()
+        status, elapsed = login(n)
+        timings['cold'].append(elapsed)
+        errors += status != 200
+    auth.http = auth.make_session()
+    for n in range(args.logins):
+        status, elapsed = login(n)
+        timings['warm'].append(elapsed)
+        errors += status != 200
+    print(summarize(timings))
+
+    auth.YANDEX_TOKEN_URL = f'{stalled_url}/token'
+    status, elapsed = login(0)
+    print(f'stalled OAuth: status {status} after {elapsed:.2f}s')
+
+    server.shutdown()
+    stalled.shutdown()
+
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute('DELETE FROM users WHERE telegram_id BETWEEN %s AND %s', (9_500_000_000, 9_500_000_000 + args.logins))
+    conn.commit()
+    conn.close()
+    return 1 if errors or status != 504 else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
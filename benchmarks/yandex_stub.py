@@ -0,0 +1,83 @@
+'''Локальная заглушка OAuth Яндекса: /token и /info
+
+Поддерживает keep-alive (HTTP/1.1), опционально TLS и искусственную
+задержку ответа для проверки таймаутов.
+
+    python benchmarks/yandex_stub.py --port 8089 [--certfile cert.pem --keyfile key.pem] [--delay 0.05]
+'''
+import argparse
+import json
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    delay = 0.0
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        form = self.rfile.read(length).decode()
+        time.sleep(self.delay)
+        if self.path.startswith('/token') and 'code=' in form:
+            code = form.split('code=', 1)[1].split('&', 1)[0]
+            self._reply(200, {'access_token': f'token-{code}', 'token_type': 'bearer', 'expires_in': 3600})
+        else:
+            self._reply(400, {'error': 'invalid_request'})
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        auth = self.headers.get('Authorization', '')
+        if self.path.startswith('/info') and auth.startswith('OAuth token-'):
+            code = auth[len('OAuth token-'):]
+            self._reply(200, {
+                'id': str(9_500_000_000 + (int(code) if code.isdigit() else 0)),
+                'login': f'ya_{code}',
+                'first_name': 'Stub',
+                'last_name': code,
+                'default_avatar_id': ''
+            })
+        else:
+            self._reply(401, {'error': 'invalid_token'})
+
+    def log_message(self, *args):
+        pass
+
+def start(port=0, delay=0.0, certfile=None, keyfile=None):
+    '''Запуск в фоновом потоке, возвращает (server, base_url)'''
+    handler = type('Handler', (StubHandler,), {'delay': delay})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    scheme = 'http'
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = 'https'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'{scheme}://127.0.0.1:{server.server_address[1]}'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--delay', type=float, default=0.0)
+    parser.add_argument('--certfile')
+    parser.add_argument('--keyfile')
+    args = parser.parse_args()
+    server, url = start(args.port, args.delay, args.certfile, args.keyfile)
+    print(f'stub OAuth at {url}/token and {url}/info')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+-- Индексы под горячие запросы API
+
+-- Голос игрока в текущей фазе: переголосование и отметка "проголосовал" в состоянии игры
+CREATE INDEX IF NOT EXISTS idx_votes_voter_phase ON votes(session_id, voter_id, day_number, phase);
+
+-- Открытые комнаты по статусу, новые сверху (список комнат в api и rooms-api)
+CREATE INDEX IF NOT EXISTS idx_rooms_status_created ON rooms(status, created_at DESC);
+DROP INDEX IF EXISTS idx_rooms_status;
+
+-- Каталог магазина: только доступные товары, новые сверху
+CREATE INDEX IF NOT EXISTS idx_shop_items_available_created ON shop_items(created_at DESC) WHERE is_available = TRUE;
+DROP INDEX IF EXISTS idx_shop_items_available;
+
+-- profile_name уже покрыт индексом ограничения UNIQUE (users_profile_name_key), дубликат не нужен
+DROP INDEX IF EXISTS idx_users_profile_name;
+
+-- Чат комнаты по room_id с сортировкой по created_at покрыт idx_room_chat_room из V0009
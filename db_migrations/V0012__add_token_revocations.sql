@@ -0,0 +1,19 @@
+-- Отзыв токенов пользователя: токены, выпущенные раньше отметки, недействительны.
+-- TIMESTAMPTZ: отметки сравниваются с iat в unix-времени независимо от TimeZone сессии
+CREATE TABLE IF NOT EXISTS token_revocations (
+    user_id INT PRIMARY KEY REFERENCES users(id),
+    access_revoked_before TIMESTAMPTZ,
+    refresh_revoked_before TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_token_revocations_access ON token_revocations(access_revoked_before);
+
+-- Использованные refresh-токены: каждый обменивается один раз, повтор означает утечку.
+-- Строки живут до истечения токена и вычищаются при следующем обмене того же пользователя
+CREATE TABLE IF NOT EXISTS used_refresh_tokens (
+    jti TEXT PRIMARY KEY,
+    user_id INT NOT NULL REFERENCES users(id),
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_used_refresh_tokens_user ON used_refresh_tokens(user_id, expires_at);
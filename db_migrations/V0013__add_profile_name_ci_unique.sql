@@ -0,0 +1,15 @@
+-- Имя профиля уникально без учёта регистра; индекс обслуживает и проверку доступности имени.
+-- Прежний UNIQUE различал регистр, поэтому в базе могут быть «Ivan» и «ivan»: имя остаётся
+-- за первым зарегистрированным, остальным дописывается _<id> (в пределах 50 символов),
+-- иначе индекс не создастся
+WITH ranked AS (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY LOWER(profile_name) ORDER BY id) AS n
+    FROM users
+    WHERE profile_name IS NOT NULL
+)
+UPDATE users u
+SET profile_name = LEFT(u.profile_name, 50 - LENGTH('_' || u.id::text)) || '_' || u.id::text
+FROM ranked r
+WHERE u.id = r.id AND r.n > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_profile_name_lower ON users (LOWER(profile_name));
@@ -0,0 +1,6 @@
+-- Покупки: цена на момент покупки и клиентский идентификатор запроса для идемпотентности
+ALTER TABLE shop_purchases ADD COLUMN IF NOT EXISTS price INT;
+ALTER TABLE shop_purchases ADD COLUMN IF NOT EXISTS request_id VARCHAR(64);
+
+-- Повтор запроса с тем же request_id не создаёт вторую покупку (старые строки с NULL не конфликтуют)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_shop_purchases_user_request ON shop_purchases(user_id, request_id);
@@ -1,4 +1,18 @@
-import { createContext, useContext, useState, useEffect, ReactNode } from 'react';
+import { createContext, useContext, useState, useEffect, useCallback, ReactNode } from 'react';
+
+const API_URL = 'https://functions.poehali.dev/5c41a30e-4c90-4aed-9351-0dacd2291ebd';
+
+// Обновляем access-токен заранее, за минуту до истечения
+const REFRESH_MARGIN_MS = 60_000;
+
+const tokenExpiresAt = (jwtToken: string): number | null => {
+  try {
+    const payload = JSON.parse(atob(jwtToken.split('.')[1].replace(/-/g, '+').replace(/_/g, '/')));
+    return payload.exp ? payload.exp * 1000 : null;
+  } catch {
+    return null;
+  }
+};
 
 interface User {
   id: number;
@@ -17,7 +31,7 @@ interface User {
 interface AuthContextType {
   user: User | null;
   token: string | null;
-  login: (userData: User, authToken: string) => void;
+  login: (userData: User, authToken: string, refreshToken?: string) => void;
   logout: () => void;
   isAuthenticated: boolean;
 }
@@ -27,6 +41,7 @@ const AuthContext = createContext<AuthContextType | undefined>(undefined);
 export const AuthProvider = ({ children }: { children: ReactNode }) => {
   const [user, setUser] = useState<User | null>(null);
   const [token, setToken] = useState<string | null>(null);
+  const [refreshToken, setRefreshToken] = useState<string | null>(null);
 
   useEffect(() => {
     const savedUser = localStorage.getItem('mafia_user');
@@ -34,22 +49,67 @@ export const AuthProvider = ({ children }: { children: ReactNode }) => {
     if (savedUser && savedToken) {
       setUser(JSON.parse(savedUser));
       setToken(savedToken);
+      setRefreshToken(localStorage.getItem('mafia_refresh_token'));
     }
   }, []);
 
-  const login = (userData: User, authToken: string) => {
+  const login = (userData: User, authToken: string, newRefreshToken?: string) => {
     setUser(userData);
     setToken(authToken);
     localStorage.setItem('mafia_user', JSON.stringify(userData));
     localStorage.setItem('mafia_token', authToken);
+    if (newRefreshToken) {
+      setRefreshToken(newRefreshToken);
+      localStorage.setItem('mafia_refresh_token', newRefreshToken);
+    }
   };
 
-  const logout = () => {
+  const logout = useCallback(() => {
+    if (token) {
+      fetch(`${API_URL}?path=auth&action=logout`, {
+        method: 'POST',
+        headers: { 'X-Auth-Token': token }
+      }).catch(() => {});
+    }
     setUser(null);
     setToken(null);
+    setRefreshToken(null);
     localStorage.removeItem('mafia_user');
     localStorage.removeItem('mafia_token');
-  };
+    localStorage.removeItem('mafia_refresh_token');
+  }, [token]);
+
+  const refresh = useCallback(async () => {
+    if (!refreshToken) return;
+    try {
+      const response = await fetch(`${API_URL}?path=auth&action=refresh`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ refresh_token: refreshToken })
+      });
+      if (response.status === 401) {
+        logout();
+        return;
+      }
+      const data = await response.json();
+      if (data.token) {
+        setToken(data.token);
+        setRefreshToken(data.refresh_token);
+        localStorage.setItem('mafia_token', data.token);
+        localStorage.setItem('mafia_refresh_token', data.refresh_token);
+      }
+    } catch (error) {
+      console.error('Token refresh failed:', error);
+    }
+  }, [refreshToken, logout]);
+
+  useEffect(() => {
+    if (!token || !refreshToken) return;
+    const expiresAt = tokenExpiresAt(token);
+    if (!expiresAt) return;
+    const timer = setTimeout(refresh, Math.max(0, expiresAt - Date.now() - REFRESH_MARGIN_MS));
+    return () => clearTimeout(timer);
+  }, [token, refreshToken, refresh]);
 
   return (
     <AuthContext.Provider value={{ user, token, login, logout, isAuthenticated: !!user }}>
@@ -1,12 +1,13 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import { useWebSocket } from './useWebSocket';
+import { useAuth } from '@/contexts/AuthContext';
 
 interface Player {
   connection_id: string;
   user_id: number;
   user_name: string;
   ready: boolean;
-  role?: string;
+  connected?: boolean;
   alive?: boolean;
 }
 
@@ -29,14 +30,53 @@ export function useGameRoom(roomId: string, userId: number, userName: string) {
   const [gameState, setGameState] = useState<GameState | null>(null);
   const [chatMessages, setChatMessages] = useState<ChatMessage[]>([]);
   const [myRole, setMyRole] = useState<string | null>(null);
+  const { token } = useAuth();
+  // Токен проверяется сервером один раз при подключении; user_id в сообщениях должен ему соответствовать
+  const wsUrl = token ? `${WS_URL}?token=${encodeURIComponent(token)}` : WS_URL;
+  // Номер последнего полученного события и эпоха комнаты: по ним после обрыва докачиваются пропущенные события
+  const lastSeq = useRef<number | null>(null);
+  const epoch = useRef<string | null>(null);
+  const resume = useRef<() => void>(() => {});
+
+  const handleEvent = useCallback((message: any) => {
+    if (message.epoch && message.epoch !== epoch.current) {
+      epoch.current = message.epoch;
+      lastSeq.current = null;
+    }
+    if (typeof message.seq === 'number') {
+      // Повтор уже применённого события (докачка после переподключения)
+      if (lastSeq.current !== null && message.seq <= lastSeq.current && message.type !== 'players_sync') return;
+      lastSeq.current = message.seq;
+    }
 
-  const handleMessage = useCallback((message: any) => {
     switch (message.type) {
       case 'player_joined':
-        setPlayers(message.players || []);
+        setPlayers((prev) => {
+          const index = prev.findIndex((p) => p.user_id === message.player.user_id);
+          if (index === -1) return [...prev, message.player];
+          const next = [...prev];
+          next[index] = message.player;
+          return next;
+        });
         break;
       case 'player_left':
+        setPlayers((prev) => prev.filter((p) => p.user_id !== message.user_id));
+        break;
+      case 'players_sync':
         setPlayers(message.players || []);
+        // Роли других игроков сервер не присылает, своя приходит только в личной синхронизации
+        if (message.your_role !== undefined) setMyRole(message.your_role);
+        break;
+      case 'player_status':
+        setPlayers((prev) =>
+          prev.map((p) => (p.user_id === message.user_id ? { ...p, connected: message.connected } : p))
+        );
+        break;
+      case 'room_snapshot':
+        setPlayers(message.players || []);
+        setGameState(message.game_state);
+        setChatMessages(message.chat || []);
+        if (message.your_role !== undefined) setMyRole(message.your_role);
         break;
       case 'game_started':
         setGameState(message.game_state);
@@ -49,15 +89,32 @@ export function useGameRoom(roomId: string, userId: number, userName: string) {
         break;
       case 'vote_cast':
         break;
+      case 'resync':
+        // Сервер выбросил устаревшие кадры медленного соединения — пропущенное докачивается через resume
+        resume.current();
+        break;
       case 'new_message':
         setChatMessages((prev) => [...prev, message.message]);
         break;
     }
   }, []);
 
-  const { isConnected, sendMessage } = useWebSocket(WS_URL, {
+  // Сервер склеивает события комнаты за короткое окно в один кадр batch
+  const handleMessage = useCallback((message: any) => {
+    if (message.type === 'batch') {
+      message.events.forEach(handleEvent);
+      return;
+    }
+    handleEvent(message);
+  }, [handleEvent]);
+
+  const { isConnected, sendMessage } = useWebSocket(wsUrl, {
     onMessage: handleMessage,
     onConnect: () => {
+      if (lastSeq.current !== null && epoch.current) {
+        resume.current();
+        return;
+      }
       sendMessage({
         action: 'join_room',
         room_id: roomId,
@@ -67,6 +124,17 @@ export function useGameRoom(roomId: string, userId: number, userName: string) {
     },
   });
 
+  resume.current = () => {
+    sendMessage({
+      action: 'resume',
+      room_id: roomId,
+      user_id: userId,
+      user_name: userName,
+      last_seq: lastSeq.current ?? 0,
+      epoch: epoch.current,
+    });
+  };
+
   const leaveRoom = useCallback(() => {
     sendMessage({ action: 'leave_room' });
   }, [sendMessage]);
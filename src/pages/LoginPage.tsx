@@ -29,7 +29,7 @@ export default function LoginPage() {
         console.log('Backend response:', data);
         
         if (data.user && data.token) {
-          login(data.user, data.token);
+          login(data.user, data.token, data.refresh_token);
           navigate('/lobby');
         } else {
           console.error('Login failed:', data);
@@ -61,7 +61,7 @@ export default function ProfilePage() {
       const data = await response.json();
 
       if (response.ok && data.user) {
-        login(data.user, token || '');
+        login(data.user, data.token || token || '', data.refresh_token);
         setUserProfile(data.user);
         navigate('/lobby');
       } else {
@@ -27,7 +27,7 @@ export default function YandexCallbackPage() {
         const data = await response.json();
         
         if (data.user && data.token) {
-          login(data.user, data.token);
+          login(data.user, data.token, data.refresh_token);
           navigate('/lobby');
         } else {
           console.error('Auth failed:', data);